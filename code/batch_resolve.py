@@ -0,0 +1,6 @@
+#moved to the equation_rendering package (install it with pip install -e ..), run it with python -m equation_rendering.batch_resolve
+#this script is kept so the old command still works
+from equation_rendering.batch_resolve import *
+
+if __name__ == '__main__':
+    main()
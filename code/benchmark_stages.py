@@ -0,0 +1,226 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+
+from equation_rendering.resolve_symbols import (create_merged_boxes, determine_box_level, merge_dots, determine_script_levels,
+                                                isolate_symbols_and_square, resolve_symbols_on_img)
+from equation_rendering.render_equations import render_equation
+from synthetic_equations import synthetic_equation, GLYPHS, PROFILES
+
+"""
+Micro-benchmarks for the stages of resolve_symbols and for render_equation, on synthetic equations (see synthetic_equations.py)
+For every profile and number of symbols, one equation is generated, and every stage is timed on exactly the input it gets in the
+full pipeline. Each stage is run --repeat times for the timing (the fastest run is reported, like timeit does, since the slower
+runs mostly measure other processes on the machine), plus once more under tracemalloc for the
+peak memory (numpy arrays are included, memory allocated inside opencv is not)
+The scaling exponent is the slope of log(time) against log(number of symbols): 1 for linear stages, 2 for quadratic ones
+
+Usage (from the code directory):
+    python benchmark_stages.py                                  # compare to benchmark_baseline.json
+    python benchmark_stages.py --profiles flat fractions --sizes 10 100 1000
+    python benchmark_stages.py --save-baseline                  # store these results as the new baseline
+Exits with an error if a stage got slower (or uses more memory) than the baseline by more than --tolerance
+"""
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+DEFAULT_SIZES = [10, 30, 100, 300, 1000]
+
+STAGES = ['create_merged_boxes', 'determine_box_level', 'merge_dots', 'script_levels', 'isolate_symbols_and_square',
+          'render_equation', 'resolve_symbols_on_img']
+
+def _render_labels(stack_list, seed):
+    """
+    Labels to render: the middle of every stack (a fraction bar or sum sign) is a '-', the other symbols are picked at random
+    """
+    rng = np.random.default_rng(seed)
+    return ['-' if stack == 2 else str(rng.choice(GLYPHS)) for stack in stack_list]
+
+def stage_inputs(img, box_list, seed=0):
+    """
+    Run the pipeline on a synthetic equation step by step, and keep the input of every stage
+    Returns:
+        1) a dictionary of stage name -> (function, arguments)
+        2) the number of symbols that is left after merging the boxes
+    """
+    img_ysize = img.shape[0]
+    inputs = {}
+    #the stages change some of their input lists in place, so every stage runs on a copy
+    def run(stage, function, *args):
+        inputs[stage] = (function, copy.deepcopy(args))
+        return function(*args)
+
+    merged_boxes, merged_box_list = run('create_merged_boxes', create_merged_boxes, box_list, img_ysize)
+    tot_boxes = np.unique(np.concatenate([merged_boxes, merged_box_list]), axis=0)
+    tot_boxes, box_levels, stacked_list = run('determine_box_level', determine_box_level, tot_boxes)
+    tot_boxes, stacked_list, box_levels = run('merge_dots', merge_dots, tot_boxes, stacked_list, box_levels, img_ysize)
+    script_levels = run('script_levels', determine_script_levels, tot_boxes, box_levels)
+    ind_symbols = [img[box[1]:box[3], box[0]:box[2]] for box in tot_boxes]
+    ind_symbols, extend_list = run('isolate_symbols_and_square', isolate_symbols_and_square, tot_boxes, box_levels, ind_symbols)
+    run('render_equation', render_equation, _render_labels(stacked_list, seed), box_levels, stacked_list, script_levels, extend_list)
+    inputs['resolve_symbols_on_img'] = (lambda img: resolve_symbols_on_img(img, plot=False), (img,))
+    return inputs, len(tot_boxes)
+
+def measure(function, args, repeat=5):
+    """
+    Time function(*args) repeat times, on a fresh copy of the arguments every time (some stages change their input lists),
+    and measure the peak memory of one more call with tracemalloc
+    Returns: the fastest time in seconds, and the peak memory in bytes
+    """
+    times = []
+    for r in range(repeat):
+        args_copy = copy.deepcopy(args)
+        t0 = time.perf_counter()
+        function(*args_copy)
+        times.append(time.perf_counter() - t0)
+
+    #separate run, so the overhead of tracemalloc does not end up in the timings
+    args_copy = copy.deepcopy(args)
+    tracemalloc.start()
+    function(*args_copy)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak_bytes
+
+def scaling_exponent(sizes, seconds):
+    """
+    Slope of the least squares fit of log(seconds) against log(size)
+    """
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(seconds, 1e-9)), 1)[0])
+
+def run_benchmarks(profiles, sizes, stages=STAGES, repeat=5, seed=0):
+    """
+    Returns: {profile: {stage: {size: {'seconds': .., 'peak_bytes': .., 'n_boxes': ..}}}}, with the sizes as strings (like in the json file)
+    For resolve_symbols_on_img, the number of symbols it found is stored as 'n_symbols'
+    """
+    results = {profile: {stage: {} for stage in stages} for profile in profiles}
+    for profile in profiles:
+        for size in sizes:
+            img, box_list = synthetic_equation(size, **PROFILES[profile], seed=seed)
+            inputs, n_symbols = stage_inputs(img, box_list, seed=seed)
+            for stage in stages:
+                function, args = inputs[stage]
+                seconds, peak_bytes = measure(function, args, repeat=repeat)
+                results[profile][stage][str(size)] = {'seconds': seconds, 'peak_bytes': peak_bytes, 'n_boxes': len(box_list)}
+            if 'resolve_symbols_on_img' in stages:
+                #the full function only keeps boxes above a fixed fraction of the image area, so on very long equations
+                #it finds fewer symbols than the separate stages get
+                n_found = len(resolve_symbols_on_img(img, plot=False)[0])
+                results[profile]['resolve_symbols_on_img'][str(size)]['n_symbols'] = n_found
+                if n_found != n_symbols:
+                    print('Warning: resolve_symbols_on_img finds %d of the %d symbols in the %s equation with %d symbols'
+                          % (n_found, n_symbols, profile, size))
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=2.0, min_seconds=1e-3, min_bytes=64*1024):
+    """
+    Find all stages that are more than tolerance times slower, or use more than tolerance times as much memory as in the baseline
+    Differences below min_seconds and min_bytes are ignored, those are mostly noise
+    Returns: a list of (profile, stage, size, what, baseline value, current value)
+    """
+    regressions = []
+    for profile, stages in results.items():
+        for stage, sizes in stages.items():
+            for size, current in sizes.items():
+                base = baseline.get(profile, {}).get(stage, {}).get(size)
+                if base is None:
+                    continue
+                for what, min_diff in (('seconds', min_seconds), ('peak_bytes', min_bytes)):
+                    if current[what] > tolerance * base[what] and current[what] - base[what] > min_diff:
+                        regressions.append((profile, stage, size, what, base[what], current[what]))
+    return regressions
+
+def print_results(results, baseline=None):
+    for profile, stages in results.items():
+        sizes = list(next(iter(stages.values())).keys())
+        print('-' * 30)
+        print('Profile: ' + profile + ' (boxes: ' + ', '.join(str(stages[next(iter(stages))][s]['n_boxes']) for s in sizes) + ')\n')
+        print('%-28s' % 'stage' + ''.join('%11s' % (s + ' sym') for s in sizes) + '   scaling' + ('   vs baseline' if baseline else ''))
+        for stage, values in stages.items():
+            seconds = [values[s]['seconds'] for s in sizes]
+            exponent = scaling_exponent([int(s) for s in sizes], seconds)
+            line = '%-28s' % stage + ''.join('%8.2f ms' % (1000*t) for t in seconds)
+            line += '   n^%.2f' % exponent if exponent is not None else '         '
+            base = (baseline or {}).get(profile, {}).get(stage, {}).get(sizes[-1])
+            if base is not None:
+                line += '   %.2fx' % (values[sizes[-1]]['seconds'] / base['seconds'])
+            print(line)
+        print('peak memory at %s symbols: ' % sizes[-1] +
+              ', '.join('%s %.1f MB' % (stage, values[sizes[-1]]['peak_bytes'] / 1e6) for stage, values in stages.items()))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the resolve_symbols stages and render_equation on synthetic equations')
+    parser.add_argument('--profiles', nargs='+', default=['flat', 'mixed', 'fractions'], choices=list(PROFILES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help='numbers of symbols per equation')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs per stage, the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results in the baseline file, instead of comparing to it')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='report stages that are this many times slower than the baseline')
+    parser.add_argument('--output', default=None, help='also write the results to this json file')
+    parser.add_argument('--plot', default=None, help='save the scaling curves to this image file (needs matplotlib)')
+    args = parser.parse_args()
+
+    #single threaded, like the worker processes of the batch jobs
+    cv2.setNumThreads(1)
+    results = run_benchmarks(args.profiles, args.sizes, stages=args.stages, repeat=args.repeat, seed=args.seed)
+    report = {'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                       'machine': platform.machine(), 'processor': platform.processor(), 'repeat': args.repeat, 'seed': args.seed},
+              'results': results}
+
+    baseline = None
+    if not args.save_baseline and os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.plot:
+        plot_scaling(results, args.plot)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        print('Saved the baseline to', args.baseline)
+        return
+
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+        print('-' * 30)
+        for profile, stage, size, what, base, current in regressions:
+            print('REGRESSION %s / %s / %s symbols: %s %.4g -> %.4g (%.2fx)' % (profile, stage, size, what, base, current, current / base))
+        if regressions:
+            sys.exit('%d stages are slower than the baseline' % len(regressions))
+        print('No regressions against', args.baseline)
+
+def plot_scaling(results, plot_file):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, len(results), figsize=(6 * len(results), 5), squeeze=False)
+    for ax, (profile, stages) in zip(axes[0], results.items()):
+        for stage, values in stages.items():
+            sizes = [int(s) for s in values]
+            ax.loglog(sizes, [v['seconds'] for v in values.values()], 'o-', label=stage)
+        ax.set_title(profile)
+        ax.set_xlabel('number of symbols')
+        ax.set_ylabel('seconds')
+    axes[0][0].legend(fontsize=8)
+    fig.tight_layout()
+    fig.savefig(plot_file)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import itertools
+import os
+import sys
+
+import numpy as np
+import cv2
+
+from equation_rendering.resolve_symbols import load_grayscale_image, resolve_symbols_on_img, normalize_resolution
+from equation_rendering.batch_resolve import list_images
+
+"""
+Pick the target symbol height and tolerance of resolve_symbols.normalize_resolution without the model or the labels:
+every image is enlarged by each of the scales (like a photo taken closer up), and the symbol boxes found on the enlarged copy,
+with and without normalize_resolution, are compared to the boxes found on the original image (F1 score of the boxes that overlap
+with an IoU of more than 0.5, after mapping them back to the original image)
+A setting is only safe if it never does worse than not normalizing, on any image and scale (shrinking an image that is already
+at the resolution the pre-processing is tuned for breaks its symbols up differently). Of the safe settings, the one with the highest
+mean F1 is recommended, but only for targets of at least --min-target pixels: the F1 score only looks at the boxes, not at the symbol
+images the model gets, so below the symbol height the threshold block and blur were tuned on (about 80 pixels) matching boxes say little
+about whether the symbols are still classified the same. Whether a setting keeps the accuracy of the full pipeline is checked with evaluate_pipeline.py --normalize-parity
+
+Usage (from the code directory):
+    python calibrate_normalization.py
+    python calibrate_normalization.py ../img_data/handwritten/ --targets 64 80 96 --tolerances 1.0 1.1 1.25 --scales 1 1.5 2 3
+"""
+
+DEFAULT_SOURCES = [os.path.join('..', 'img_data', 'handwritten')]
+
+def box_f1(boxes, ref_boxes, min_iou=0.5):
+    """
+    F1 score of (n,4) boxes against (m,4) reference boxes, matching each box to at most one reference box with an IoU above min_iou,
+    greedily from the highest IoU down
+    """
+    boxes, ref_boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4), np.asarray(ref_boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0 or len(ref_boxes) == 0:
+        return float(len(boxes) == len(ref_boxes))
+    x1 = np.maximum(boxes[:,None,0], ref_boxes[None,:,0])
+    y1 = np.maximum(boxes[:,None,1], ref_boxes[None,:,1])
+    x2 = np.minimum(boxes[:,None,2], ref_boxes[None,:,2])
+    y2 = np.minimum(boxes[:,None,3], ref_boxes[None,:,3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:,2] - boxes[:,0]) * (boxes[:,3] - boxes[:,1])
+    ref_area = (ref_boxes[:,2] - ref_boxes[:,0]) * (ref_boxes[:,3] - ref_boxes[:,1])
+    iou = inter / np.maximum(area[:,None] + ref_area[None,:] - inter, 1)
+
+    n_matched = 0
+    while iou.max() > min_iou:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        iou[i,:] = 0
+        iou[:,j] = 0
+        n_matched += 1
+    return 2 * n_matched / (len(boxes) + len(ref_boxes))
+
+def scaled_boxes(img, scale, setting=None):
+    """
+    Symbol boxes found on img enlarged by scale, mapped back to img. setting is None to resolve the enlarged image as it is,
+    or a (target symbol height, tolerance) tuple to normalize_resolution it first
+    """
+    if scale != 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    normalize_scale = 1.0
+    if setting is not None:
+        img, normalize_scale = normalize_resolution(img, symbol_height=setting[0], tolerance=setting[1])
+    box_list = resolve_symbols_on_img(img, plot=False, return_boxes=True)[5]
+    return np.asarray(box_list, dtype=np.float64) / (normalize_scale * scale)
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate the target symbol height and tolerance of normalize_resolution on enlarged copies of images')
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES, help='image directories, glob patterns or manifest files')
+    parser.add_argument('--targets', nargs='+', type=int, default=[64, 72, 80, 88, 96, 112])
+    parser.add_argument('--tolerances', nargs='+', type=float, default=[1.0, 1.1, 1.25, 1.5])
+    parser.add_argument('--min-target', type=int, default=80, help='only recommend targets of at least this many pixels')
+    parser.add_argument('--scales', nargs='+', type=float, default=[1.0, 1.1, 1.3, 1.6, 2.0, 2.5, 3.0])
+    args = parser.parse_args()
+
+    #single threaded, like the worker processes of the batch jobs
+    cv2.setNumThreads(1)
+    images = [(img_file, load_grayscale_image(img_file)) for source in args.sources for img_file in list_images(source)]
+    if not images:
+        sys.exit('no images found in ' + ', '.join(args.sources))
+
+    ref_boxes = [resolve_symbols_on_img(img, plot=False, return_boxes=True)[5] for _, img in images]
+    def scores(setting):
+        return np.array([[box_f1(scaled_boxes(img, scale, setting), ref) for scale in args.scales] for (_, img), ref in zip(images, ref_boxes)])
+
+    off = scores(None)
+    print('%-22s %s %7s %7s' % ('setting', ' '.join('%5.2fx' % scale for scale in args.scales), 'mean', 'worse'))
+    print('%-22s %s %7.3f' % ('not normalized', ' '.join('%6.3f' % v for v in off.mean(axis=0)), off.mean()))
+    safe = []
+    for setting in itertools.product(args.targets, args.tolerances):
+        f1 = scores(setting)
+        #cases (image and scale) where normalizing finds boxes further from those on the original image than not normalizing
+        n_worse = int(np.sum(f1 < off - 1e-9))
+        print('%-22s %s %7.3f %7d' % ('%d px, tolerance %.2f' % setting, ' '.join('%6.3f' % v for v in f1.mean(axis=0)), f1.mean(), n_worse))
+        if n_worse == 0 and setting[0] >= args.min_target:
+            safe.append((f1.mean(), setting))
+
+    print('-' * 30)
+    if not safe:
+        sys.exit('every setting of at least %d pixels does worse than not normalizing on some image and scale' % args.min_target)
+    best_f1, (target, tolerance) = max(safe)
+    print('Recommended: %d pixels with a tolerance of %.2f (mean F1 %.3f, never worse than not normalizing on %d images x %d scales)'
+          % (target, tolerance, best_f1, len(images), len(args.scales)))
+
+if __name__ == '__main__':
+    main()
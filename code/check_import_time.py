@@ -0,0 +1,103 @@
+import argparse
+import os
+import subprocess
+import sys
+
+"""
+Check the import time of the modules that short-lived processes (batch workers, the CLI scripts, the api server) start with,
+and check that none of them pulls in a heavy dependency at import time. tensorflow, matplotlib etc. should only be imported
+by the function that needs them, the first time it runs (eg. model_registry.load_keras_model, symbol_overlay.plot_symbol_boxes)
+Every module is imported in a fresh python process with -X importtime, so nothing is cached from an earlier import,
+and the fastest of a few runs is compared to the budget
+
+Usage (from the code directory):
+    python check_import_time.py
+    python check_import_time.py --repeat 5 --scale 2
+Exits with an error if a module is over its budget, or imports one of HEAVY_MODULES
+"""
+
+#import time budget in seconds for each module, including numpy and opencv (together about 0.15 s on a laptop)
+IMPORT_BUDGETS = {
+    'equation_rendering': 0.05,
+    'equation_rendering.config': 0.05,
+    'equation_rendering.pipeline_metrics': 0.1,
+    'equation_rendering.box_positions': 0.3,
+    'equation_rendering.box_relations': 0.3,
+    'equation_rendering.render_equations': 0.3,
+    'equation_rendering.result_cache': 0.3,
+    'equation_rendering.model_registry': 0.3,
+    'equation_rendering.model_backends': 0.3,
+    'equation_rendering.resolve_symbols': 0.5,
+    'equation_rendering.strip_processing': 0.5,
+    'equation_rendering.make_predictions': 0.5,
+    'equation_rendering.symbol_overlay': 0.5,
+    'equation_rendering.inference_server': 0.5,
+    'equation_rendering.pipeline': 0.5,
+    'equation_rendering.batch_resolve': 0.5,
+    'equation_rendering.equation_pipeline': 0.6,
+    'equation_rendering.page_pipeline': 0.6,
+    'export_model': 0.6,
+    'evaluate_pipeline': 0.8,
+}
+
+#packages that take seconds to import, and are only needed by some stages
+HEAVY_MODULES = ('tensorflow', 'keras', 'tf2onnx', 'onnxruntime', 'tflite_runtime', 'matplotlib', 'PIL', 'streamlit', 'pandas')
+
+#the scripts in this directory, and the top of the repository with the equation_rendering package
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(CODE_DIR)
+
+def measure_import(module, path=CODE_DIR):
+    """
+    Import module in a fresh python process, with path as working directory
+    The package is found at the top of the repository, even if it is not installed
+    Returns: the import time in seconds, and the set of all modules that were imported along with it
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (REPO_DIR, os.environ.get('PYTHONPATH')) if p))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=path, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError('could not import ' + module + ':\n' + result.stderr.strip().splitlines()[-1])
+
+    seconds = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.strip() == module and not name.startswith('  '):
+            seconds = int(cumulative) / 1e6
+        imported.add(name.strip().split('.')[0])
+    return seconds, imported
+
+def check_import_times(path=CODE_DIR, budgets=IMPORT_BUDGETS, repeat=3, scale=1.0):
+    """
+    Measure every module in budgets, and compare it to its budget (times scale, for slower machines)
+    Returns: a list of (module, seconds, budget, heavy modules it imports) and whether all modules are within budget
+    """
+    rows = []
+    ok = True
+    for module, budget in budgets.items():
+        runs = [measure_import(module, path) for _ in range(repeat)]
+        seconds = min(s for s, _ in runs)
+        heavy = sorted(set.union(*(imported for _, imported in runs)) & set(HEAVY_MODULES))
+        rows.append((module, seconds, budget * scale, heavy))
+        ok = ok and seconds <= budget * scale and len(heavy) == 0
+    return rows, ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of the pipeline modules against a budget')
+    parser.add_argument('--repeat', type=int, default=3, help='import every module this many times, and keep the fastest')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply all budgets by this factor (eg. 2 on a slow CI machine)')
+    args = parser.parse_args()
+
+    rows, ok = check_import_times(repeat=args.repeat, scale=args.scale)
+    print('%-38s %9s %9s  %s' % ('module', 'import', 'budget', 'heavy imports'))
+    for module, seconds, budget, heavy in rows:
+        flag = '' if seconds <= budget and len(heavy) == 0 else '  <-- over budget' if len(heavy) == 0 else '  <-- heavy import'
+        print('%-38s %7.0f ms %6.0f ms  %s%s' % (module, 1000*seconds, 1000*budget, ', '.join(heavy) or '-', flag))
+    if not ok:
+        sys.exit('some modules are over their import budget')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from equation_rendering.inference_server import InferenceServer
+from equation_rendering.result_cache import ResultCache
+from equation_rendering.page_pipeline import process_page, find_equation_lines
+from equation_rendering.pipeline_metrics import PipelineMetrics
+from synthetic_equations import synthetic_equation, PROFILES
+
+"""
+Checks for failure modes of the pipeline that the example images don't run into: cancelled and timed out requests to the
+inference server, broken files in the result cache, the metrics of the worker processes in page mode, paper edges and shadows on pages, and so on
+Every check builds its own input, and needs neither the model nor the example images
+
+Usage (from the code directory):
+    python check_robustness.py
+    python check_robustness.py --checks inference_server_cancel
+Exits with an error if any of the checks fails
+"""
+
+class _SlowModel:
+    """
+    Stand-in for the classifier: waits until it is released, then predicts 3 classes for every image
+    """
+    def __init__(self):
+        self.release = threading.Event()
+
+    def predict(self, img_batch, batch_size=None, verbose=0):
+        self.release.wait()
+        return np.zeros((len(img_batch), 3))
+
+def _synthetic_page(positions, size=(900, 1400)):
+    """
+    White page with a synthetic equation (see synthetic_equations.py) of 8 symbols at each (y, x) position
+    """
+    page = np.full(size, 255, dtype=np.uint8)
+    for seed, (y, x) in enumerate(positions):
+        eq_img, _ = synthetic_equation(8, **PROFILES['mixed'], seed=seed)
+        h, w = eq_img.shape
+        page[y:y+h, x:x+w] = np.minimum(page[y:y+h, x:x+w], eq_img)
+    return page
+
+class _ZeroModel:
+    """
+    Stand-in for the classifier: predicts the first class for every image
+    """
+    def predict(self, img_batch, batch_size=None, verbose=0):
+        return np.zeros((len(img_batch), 3))
+
+def check_inference_server_cancel():
+    """
+    A request that is cancelled (or times out) while it waits in the queue is skipped, and the server still answers the next one
+    """
+    model = _SlowModel()
+    server = InferenceServer(model, max_batch_size=1, max_wait=0, timeout=0.2).start()
+    try:
+        #the first request keeps the worker busy, so the second one is still queued when it is cancelled or times out
+        busy = server.submit(np.zeros((1, 4)))
+        cancelled = server.submit(np.zeros((1, 4)))
+        assert cancelled.cancel(), 'a queued request could not be cancelled'
+        try:
+            server.predict(np.zeros((1, 4)))
+            raise AssertionError('predict did not time out while the worker was busy')
+        except TimeoutError:
+            pass
+        model.release.set()
+
+        assert busy.result(timeout=5).shape == (1, 3)
+        assert server.predict(np.zeros((2, 4))).shape == (2, 3), 'the server did not answer after a cancelled request'
+        assert server._thread.is_alive(), 'the worker thread died'
+    finally:
+        model.release.set()
+        server.stop()
+
+def check_result_cache_files():
+    """
+    Files in the result cache directory that are not proper entries are misses (and are removed), and a cache directory that
+    other users can write to is refused
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, 'results')
+        cache = ResultCache(cache_dir=cache_dir)
+        assert os.stat(cache_dir).st_mode & 0o077 == 0, 'the cache directory is readable by other users'
+
+        broken_entries = ['not json', json.dumps([1, 2]), json.dumps({'result': {'eqstr': 'x'}}),
+                          json.dumps({'stored_at': 'yesterday', 'result': {'eqstr': 'x'}}), json.dumps({'stored_at': 1e18})]
+        for i, data in enumerate(broken_entries):
+            key = 'broken%d' % i
+            with open(os.path.join(cache_dir, key + '.json'), 'w') as f:
+                f.write(data)
+            assert cache.get(key) is None, 'broken entry %r was served' % data
+            assert not os.path.exists(os.path.join(cache_dir, key + '.json')), 'broken entry %r was not removed' % data
+
+        cache.put('good', {'eqstr': 'x'})
+        assert ResultCache(cache_dir=cache_dir).get('good') == {'eqstr': 'x'}
+
+        if hasattr(os, 'getuid'):
+            shared_dir = os.path.join(tmp_dir, 'shared')
+            os.mkdir(shared_dir)
+            os.chmod(shared_dir, 0o777)
+            try:
+                ResultCache(cache_dir=shared_dir)
+                raise AssertionError('a cache directory that everyone can write to was accepted')
+            except ValueError:
+                pass
+
+def check_page_metrics_workers():
+    """
+    In page mode, the timings and counters of resolving the equations are recorded the same with worker processes as without
+    """
+    page = _synthetic_page([(60, 60), (60, 800), (350, 60), (650, 300)])
+    recorded = []
+    for workers in (1, 2):
+        metrics = PipelineMetrics()
+        process_page(page, _ZeroModel(), ['x', 'y', 'z'], workers=workers, metrics=metrics)
+        metrics_dict = metrics.as_dict()
+        recorded.append(({name: values['calls'] for name, values in metrics_dict['stages'].items()}, metrics_dict['counters']))
+    assert recorded[0][0] == recorded[1][0], 'different stages with workers: %r and %r' % (recorded[0][0], recorded[1][0])
+    assert recorded[0][1] == recorded[1][1], 'different counters with workers: %r and %r' % (recorded[0][1], recorded[1][1])
+
+def check_page_artefacts():
+    """
+    In page mode, paper edges, frames, shadows and rules on the page are not taken for equations: the same equations are found as on
+    the page without them, both on a scan (black and white) and on a photo (gray paper, on a dark desk)
+    """
+    page = _synthetic_page([(120, 150), (120, 800), (420, 150), (650, 400)])
+    rng = np.random.default_rng(0)
+    photo = np.clip(page * 0.85 + 20 + rng.normal(0, 3, page.shape), 0, 255)
+    #the thin parts of some symbols are lost in the adaptive threshold of photos, so the photo has its own reference
+    references = {'scan': find_equation_lines(page)[0], 'photo': find_equation_lines(photo.astype(np.uint8))[0]}
+    assert len(references['scan']) == len(references['photo']) == 4, 'the equations on the page without artefacts are not found'
+
+    pages = {}
+    pages['shadow band'] = page.copy()
+    pages['shadow band'][330:400, 100:1300] = 150
+    pages['gradient smudge'] = page.copy()
+    pages['gradient smudge'][560:620, 20:700] = np.linspace(120, 250, 680).astype(np.uint8)
+    pages['rule'] = page.copy()
+    pages['rule'][600:604, 30:1370] = 0
+    pages['frame'] = page.copy()
+    pages['frame'][20:880, 20:1380] = np.minimum(pages['frame'][20:880, 20:1380], np.pad(np.full((854, 1354), 255, dtype=np.uint8), 3))
+    pages['photo on a desk'] = np.full(page.shape, 30.0)
+    pages['photo on a desk'][25:870, 35:1365] = (photo * np.linspace(1.0, 0.4, page.shape[1]))[25:870, 35:1365]
+
+    for name, img in pages.items():
+        line_boxes, _, symbol_height = find_equation_lines(np.clip(img, 0, 255).astype(np.uint8))
+        reference = references['photo' if name.startswith('photo') else 'scan']
+        assert len(line_boxes) == len(reference), '%s: %d equations found instead of %d: %r' % (name, len(line_boxes), len(reference), line_boxes)
+        for line_box, ref_box in zip(line_boxes, reference):
+            assert np.abs(np.subtract(line_box, ref_box)).max() < 0.25 * symbol_height, '%s: found %r instead of %r' % (name, line_box, ref_box)
+
+CHECKS = {
+    'inference_server_cancel': check_inference_server_cancel,
+    'result_cache_files': check_result_cache_files,
+    'page_metrics_workers': check_page_metrics_workers,
+    'page_artefacts': check_page_artefacts,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Check how the pipeline handles inputs and events the example images do not cover')
+    parser.add_argument('--checks', nargs='+', default=list(CHECKS), choices=list(CHECKS))
+    args = parser.parse_args()
+
+    failed = []
+    for name in args.checks:
+        t0 = time.perf_counter()
+        try:
+            CHECKS[name]()
+            print('%-40s ok      %.2f s' % (name, time.perf_counter() - t0))
+        except Exception:
+            print('%-40s FAILED' % name)
+            traceback.print_exc()
+            failed.append(name)
+    if failed:
+        sys.exit('%d of %d checks failed: %s' % (len(failed), len(args.checks), ', '.join(failed)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+from equation_rendering.resolve_symbols import (load_grayscale_image, threshold_image, resolve_symbols_on_img, BOX_BACKENDS,
+                                                contour_boxes, component_boxes)
+from equation_rendering.batch_resolve import list_images
+from synthetic_equations import synthetic_equation, PROFILES
+
+"""
+Compare the two ways resolve_symbols_on_img can find the symbol boxes (see resolve_symbols.BOX_BACKENDS):
+findContours with a boundingRect for every contour ('contours'), and a single connectedComponentsWithStats call ('components')
+For every image, both backends are timed on the same thresholded image, and checked to give the same boxes, in the same order,
+and the same output of the full resolve_symbols_on_img
+
+Usage (from the code directory):
+    python compare_box_backends.py                                   # the example equations and the handwritten photos
+    python compare_box_backends.py ../img_data/full_equations/ --synthetic 100 1000 --repeat 10
+Exits with an error if the backends give different boxes on any image
+"""
+
+DEFAULT_SOURCES = [os.path.join('..', 'img_data', 'full_equations'), os.path.join('..', 'img_data', 'handwritten')]
+
+def best_time(function, arg, repeat=5):
+    """
+    Fastest of repeat calls of function(arg), in seconds
+    """
+    times = []
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        function(arg)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def resolve_outputs_equal(output_a, output_b):
+    """
+    Whether two resolve_symbols_on_img outputs (with return_boxes=True) are the same
+    """
+    symbols_a, symbols_b = output_a[0], output_b[0]
+    return (len(symbols_a) == len(symbols_b) and all(np.array_equal(a, b) for a, b in zip(symbols_a, symbols_b))
+            and output_a[1:5] == output_b[1:5] and np.array_equal(output_a[5], output_b[5]))
+
+def compare_image(img, repeat=5):
+    """
+    Returns a dictionary with the time of both backends on the thresholded image, the number of boxes, and whether the boxes
+    and the full resolve_symbols_on_img output are the same
+    """
+    thresh = threshold_image(img)
+    boxes_contours, _ = contour_boxes(thresh)
+    boxes_components, _ = component_boxes(thresh)
+    outputs = [resolve_symbols_on_img(img, plot=False, return_boxes=True, box_backend=backend) for backend in BOX_BACKENDS]
+    return {'contours_seconds': best_time(contour_boxes, thresh, repeat), 'components_seconds': best_time(component_boxes, thresh, repeat),
+            'n_boxes': len(boxes_contours),
+            'same_boxes': np.array_equal(boxes_contours, boxes_components),
+            'same_box_set': set(map(tuple, boxes_contours.tolist())) == set(map(tuple, boxes_components.tolist())),
+            'same_output': resolve_outputs_equal(*outputs)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the findContours and connectedComponentsWithStats box backends of resolve_symbols_on_img')
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES, help='image directories, glob patterns or manifest files')
+    parser.add_argument('--synthetic', nargs='*', type=int, default=[], help='also compare on synthetic equations with these numbers of symbols')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs per backend, the fastest is reported')
+    args = parser.parse_args()
+
+    #single threaded, like the worker processes of the batch jobs
+    cv2.setNumThreads(1)
+    images = [(img_file, img_file) for source in args.sources for img_file in list_images(source)]
+    images += [('synthetic %s %d' % (profile, size), synthetic_equation(size, **PROFILES[profile], seed=size)[0])
+               for size in args.synthetic for profile in PROFILES]
+    if not images:
+        sys.exit('no images found in ' + ', '.join(args.sources))
+
+    results = []
+    print('%-50s %8s %14s %14s %8s' % ('image', 'boxes', 'contours', 'components', 'speedup'))
+    for name, img in images:
+        result = compare_image(load_grayscale_image(img), repeat=args.repeat)
+        results.append(result)
+        flag = '' if result['same_boxes'] and result['same_output'] else \
+               '   DIFFERENT ' + ('ORDER' if result['same_box_set'] else 'BOXES') + ('' if result['same_output'] else ', DIFFERENT OUTPUT')
+        print('%-50s %8d %11.2f ms %11.2f ms %7.2fx%s' % (name[-50:], result['n_boxes'], 1000 * result['contours_seconds'],
+              1000 * result['components_seconds'], result['contours_seconds'] / result['components_seconds'], flag))
+
+    contours_total = sum(result['contours_seconds'] for result in results)
+    components_total = sum(result['components_seconds'] for result in results)
+    n_different = sum(not (result['same_boxes'] and result['same_output']) for result in results)
+    print('-' * 30)
+    print('Total: contours %.1f ms, components %.1f ms (%.2fx faster)' % (1000 * contours_total, 1000 * components_total,
+                                                                         contours_total / components_total))
+    if n_different:
+        sys.exit('the backends differ on %d of the %d images' % (n_different, len(results)))
+    print('Same boxes and output on all %d images' % len(results))
+
+if __name__ == '__main__':
+    main()
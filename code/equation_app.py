@@ -1,49 +1,15 @@
 import streamlit as st
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import smart_resize
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
 
-from resolve_symbols import resolve_symbols_on_img
-from render_equations import render_equation
+from equation_rendering import process_image, default_model_file, default_class_file
+from equation_rendering.symbol_overlay import draw_symbol_boxes_png
+from equation_rendering.make_predictions import get_prediction_cache
+from equation_rendering.pipeline_metrics import metrics_from_env
+from equation_rendering.result_cache import get_result_cache
+from equation_rendering.model_registry import get_model, get_class_labels
 
 st.set_page_config(layout="centered")
 
 
-#Model Prediction step
-
-def make_predictions(symbol_list, extend_list):
-
-    pred_list = []
-    pred_symbol_list, pred_idx_list = [], []
-    for i, symbol in enumerate(symbol_list):
-
-        rgb_im = np.zeros((symbol.shape[0], symbol.shape[1], 3))
-        for j in range(3):
-            rgb_im[:,:,j] = symbol.astype('uint8')
-        resize_img = smart_resize(rgb_im, (100,100))
-        resize_img = np.expand_dims(resize_img, axis=0)
-        prediction = efficientnet_model.predict(resize_img, verbose=0)
-    
-        pred_dic = {k[6:]:v for v,k in sorted(zip(prediction[0], class_labels))[-4:]}
-        y_classes = prediction.argmax(axis=-1)
-        pred_idx_list.append(y_classes)
-        label = class_labels[y_classes[0]][6:]
-        
-        #check if a symbol extends over multiple adjacent symbols
-        #if it's not a square root, check if the square root is predicted at a lower probability
-        #if so, just use that
-        if extend_list[i] >  1 and label != '\\sqrt':
-            if '\\sqrt' in pred_dic.keys(): 
-                label = '\\sqrt'
-        
-            
-        pred_symbol_list.append(label)
-        pred_list.append(pred_dic)
-    return pred_symbol_list
-
-
 st.markdown("""
 <style>
 .big-font {
@@ -63,30 +29,37 @@ st.sidebar.markdown("You can **change** the values to change the *chart*.")
 
 #user input of an image
 input_img = st.file_uploader(label='bla',type=['png', 'jpg', 'jpeg'], label_visibility='hidden')
+#shrinking full size phone photos to the working resolution first is a lot faster, but it changes which symbols are found and
+#its effect on the accuracy is not measured yet (see evaluate_pipeline.py --normalize-parity), so it is opt-in
+normalize = st.checkbox('Shrink large photos first (faster, experimental)', value=False)
+
+#class labels (read once per process, see model_registry.py)
+class_labels = get_class_labels(default_class_file())
 
-#class labels
-with open('../CNN_model/class_names.txt', 'r') as f:
-    lines = f.readlines()
-class_labels = [label.split(' ')[-1][:-1] for label in lines]
+#load model (loaded and warmed up once per process, shared by all sessions and reruns)
+efficientnet_model = get_model(default_model_file())
 
-#load model
-efficientnet_model = tf.keras.models.load_model("../CNN_model/efficientnet_model_lw.h5")
+#cache of earlier results, so re-uploading an image does not run the pipeline again
+result_cache = get_result_cache()
 
 #call preprocessing
 if input_img is not None:
 
-    image = Image.open(input_img)
-    image.save("img.png")
-    symbs, levels, stack, script_levels, extend_list, fig, ax = resolve_symbols_on_img("img.png",  plot=True)
-    ax.set_frame_on(False)
-    ax.tick_params(axis='both',which='both',bottom=False, left=False, labelbottom=False, labelleft=False) 
-        
-    pred_symbol_list = make_predictions(symbs, extend_list)
-    eqstr = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+    #optional per-stage timings, turned on with the EQUATION_PIPELINE_METRICS environment variable
+    metrics = metrics_from_env()
+
+    #decode the upload straight from memory, so concurrent sessions don't share a file on disk
+    img_bytes = input_img.getvalue()
+    #reuse the result if this exact image was rendered before with the same model, and look up symbols that were classified before
+    #(eg. in an earlier upload) instead of passing them to the model
+    img, result = process_image(img_bytes, efficientnet_model, class_labels, model_file=default_model_file(), result_cache=result_cache,
+                                prediction_cache=get_prediction_cache(default_model_file()), metrics=metrics, normalize=normalize)
+    metrics.emit()
+    eqstr = result['eqstr']
 
     st.subheader("Predicted symbols, order, and position:")
 
-    st.pyplot(fig)
+    st.image(draw_symbol_boxes_png(img, result['boxes'], result['stack'], result['script_levels']))
     
     
     st.markdown('<p class="big-font"> Predicted equation: </p>', unsafe_allow_html=True)
@@ -94,3 +67,7 @@ if input_img is not None:
     st.text("Raw string: " +  eqstr.replace(" ",""))
 
     st.write("Rendered in LaTeX:  " r'' + eqstr)
+
+    if metrics.enabled:
+        with st.expander("Pipeline timings"):
+            st.json(metrics.as_dict())
@@ -0,0 +1,517 @@
+import argparse
+import json
+import logging
+import os
+import re
+import string
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import numpy as np
+import cv2
+import jellyfish
+
+from equation_rendering.resolve_symbols import resolve_symbols_on_img, load_grayscale_image, normalize_resolution, WORKING_SYMBOL_HEIGHT
+from equation_rendering.render_equations import render_equation
+from equation_rendering.make_predictions import prepare_symbol_batch, decode_predictions
+from equation_rendering.pipeline_metrics import PipelineMetrics, NULL_METRICS, metrics_from_spec
+from equation_rendering.model_registry import get_model, get_class_labels
+from equation_rendering.config import default_model_file, default_class_file
+
+"""
+Evaluate the full pipeline (resolve symbols -> model prediction -> equation rendering) on the held-out equation images
+and compare the rendered equations to the labels in eq_labels.txt, using the normalized Damerau-Levenshtein distance
+See equation_rendering.ipynb for more explanation on the metric
+
+Usage (from the code directory):
+    python evaluate_pipeline.py --workers 4 --output eval_results.jsonl
+With --parity-with, an exported model (see export_model.py) is compared to the keras model on the same symbols, eg.:
+    python evaluate_pipeline.py --model ../CNN_model/efficientnet_model_lw_int8.tflite --parity-with ../CNN_model/efficientnet_model_lw.h5
+With --normalize-parity, the symbols found with resolve_symbols_on_img(normalize=True) are compared to those found on the original
+image, classified by the same model. --scale enlarges the equation images first, like a photo taken closer up, eg.:
+    python evaluate_pipeline.py --normalize-parity --scale 2.5 --max-accuracy-drop 0
+normalize=True should only become the default for uploads once this shows no drop in perfect predictions at any scale
+With --metrics (eg. --metrics log,prometheus:eval.prom), the per-stage timings and counters are added to each result,
+and the totals over all equations are sent to the given sinks (see equation_rendering/pipeline_metrics.py)
+"""
+
+def reprocess_eq(input_eq):
+    """
+    Reprocess the equation label, so that the comparison with the predicted equation label can be made
+    Because I'm using the demerau-levenshtein distance to compare the predicted and actual equation strings
+    it's important that the two are formatted as similarly as possible
+    Input:
+        equation string, read in from eq_labels.txct
+    Returns:
+        reprocessed equation string
+    """
+
+    #remove all whitespace and math mode markings ($), and make sure brackets are always labeled the same way
+    input_eq = input_eq.replace('$', '').replace('\\left(','(').replace('\\right)',')').replace('\\)',')').replace('\\(','(').replace('\\lt','<').replace('\\gt','>')
+
+    #add curly brackets around superscripts and subscriptt
+    br_ct = 0
+    idx_l = []
+
+    #first count how many instances of ^ and _ NOT followed by a curly bracket there are
+    ss_list = ['^', '_']
+    for i,s in enumerate(input_eq[:-1]):
+        if s in ss_list and input_eq[i+1] != '{':
+            idx_l.append(i+1)
+            br_ct += 1
+
+    #then rewrite the string piece by piece, adding curly opening and closing brackets where necessary
+    input_eq_n = ''
+    p = 0
+    at_end = False
+    for i in range(br_ct):
+
+        input_eq_n += input_eq[p:idx_l[i]] + '{' + input_eq[idx_l[i]] + '}'
+        if idx_l[i] == len(input_eq) - 1:
+            at_end = True
+        if at_end == False:
+            p = idx_l[i]+1
+
+    if at_end == False:
+        input_eq_n += input_eq[p:]
+    return input_eq_n
+
+def relabel_equations(input_eq1, input_eq2):
+    """
+    Given two equation strings, split them by several types of delimiters at the same time,
+    then find the number of unique entries in the total of two lists, and then relabel each unique entry and put it back into string type
+    This so I can calculate the demerau-levenshtein distance without eg \\theta counting for more than b or a
+    Returns:
+        two new equation strings, where each single character is replaced by an ASCII character
+    """
+    #ascii symbols
+    charlist = string.printable
+
+    #split both equations according to a bunch of delimiters
+    delimiters = ['{','}','^','_','-','\\+','\\(','\\)','=','1','2','3','4','5','6','7','8','9','0',' ']
+    del_str = '|'.join(delimiters)
+    #wrapping the delimiter string in parenthesis to make sure the delimiters are kept in as well
+    input_eq1_l = re.split('(' + del_str + ')', input_eq1.lower())
+    input_eq2_l = re.split('(' + del_str + ')', input_eq2.lower())
+
+    #remove whitespace entries
+    input_eq1_l = [i for i in input_eq1_l if i != '' and i!= ' ']
+    input_eq2_l = [i for i in input_eq2_l if i != '' and i!= ' ']
+
+    #find the set of unique symbols of the combined lists
+    n_unique  = list(set(input_eq1_l + input_eq2_l))
+
+    #turn into arrays for easier indexing
+    input_eq1_l, input_eq2_l = np.array(input_eq1_l), np.array(input_eq2_l)
+
+    for i,val in enumerate(list(n_unique)):
+        if val in input_eq1_l:
+            input_eq1_l[input_eq1_l == val] = charlist[i]
+        if val in input_eq2_l:
+            input_eq2_l[input_eq2_l == val] = charlist[i]
+
+    relabeled_eq1 = ''.join(list(input_eq1_l))
+    relabeled_eq2 = ''.join(list(input_eq2_l))
+
+    return relabeled_eq1, relabeled_eq2
+
+def equation_distance(eqstr, label):
+    """
+    Normalized Damerau-Levenshtein distance between a rendered equation string and the equation label
+    """
+    #remove math mode $ to compare equations
+    predicted_eq = eqstr.replace('$', '')
+
+    #reprocess actual equation label so that formatting is consistent
+    actual_eq = reprocess_eq(label)
+
+    #relabel equations with single ascii characters, so that if eg. my model predicts '6' instead of '\\theta', the string distance is not overly penalized
+    pred_eq_relabeled, actual_eq_relabeled = relabel_equations(predicted_eq, actual_eq)
+
+    return jellyfish.damerau_levenshtein_distance(pred_eq_relabeled, actual_eq_relabeled)/len(actual_eq_relabeled)
+
+def equation_category(label):
+    """
+    'complex' for equations with a lim or sum sign, 'trig' for equations with trigonometric functions, and 'simple' otherwise
+    """
+    if '\\sum' in label or '\\lim' in label:
+        return 'complex'
+    elif '\\cos' in label or '\\tan' in label or '\\sin' in label:
+        return 'trig'
+    return 'simple'
+
+def read_eq_labels(eq_dir):
+    """
+    Read eq_labels.txt, and pair each label with its full equation image
+    Returns: a list of (equation number, image file, label) for all labels that have an image
+    """
+    eq_list = []
+    with open(os.path.join(eq_dir, 'eq_labels.txt')) as f:
+        for line in f:
+            if '::' not in line:
+                continue
+            eq_id, label = line.split('::', 1)
+            eq_nr = int(eq_id.split()[-1])
+            img_file = os.path.join(eq_dir, 'full_eq_' + str(eq_nr) + '.png')
+            if os.path.isfile(img_file):
+                eq_list.append((eq_nr, img_file, label.strip()))
+    return eq_list
+
+#the model is loaded once per worker process
+_worker = {}
+
+def init_worker(model_file, class_file, batch_size, metrics_spec=None, prediction_cache=True):
+    from equation_rendering.make_predictions import get_prediction_cache
+
+    _worker['model'] = get_model(model_file)
+    _worker['class_labels'] = get_class_labels(class_file)
+    _worker['batch_size'] = batch_size
+    _worker['metrics_spec'] = metrics_spec
+    #identical symbols in different equations are only classified once per worker
+    _worker['prediction_cache'] = get_prediction_cache(model_file) if prediction_cache else None
+
+def evaluate_equation(eq):
+    """
+    Run the full pipeline on one equation image, and compare the result to the label
+    """
+    from equation_rendering.make_predictions import make_prediction
+
+    eq_nr, img_file, label = eq
+    result = {'eq': eq_nr, 'image': img_file, 'label': label, 'category': equation_category(label)}
+
+    #the metrics are only recorded here, the main process sends them to the sinks
+    metrics = NULL_METRICS
+    if _worker.get('metrics_spec'):
+        metrics = PipelineMetrics(trace_allocations='alloc' in _worker['metrics_spec'].split(','))
+
+    t0 = time.perf_counter()
+    try:
+        symbs, levels, stack, script_levels, extend_list = resolve_symbols_on_img(img_file, plot=False, metrics=metrics)
+        pred_symbol_list = make_prediction(symbs, extend_list, _worker['model'], _worker['class_labels'], batch_size=_worker['batch_size'], metrics=metrics,
+                                           prediction_cache=_worker['prediction_cache'])
+        with metrics.stage('render_equation'):
+            eqstr = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+        dl_dist = equation_distance(eqstr, label)
+        result.update({'predicted': eqstr, 'n_symbols': len(symbs), 'dl_dist': dl_dist, 'exact': dl_dist == 0, 'error': None})
+    except Exception as e:
+        result.update({'predicted': None, 'n_symbols': None, 'dl_dist': None, 'exact': False, 'error': repr(e)})
+    result['seconds'] = time.perf_counter() - t0
+    if metrics.enabled:
+        result['metrics'] = metrics.as_dict()
+    return result
+
+def print_dist_info(input_dists, label):
+    print('-' * 30)
+    print('Predictions for: ' +  label +' \n')
+    i_a = np.array(input_dists)
+    if len(i_a) == 0:
+        print('no equations')
+        return
+    p_0 = len(i_a[i_a == 0])/len(i_a)
+    p_10 = len(i_a[i_a < 0.1])/len(i_a)
+    p_25 = len(i_a[i_a < 0.25])/len(i_a)
+    p_50 = len(i_a[i_a < 0.5])/len(i_a)
+
+    print('number of equations:', len(i_a))
+    print('perfect predictions:', round(p_0, 4))
+    print('normalized dist <0.1', round(p_10,4))
+    print('normalized dist <0.25', round(p_25,4))
+    print('normalized dist <0.5', round(p_50,4))
+    print('mean normalized dist', round(i_a.mean(), 4))
+    return
+
+def write_results(result_iter, output_file, metrics):
+    """
+    Write the results to output_file, one per line, as they come in, and add their metrics to the totals
+    Returns: the list of results
+    """
+    results = []
+    t0 = time.perf_counter()
+    with open(output_file, 'w') as f:
+        for i, result in enumerate(result_iter):
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            results.append(result)
+            if 'metrics' in result:
+                metrics.update(result['metrics'])
+            if (i+1) % 100 == 0:
+                print(i+1, 'equations done, %.2f equations/s' % ((i+1) / (time.perf_counter() - t0)))
+    return results
+
+def run_evaluation(eq_list, model_file, class_file, output_file, workers=1, batch_size=32, chunksize=4, metrics_spec=None, prediction_cache=True):
+    """
+    Evaluate all equations in eq_list over a pool of worker processes, writing one result per line to output_file as they come in
+    Every worker runs the full pipeline with its own copy of the model
+    If metrics_spec is given, the metrics of all equations are added up and sent to the sinks in metrics_spec at the end
+    Returns: the list of results, and the PipelineMetrics object with the totals
+    """
+    metrics = metrics_from_spec(metrics_spec)
+    t0 = time.perf_counter()
+
+    #spawn fresh processes, tensorflow does not cope well with forked processes
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'), initializer=init_worker,
+                             initargs=(model_file, class_file, batch_size, metrics_spec, prediction_cache)) as executor:
+        results = write_results(executor.map(evaluate_equation, eq_list, chunksize=chunksize), output_file, metrics)
+
+    elapsed = time.perf_counter() - t0
+    print('Evaluated %d equations in %.1f s (%.2f equations/s, %d workers)' % (len(results), elapsed, len(results)/elapsed, workers))
+    metrics.emit()
+    return results, metrics
+
+def run_pipelined_evaluation(eq_list, model_file, class_file, output_file, workers=1, batch_size=32, metrics_spec=None, prediction_cache=True):
+    """
+    Same as run_evaluation, but with equation_pipeline.EquationPipeline: the worker processes only resolve the symbols,
+    and a single copy of the model in this process classifies the symbols of several equations at once, while the workers continue
+    Only the totals of the inference and render stages are recorded in the metrics
+    """
+    from equation_rendering.equation_pipeline import EquationPipeline
+    from equation_rendering.make_predictions import get_prediction_cache
+
+    metrics = metrics_from_spec(metrics_spec)
+    pipeline = EquationPipeline(get_model(model_file), get_class_labels(class_file), resolve_workers=workers, batch_size=batch_size,
+                                prediction_cache=get_prediction_cache(model_file) if prediction_cache else None, metrics=metrics)
+    t0 = time.perf_counter()
+
+    def score(pipeline_results):
+        for (eq_nr, img_file, label), pipeline_result in zip(eq_list, pipeline_results):
+            result = {'eq': eq_nr, 'image': img_file, 'label': label, 'category': equation_category(label)}
+            result.update({'predicted': None, 'n_symbols': None, 'dl_dist': None, 'exact': False, 'error': pipeline_result['error']})
+            if pipeline_result['error'] is None:
+                dl_dist = equation_distance(pipeline_result['equation'], label)
+                result.update({'predicted': pipeline_result['equation'], 'n_symbols': len(pipeline_result['predictions']),
+                               'dl_dist': dl_dist, 'exact': dl_dist == 0})
+            yield result
+
+    results = write_results(score(pipeline.run([img_file for _, img_file, _ in eq_list])), output_file, metrics)
+
+    elapsed = time.perf_counter() - t0
+    print('Evaluated %d equations in %.1f s (%.2f equations/s, %d resolve workers, pipelined)' % (len(results), elapsed, len(results)/elapsed, workers))
+    metrics.emit()
+    return results, metrics
+
+def _classify(model, img_batch, extend_list, class_labels, batch_size):
+    if len(img_batch) == 0:
+        return np.zeros((0, len(class_labels)), dtype=np.float32), []
+    predictions = np.asarray(model.predict(img_batch, batch_size=batch_size, verbose=0), dtype=np.float32)
+    pred_symbol_list, _ = decode_predictions(predictions, extend_list, class_labels)
+    return predictions, pred_symbol_list
+
+def run_parity_check(eq_list, model_file, reference_file, class_file, output_file, workers=1, batch_size=32):
+    """
+    Compare a model (eg. an exported TFLite or ONNX model) to a reference model (the keras model) on exactly the same symbols:
+    the symbols are resolved once, both models classify them, and both rendered equations are compared to the label
+    Returns: the list of results, and a dictionary with the agreement between the two models (see print_parity_info)
+    """
+    from equation_rendering.batch_resolve import iter_resolved
+
+    model, reference = get_model(model_file), get_model(reference_file)
+    class_labels = get_class_labels(class_file)
+    summary = {'symbols': 0, 'symbols_agree': 0, 'max_prob_diff': 0.0, 'sum_prob_diff': 0.0, 'equations_differ': 0}
+
+    def compare(resolved):
+        for (eq_nr, img_file, label), (i, image, output, error) in zip(eq_list, resolved):
+            result = {'eq': eq_nr, 'image': img_file, 'label': label, 'category': equation_category(label), 'error': error}
+            if error is None:
+                symbs, levels, stack, script_levels, extend_list = output
+                img_batch = prepare_symbol_batch(symbs)
+                predictions, pred_symbol_list = _classify(model, img_batch, extend_list, class_labels, batch_size)
+                ref_predictions, ref_symbol_list = _classify(reference, img_batch, extend_list, class_labels, batch_size)
+                prob_diff = np.abs(predictions - ref_predictions)
+
+                summary['symbols'] += len(symbs)
+                summary['symbols_agree'] += sum(p == r for p, r in zip(pred_symbol_list, ref_symbol_list))
+                summary['max_prob_diff'] = max(summary['max_prob_diff'], float(prob_diff.max(initial=0)))
+                summary['sum_prob_diff'] += float(prob_diff.max(axis=-1).sum())
+                try:
+                    for prefix, symbol_list in (('', pred_symbol_list), ('reference_', ref_symbol_list)):
+                        eqstr = render_equation(symbol_list, levels, stack, script_levels, extend_list)
+                        dl_dist = equation_distance(eqstr, label)
+                        result.update({prefix + 'predicted': eqstr, prefix + 'dl_dist': dl_dist, prefix + 'exact': dl_dist == 0})
+                    result['n_symbols'] = len(symbs)
+                    summary['equations_differ'] += result['predicted'] != result['reference_predicted']
+                except Exception as e:
+                    result['error'] = repr(e)
+            yield result
+
+    t0 = time.perf_counter()
+    resolved = iter_resolved([img_file for _, img_file, _ in eq_list], workers=workers, ordered=True)
+    results = write_results(compare(resolved), output_file, NULL_METRICS)
+    print('Compared %d equations in %.1f s' % (len(results), time.perf_counter() - t0))
+
+    ok = [r for r in results if r['error'] is None]
+    summary['equations'] = len(ok)
+    summary['symbol_agreement'] = summary['symbols_agree'] / max(summary['symbols'], 1)
+    summary['mean_max_prob_diff'] = summary.pop('sum_prob_diff') / max(summary['symbols'], 1)
+    summary['exact'] = float(np.mean([r['exact'] for r in ok])) if ok else 0.0
+    summary['reference_exact'] = float(np.mean([r['reference_exact'] for r in ok])) if ok else 0.0
+    summary['exact_drop'] = summary['reference_exact'] - summary['exact']
+    return results, summary
+
+def resolve_normalized(task):
+    """
+    Resolve the symbols of one equation image, enlarged by scale, both as it is and after normalize_resolution
+    Returns: both outputs of resolve_symbols_on_img, the scale normalize_resolution applied, and the error if there was one
+    """
+    img_file, scale, symbol_height, tolerance = task
+    try:
+        img = load_grayscale_image(img_file)
+        if scale != 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        output = resolve_symbols_on_img(img, plot=False)
+        normalized_img, normalize_scale = normalize_resolution(img, symbol_height=symbol_height, tolerance=tolerance)
+        normalized_output = output if normalize_scale == 1.0 else resolve_symbols_on_img(normalized_img, plot=False)
+        return output, normalized_output, normalize_scale, None
+    except Exception as e:
+        return None, None, None, repr(e)
+
+def run_normalize_parity_check(eq_list, model_file, class_file, output_file, workers=1, batch_size=32, scale=1.0,
+                               symbol_height=WORKING_SYMBOL_HEIGHT, tolerance=1.1):
+    """
+    Measure what normalize_resolution does to the accuracy: every equation image (enlarged by scale) is resolved as it is and after
+    shrinking it to symbol_height (see resolve_symbols.normalize_resolution), the same model classifies the symbols of both,
+    and both rendered equations are compared to the label. The results on the original image are stored as reference_*
+    Returns: the list of results, and a dictionary with the agreement between the two (see print_parity_info)
+    """
+    model = get_model(model_file)
+    class_labels = get_class_labels(class_file)
+    summary = {'symbols': 0, 'reference_symbols': 0, 'equations_shrunk': 0, 'equations_differ': 0}
+
+    def compare(resolved):
+        for (eq_nr, img_file, label), (output, normalized_output, normalize_scale, error) in zip(eq_list, resolved):
+            result = {'eq': eq_nr, 'image': img_file, 'label': label, 'category': equation_category(label), 'scale': scale,
+                      'normalize_scale': normalize_scale, 'error': error}
+            if error is None:
+                try:
+                    for prefix, (symbs, levels, stack, script_levels, extend_list) in (('', normalized_output), ('reference_', output)):
+                        _, symbol_list = _classify(model, prepare_symbol_batch(symbs), extend_list, class_labels, batch_size)
+                        eqstr = render_equation(symbol_list, levels, stack, script_levels, extend_list)
+                        dl_dist = equation_distance(eqstr, label)
+                        result.update({prefix + 'predicted': eqstr, prefix + 'n_symbols': len(symbs), prefix + 'dl_dist': dl_dist,
+                                       prefix + 'exact': dl_dist == 0})
+                    summary['symbols'] += result['n_symbols']
+                    summary['reference_symbols'] += result['reference_n_symbols']
+                    summary['equations_shrunk'] += normalize_scale != 1.0
+                    summary['equations_differ'] += result['predicted'] != result['reference_predicted']
+                except Exception as e:
+                    result['error'] = repr(e)
+            yield result
+
+    t0 = time.perf_counter()
+    tasks = [(img_file, scale, symbol_height, tolerance) for _, img_file, _ in eq_list]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as executor:
+        results = write_results(compare(executor.map(resolve_normalized, tasks, chunksize=4)), output_file, NULL_METRICS)
+    print('Compared %d equations in %.1f s' % (len(results), time.perf_counter() - t0))
+
+    ok = [r for r in results if r['error'] is None]
+    summary['equations'] = len(ok)
+    summary['exact'] = float(np.mean([r['exact'] for r in ok])) if ok else 0.0
+    summary['reference_exact'] = float(np.mean([r['reference_exact'] for r in ok])) if ok else 0.0
+    summary['exact_drop'] = summary['reference_exact'] - summary['exact']
+    return results, summary
+
+def print_normalize_parity_info(summary, scale, symbol_height, tolerance):
+    print('-' * 30)
+    print('Parity of normalize_resolution (to %d pixels, tolerance %.2f) on images enlarged %.2fx \n' % (symbol_height, tolerance, scale))
+    print('equations shrunk:', summary['equations_shrunk'], 'of', summary['equations'])
+    print('symbols found: %d (original image %d)' % (summary['symbols'], summary['reference_symbols']))
+    print('equations rendered differently:', summary['equations_differ'], 'of', summary['equations'])
+    print('perfect predictions: %.4f (original image %.4f)' % (summary['exact'], summary['reference_exact']))
+
+def print_parity_info(summary, model_file, reference_file):
+    print('-' * 30)
+    print('Parity of ' + model_file + ' with ' + reference_file + ' \n')
+    print('symbols compared:', summary['symbols'])
+    print('same top-1 label:', round(summary['symbol_agreement'], 4))
+    print('max probability difference:', round(summary['max_prob_diff'], 4))
+    print('mean max probability difference per symbol:', round(summary['mean_max_prob_diff'], 4))
+    print('equations rendered differently:', summary['equations_differ'], 'of', summary['equations'])
+    print('perfect predictions: %.4f (reference %.4f)' % (summary['exact'], summary['reference_exact']))
+
+def print_stage_info(metrics):
+    """
+    Print the total time spent in each stage of the pipeline (summed over all worker processes), and the counters
+    """
+    stages = metrics.as_dict()['stages']
+    tot_seconds = sum(values['seconds'] for values in stages.values())
+    print('-' * 30)
+    print('Time per stage (summed over workers) \n')
+    for name, values in sorted(stages.items(), key=lambda kv: -kv[1]['seconds']):
+        print('%-28s %9.2f s  %5.1f%%  %6d calls' % (name, values['seconds'], 100*values['seconds']/tot_seconds, values['calls']))
+    for name, value in metrics.as_dict()['counters'].items():
+        print(name + ':', value)
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate the full equation rendering pipeline on the held-out equation images')
+    parser.add_argument('--eq-dir', default='../img_data/full_equations/', help='directory with the full_eq_*.png images and eq_labels.txt')
+    parser.add_argument('--model', default=default_model_file())
+    parser.add_argument('--class-names', default=default_class_file())
+    parser.add_argument('--output', default='eval_results.jsonl', help='per-equation results, as .jsonl (or .parquet, which needs pandas)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=32, help='maximum number of symbols per model.predict batch')
+    parser.add_argument('--limit', type=int, default=None, help='only evaluate the first N equations')
+    parser.add_argument('--no-prediction-cache', action='store_true', help='pass every symbol to the model, even if an identical symbol was classified before')
+    parser.add_argument('--pipelined', action='store_true', help='only resolve symbols in the workers, and classify the symbols of several equations at once in this process')
+    parser.add_argument('--metrics', default=None, help="record per-stage timings, and send the totals to these sinks (eg. 'log,json:metrics.jsonl,prometheus:eval.prom')")
+    parser.add_argument('--parity-with', default=None, metavar='REFERENCE_MODEL',
+                        help='compare --model (eg. an exported .tflite or .onnx model) to this reference model on the same symbols')
+    parser.add_argument('--max-accuracy-drop', type=float, default=None,
+                        help='with --parity-with or --normalize-parity, exit with an error if the fraction of perfect predictions drops by more than this')
+    parser.add_argument('--normalize-parity', action='store_true',
+                        help='compare the symbols found with resolve_symbols_on_img(normalize=True) to those on the original image')
+    parser.add_argument('--scale', type=float, default=1.0, help='with --normalize-parity, enlarge the equation images by this factor first')
+    parser.add_argument('--working-height', type=int, default=WORKING_SYMBOL_HEIGHT,
+                        help='with --normalize-parity, the symbol height normalize_resolution shrinks to')
+    parser.add_argument('--tolerance', type=float, default=1.1,
+                        help='with --normalize-parity, only shrink images with symbols more than this many times too high')
+    args = parser.parse_args()
+    if args.metrics:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    eq_list = read_eq_labels(args.eq_dir)[:args.limit]
+
+    jsonl_file = args.output if not args.output.endswith('.parquet') else args.output[:-len('.parquet')] + '.jsonl'
+    if args.normalize_parity:
+        results, parity = run_normalize_parity_check(eq_list, args.model, args.class_names, jsonl_file, workers=args.workers,
+                                                     batch_size=args.batch_size, scale=args.scale, symbol_height=args.working_height,
+                                                     tolerance=args.tolerance)
+        ok = [r for r in results if r['error'] is None]
+        print_dist_info([r['dl_dist'] for r in ok], 'normalize=True')
+        print_dist_info([r['reference_dl_dist'] for r in ok], 'original image')
+        print_normalize_parity_info(parity, args.scale, args.working_height, args.tolerance)
+        if args.max_accuracy_drop is not None and parity['exact_drop'] > args.max_accuracy_drop:
+            sys.exit('perfect predictions dropped by %.4f, more than the allowed %.4f' % (parity['exact_drop'], args.max_accuracy_drop))
+        return
+
+    if args.parity_with:
+        results, parity = run_parity_check(eq_list, args.model, args.parity_with, args.class_names, jsonl_file, workers=args.workers,
+                                           batch_size=args.batch_size)
+        ok = [r for r in results if r['error'] is None]
+        print_dist_info([r['dl_dist'] for r in ok], args.model)
+        print_dist_info([r['reference_dl_dist'] for r in ok], args.parity_with)
+        print_parity_info(parity, args.model, args.parity_with)
+        if args.max_accuracy_drop is not None and parity['exact_drop'] > args.max_accuracy_drop:
+            sys.exit('perfect predictions dropped by %.4f, more than the allowed %.4f' % (parity['exact_drop'], args.max_accuracy_drop))
+        return
+
+    evaluate = run_pipelined_evaluation if args.pipelined else run_evaluation
+    results, metrics = evaluate(eq_list, args.model, args.class_names, jsonl_file, workers=args.workers, batch_size=args.batch_size,
+                                metrics_spec=args.metrics, prediction_cache=not args.no_prediction_cache)
+    if args.output.endswith('.parquet'):
+        import pandas as pd
+        pd.DataFrame(results).to_parquet(args.output)
+
+    n_errors = sum(1 for r in results if r['error'] is not None)
+    if n_errors > 0:
+        print(n_errors, 'equations failed, see', jsonl_file)
+
+    dists = [r for r in results if r['error'] is None]
+    print_dist_info([r['dl_dist'] for r in dists], 'All eqs')
+    for category, label in [('simple', 'Simple eqs'), ('trig', 'Trigonometric eqs'), ('complex', 'Complex eqs')]:
+        print_dist_info([r['dl_dist'] for r in dists if r['category'] == category], label)
+    if metrics.enabled:
+        print_stage_info(metrics)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import os
+import tempfile
+
+from equation_rendering.batch_resolve import list_images
+from equation_rendering.resolve_symbols import resolve_symbols_on_img
+from equation_rendering.make_predictions import prepare_symbol_batch, MODEL_INPUT_SIZE
+from equation_rendering.model_registry import load_keras_model
+from equation_rendering.config import default_model_file
+
+"""
+Export the keras symbol classifier to TFLite or ONNX, so the apps and batch jobs can run it without loading tensorflow
+(see equation_rendering/model_backends.py; get_model loads the exported file based on its extension)
+
+Quantization options:
+    none     - float32 weights and activations, same predictions as the keras model up to rounding
+    dynamic  - int8 weights, float activations. About 4x smaller, no calibration data needed
+    int8     - int8 weights and activations, calibrated on symbol crops cut out of equation images by the preprocessing step,
+               so the activation ranges match what the model sees in the pipeline
+The inputs and outputs stay float32 in all cases, so the exported models take the same batches from prepare_symbol_batch
+
+Needs tensorflow for the conversion, plus tf2onnx and onnxruntime for ONNX. Usage (from the code directory):
+    python export_model.py --format tflite --quantization int8 --calibration ../img_data/full_equations/
+    python export_model.py --format onnx --quantization dynamic
+Check the accuracy of an exported model against the keras model with:
+    python evaluate_pipeline.py --model ../CNN_model/efficientnet_model_lw_int8.tflite --parity-with ../CNN_model/efficientnet_model_lw.h5
+"""
+
+QUANTIZATION_OPTIONS = ('none', 'dynamic', 'int8')
+
+def calibration_symbols(source, n_symbols=500):
+    """
+    Cut the symbols out of the equation images in source (a directory, glob pattern or manifest, see batch_resolve.list_images),
+    until n_symbols symbols are collected
+    Returns: an (n_symbols, 100, 100, 3) float32 batch, like the model gets in the pipeline
+    """
+    symbols = []
+    for img_file in list_images(source):
+        symbs, levels, stack, script_levels, extend_list = resolve_symbols_on_img(img_file, plot=False)
+        symbols += symbs
+        if len(symbols) >= n_symbols:
+            break
+    if len(symbols) == 0:
+        raise ValueError('no symbols found in ' + source + ' to calibrate the quantization with')
+    return prepare_symbol_batch(symbols[:n_symbols])
+
+def export_tflite(model, output_file, quantization='none', calibration_batch=None):
+    """
+    Convert the keras model to a .tflite file, with the given quantization (see QUANTIZATION_OPTIONS)
+    calibration_batch is needed for int8 quantization
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        def representative_dataset():
+            for i in range(len(calibration_batch)):
+                yield [calibration_batch[i:i+1]]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(output_file, 'wb') as f:
+        f.write(converter.convert())
+
+class _CalibrationReader:
+    """
+    Hands the calibration symbols to onnxruntime's static quantization, one batch at a time
+    """
+    def __init__(self, input_name, calibration_batch, batch_size=16):
+        self.input_name = input_name
+        self.calibration_batch = calibration_batch
+        self.batch_size = batch_size
+        self.rewind()
+
+    def get_next(self):
+        if self._pos >= len(self.calibration_batch):
+            return None
+        batch = self.calibration_batch[self._pos:self._pos+self.batch_size]
+        self._pos += self.batch_size
+        return {self.input_name: batch}
+
+    def rewind(self):
+        self._pos = 0
+
+def export_onnx(model, output_file, quantization='none', calibration_batch=None, opset=13):
+    """
+    Convert the keras model to a .onnx file, with the given quantization (see QUANTIZATION_OPTIONS)
+    calibration_batch is needed for int8 quantization
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    input_signature = [tf.TensorSpec((None,) + MODEL_INPUT_SIZE + (3,), tf.float32, name='input')]
+    if quantization == 'none':
+        tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=output_file)
+        return
+
+    from onnxruntime.quantization import quantize_dynamic, quantize_static, QuantType, QuantFormat
+
+    #quantize a float32 export, and only keep the quantized model
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        float_file = os.path.join(tmp_dir, 'float_model.onnx')
+        tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=float_file)
+        if quantization == 'dynamic':
+            quantize_dynamic(float_file, output_file, weight_type=QuantType.QInt8)
+        else:
+            quantize_static(float_file, output_file, _CalibrationReader('input', calibration_batch), quant_format=QuantFormat.QDQ,
+                            activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+
+def default_output_file(model_file, export_format, quantization):
+    base = os.path.splitext(model_file)[0]
+    suffix = '' if quantization == 'none' else '_' + quantization
+    return base + suffix + '.' + export_format
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the keras symbol classifier to TFLite or ONNX, optionally quantized')
+    parser.add_argument('--model', default=default_model_file())
+    parser.add_argument('--format', choices=('tflite', 'onnx'), default='tflite')
+    parser.add_argument('--quantization', choices=QUANTIZATION_OPTIONS, default='none')
+    parser.add_argument('--calibration', default='../img_data/full_equations/',
+                        help='equation images (directory, glob or manifest) to cut the int8 calibration symbols from')
+    parser.add_argument('--calibration-symbols', type=int, default=500, help='number of symbols to calibrate int8 quantization with')
+    parser.add_argument('--output', default=None, help='defaults to the model file name, with the quantization and the new extension')
+    args = parser.parse_args()
+
+    output_file = args.output or default_output_file(args.model, args.format, args.quantization)
+    calibration_batch = None
+    if args.quantization == 'int8':
+        calibration_batch = calibration_symbols(args.calibration, args.calibration_symbols)
+        print('Calibrating with', len(calibration_batch), 'symbols from', args.calibration)
+
+    model = load_keras_model(args.model)
+    export = export_tflite if args.format == 'tflite' else export_onnx
+    export(model, output_file, quantization=args.quantization, calibration_batch=calibration_batch)
+
+    print('Wrote %s (%.1f MB, was %.1f MB)' % (output_file, os.path.getsize(output_file) / 1e6, os.path.getsize(args.model) / 1e6))
+    print('Check the accuracy against the keras model with:')
+    print('    python evaluate_pipeline.py --model %s --parity-with %s' % (output_file, args.model))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import numpy as np
+import cv2
+
+"""
+Generate synthetic equation images, with a controllable number of symbols, fraction nesting, sub/superscript depth and big
+operators with limits (stacks of 3, like a sum sign), for benchmarking the pipeline on inputs of any size (see benchmark_stages.py)
+The symbols are drawn with opencv's Hershey font on a white background, so the images are already black and white, like a
+thresholded scan. The layout is built up recursively: an expression is a row of terms, and a term is a single symbol, a symbol with
+a sub- or superscript expression, a fraction with an expression above and below the bar, or a sum sign with limits
+
+Usage:
+    img, box_list = synthetic_equation(100, **PROFILES['mixed'], seed=0)
+"""
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+#symbols that make up the terms. '=' and 'i' are made of two separate contours, so the box merging step has something to do
+GLYPHS = ['x', 'y', 'a', 'b', 'n', 'k', '2', '3', '4', '+', '=', 'i', '(', ')']
+#the big operator that gets limits above and below it
+OPERATOR = 'E'
+
+#layout parameters for typical kinds of equations
+PROFILES = {
+    'flat': {'fraction_depth': 0, 'script_depth': 0, 'fraction_prob': 0.0, 'script_prob': 0.0, 'limits_prob': 0.0},
+    'scripts': {'fraction_depth': 0, 'script_depth': 2, 'fraction_prob': 0.0, 'script_prob': 0.4, 'limits_prob': 0.0},
+    'fractions': {'fraction_depth': 3, 'script_depth': 0, 'fraction_prob': 0.4, 'script_prob': 0.0, 'limits_prob': 0.0},
+    'mixed': {'fraction_depth': 2, 'script_depth': 1, 'fraction_prob': 0.15, 'script_prob': 0.2, 'limits_prob': 0.05},
+}
+
+def _glyph(label, scale):
+    """
+    Layout of a single symbol: (elements, width, top, bottom), relative to the left end of its baseline
+    An element is ('text', label, x, y, scale) or ('bar', x1, x2, y, scale)
+    """
+    (w, h), base = cv2.getTextSize(label, FONT, scale, _thickness(scale))
+    return [('text', label, 0, 0, scale)], w, -h, base
+
+def _thickness(scale):
+    return max(1, int(round(2 * scale)))
+
+def _shift(layout, dx, dy):
+    elements, width, top, bottom = layout
+    shifted = []
+    for element in elements:
+        if element[0] == 'text':
+            kind, label, x, y, scale = element
+            shifted.append((kind, label, x + dx, y + dy, scale))
+        else:
+            kind, x1, x2, y, scale = element
+            shifted.append((kind, x1 + dx, x2 + dx, y + dy, scale))
+    return shifted, width + dx, top + dy, bottom + dy
+
+def _row(layouts, gap):
+    """
+    Put layouts next to each other on the same baseline
+    """
+    elements, x, top, bottom = [], 0, 0, 0
+    for layout in layouts:
+        shifted, width, l_top, l_bottom = _shift(layout, x, 0)
+        elements += shifted
+        x = width + gap
+        top, bottom = min(top, l_top), max(bottom, l_bottom)
+    return elements, max(x - gap, 0), top, bottom
+
+def _script(n, scale, fraction_depth, script_depth, params, rng):
+    """
+    A symbol with a sub- or superscript expression of n-1 symbols
+    """
+    base = _glyph(rng.choice(GLYPHS[:9]), scale)
+    script = _expression(n - 1, scale * 0.6, 0, script_depth - 1, params, rng)
+    gap = int(0.1 * base[1]) + 1
+    if rng.random() < 0.6:
+        #superscript: the baseline of the script halfway up the symbol
+        dy = int(0.5 * base[2])
+    else:
+        #subscript: the top of the script halfway down the symbol
+        dy = int(0.5 * base[2] * 0.3) - script[2]
+    script = _shift(script, base[1] + gap, dy)
+    return base[0] + script[0], script[1], min(base[2], script[2]), max(base[3], script[3])
+
+def _stacked(top_layout, middle, bottom_layout, gap):
+    """
+    Center top_layout above and bottom_layout below the middle layout
+    """
+    width = max(top_layout[1], middle[1], bottom_layout[1])
+    middle = _shift(middle, (width - middle[1]) // 2, 0)
+    top_layout = _shift(top_layout, (width - top_layout[1]) // 2, middle[2] - gap - top_layout[3])
+    bottom_layout = _shift(bottom_layout, (width - bottom_layout[1]) // 2, middle[3] + gap - bottom_layout[2])
+    return top_layout[0] + middle[0] + bottom_layout[0], width, top_layout[2], bottom_layout[3]
+
+def _fraction(n, scale, fraction_depth, script_depth, params, rng):
+    """
+    A fraction bar with n-1 symbols divided over the numerator and denominator
+    """
+    n_top = int(rng.integers(1, n - 1)) if n > 2 else 1
+    numerator = _expression(n_top, scale, fraction_depth - 1, script_depth, params, rng)
+    denominator = _expression(n - 1 - n_top, scale, fraction_depth - 1, script_depth, params, rng)
+
+    x_height = _glyph('x', scale)[2]
+    pad = int(0.2 * -x_height) + 1
+    width = max(numerator[1], denominator[1]) + 2 * pad
+    axis = int(0.5 * x_height)
+    bar = ([('bar', 0, width, axis, scale)], width, axis - _thickness(scale), axis + _thickness(scale))
+    return _stacked(numerator, bar, denominator, int(0.3 * -x_height) + 2)
+
+def _limits(n, scale, params, rng):
+    """
+    A big operator (like a sum sign) with one limit symbol above it and n-2 below it
+    """
+    operator = _glyph(OPERATOR, scale * 1.5)
+    top_limit = _expression(1, scale * 0.6, 0, 0, params, rng)
+    bottom_limit = _expression(n - 2, scale * 0.6, 0, 0, params, rng)
+    return _stacked(top_limit, operator, bottom_limit, int(0.15 * -operator[2]) + 2)
+
+def _expression(n, scale, fraction_depth, script_depth, params, rng):
+    """
+    A row of terms with n symbols in total
+    """
+    terms = []
+    while n > 0:
+        r = rng.random()
+        if r < params['fraction_prob'] and fraction_depth > 0 and n >= 3:
+            size = int(rng.integers(3, min(n, 3 + 4 * fraction_depth) + 1))
+            terms.append(_fraction(size, scale, fraction_depth, script_depth, params, rng))
+        elif r < params['fraction_prob'] + params['script_prob'] and script_depth > 0 and n >= 2:
+            size = int(rng.integers(2, min(n, 4) + 1))
+            terms.append(_script(size, scale, fraction_depth, script_depth, params, rng))
+        elif r < params['fraction_prob'] + params['script_prob'] + params['limits_prob'] and n >= 3:
+            size = int(rng.integers(3, min(n, 4) + 1))
+            terms.append(_limits(size, scale, params, rng))
+        else:
+            size = 1
+            terms.append(_glyph(rng.choice(GLYPHS), scale))
+        n -= size
+    return _row(terms, int(0.35 * -_glyph('x', scale)[2]) + 2)
+
+def render_layout(layout, margin=20):
+    """
+    Draw a layout on a white uint8 image, with black symbols
+    """
+    elements, width, top, bottom = layout
+    img = np.full((bottom - top + 2 * margin, width + 2 * margin), 255, dtype=np.uint8)
+    x0, y0 = margin, margin - top
+    for element in elements:
+        if element[0] == 'text':
+            kind, label, x, y, scale = element
+            cv2.putText(img, label, (x0 + x, y0 + y), FONT, scale, 0, _thickness(scale), cv2.LINE_8)
+        else:
+            kind, x1, x2, y, scale = element
+            cv2.line(img, (x0 + x1, y0 + y), (x0 + x2, y0 + y), 0, _thickness(scale))
+    return img
+
+def find_box_list(img):
+    """
+    The (n, 4) array of bounding boxes (x1, y1, x2, y2) of all symbol contours on a black on white image,
+    sorted by x1 + y1 like in resolve_symbols_on_img
+    """
+    ctrs, _ = cv2.findContours(255 - img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rects = np.array([cv2.boundingRect(c) for c in ctrs], dtype=np.int32).reshape(-1, 4)
+    rects[:, 2:] += rects[:, :2]
+    return rects[np.argsort(rects[:, 0] + rects[:, 1], kind='stable')]
+
+def synthetic_equation(n_symbols, fraction_depth=1, script_depth=1, fraction_prob=0.15, script_prob=0.2, limits_prob=0.05,
+                       scale=1.5, seed=0):
+    """
+    Generate an equation image with n_symbols symbols (fraction bars included)
+    Input:
+        fraction_depth - how deep fractions can be nested inside the numerator or denominator of other fractions (0 for no fractions)
+        script_depth - how deep sub/superscripts can be nested (0 for no scripts)
+        fraction_prob, script_prob, limits_prob - the probability of each term being a fraction, a symbol with a script,
+            or a sum sign with limits (stacks of 3). The rest of the terms are single symbols
+        scale - font scale of the base level symbols (1.5 is about 35 pixels high)
+        seed - seed of the random generator, the same seed always gives the same image
+    Returns:
+        1) the black on white uint8 image
+        2) the (n, 4) array of symbol bounding boxes (x1, y1, x2, y2). Symbols like '=' have two boxes
+    """
+    rng = np.random.default_rng(seed)
+    params = {'fraction_prob': fraction_prob, 'script_prob': script_prob, 'limits_prob': limits_prob}
+    img = render_layout(_expression(n_symbols, scale, fraction_depth, script_depth, params, rng))
+    return img, find_box_list(img)
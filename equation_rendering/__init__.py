@@ -0,0 +1,54 @@
+"""
+The equation rendering pipeline: resolve the symbols on an image of a handwritten equation, classify them with the CNN,
+and render the equation in LaTeX. The streamlit app, the api server, the notebooks and the scripts in code/ all use this package
+Install it from the top of the repository with:
+    pip install -e .
+
+The stages live in their own modules, and can be used on their own:
+    resolve_symbols   - pre-processing: find, merge and order the symbols on the image
+    make_predictions  - model prediction step (with model_registry, model_backends and inference_server for loading and serving the model)
+    render_equations  - post-processing: turn the predicted symbols into an equation
+    pipeline          - process_image, which runs all three on a single image
+    batch_resolve, equation_pipeline - the same on many images at once
+    page_pipeline     - process_page, which finds all equations on an image of a page (eg. a worksheet) and runs them as one batch
+The functions below can also be imported from the package itself (eg. from equation_rendering import process_image).
+Modules are only imported when one of their functions is first used, so importing the package is cheap
+"""
+
+#version of the package, and of its public functions
+__version__ = '1.0.0'
+
+#bump this whenever a change to the pre- or post-processing changes the output of the pipeline, so old cached results are not reused
+#2: the symbol crops are resized from uint8 straight into the model batch, which can change pixel values by a gray level
+#3: normalize=True shrinks images to symbols of 80 instead of 64 pixels, and only when they are more than 1.1 times too high
+PIPELINE_VERSION = '3'
+
+#public name -> module it lives in
+_PUBLIC_API = {
+    'resolve_symbols_on_img': 'resolve_symbols',
+    'load_grayscale_image': 'resolve_symbols',
+    'ImageDecodeError': 'resolve_symbols',
+    'make_prediction': 'make_predictions',
+    'prepare_symbol_batch': 'make_predictions',
+    'decode_predictions': 'make_predictions',
+    'get_prediction_cache': 'make_predictions',
+    'render_equation': 'render_equations',
+    'get_model': 'model_registry',
+    'get_class_labels': 'model_registry',
+    'get_inference_server': 'inference_server',
+    'process_image': 'pipeline',
+    'EquationPipeline': 'equation_pipeline',
+    'process_page': 'page_pipeline',
+    'find_equation_lines': 'page_pipeline',
+    'default_model_file': 'config',
+    'default_class_file': 'config',
+}
+
+__all__ = ['__version__', 'PIPELINE_VERSION'] + list(_PUBLIC_API)
+
+def __getattr__(name):
+    if name not in _PUBLIC_API:
+        raise AttributeError('module ' + repr(__name__) + ' has no attribute ' + repr(name))
+    import importlib
+    module = importlib.import_module('.' + _PUBLIC_API[name], __name__)
+    return getattr(module, name)
@@ -0,0 +1,194 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing as mp
+
+import cv2
+
+from .resolve_symbols import resolve_symbols_on_img, BOX_BACKENDS
+from .pipeline_metrics import PipelineMetrics, NULL_METRICS
+from .config import default_model_file, default_class_file
+
+"""
+Resolve the symbols on many images at once, spread over a pool of worker processes
+The images can be given as a directory, a glob pattern, or a manifest file with one image path per line
+Results are streamed back as they finish (in input order, if requested), so the model prediction step can start on the first
+images while the rest is still being resolved
+
+Usage:
+    python -m equation_rendering.batch_resolve img_data/full_equations --workers 8 --output resolved.jsonl
+    python -m equation_rendering.batch_resolve "img_data/handwritten/*.jpeg" --predict --output predictions.jsonl
+"""
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+def list_images(source, extensions=IMAGE_EXTENSIONS):
+    """
+    Turn a directory, glob pattern, or manifest file into a sorted list of image files
+    A manifest is a text file with one image path per line (relative paths are relative to the manifest), lines starting with # are skipped
+    """
+    if os.path.isdir(source):
+        files = [os.path.join(source, f) for f in os.listdir(source) if f.lower().endswith(extensions)]
+        return sorted(files)
+    if os.path.isfile(source) and not source.lower().endswith(extensions):
+        manifest_dir = os.path.dirname(source)
+        with open(source) as f:
+            lines = [line.strip() for line in f]
+        return [os.path.join(manifest_dir, line) for line in lines if line and not line.startswith('#')]
+    return sorted(glob.glob(source, recursive=True))
+
+def _init_worker():
+    #every worker is its own process, so opencv should not start extra threads on top of that
+    cv2.setNumThreads(1)
+
+def _resolve_chunk(img_files, return_boxes, strip_height=None, normalize=False, box_backend='contours', record_metrics=False):
+    """
+    Resolve a chunk of images in a worker process
+    Returns a list with, for each image, (image file, resolve_symbols_on_img output, error message, metrics)
+    where metrics is the PipelineMetrics.as_dict() of the image if record_metrics=True, and None otherwise
+    """
+    results = []
+    for img_file in img_files:
+        metrics = PipelineMetrics() if record_metrics else NULL_METRICS
+        try:
+            output = resolve_symbols_on_img(img_file, plot=False, return_boxes=return_boxes, metrics=metrics, strip_height=strip_height,
+                                            normalize=normalize, box_backend=box_backend)
+            results.append((img_file, output, None, metrics.as_dict() if record_metrics else None))
+        except Exception as e:
+            results.append((img_file, None, repr(e), metrics.as_dict() if record_metrics else None))
+    return results
+
+def iter_resolved(img_files, workers=None, chunksize=8, ordered=True, return_boxes=False, strip_height=None, normalize=False,
+                  box_backend='contours', metrics=None):
+    """
+    Resolve the symbols on all images in img_files, with a pool of worker processes
+    Images are sent to the workers in chunks of chunksize images, and at most 4 chunks per worker are in flight at any time,
+    so results that are not consumed yet don't pile up in memory
+    img_files can also contain raw image bytes or arrays, anything resolve_symbols_on_img accepts
+    strip_height, normalize and box_backend are passed on to resolve_symbols_on_img, to process large images (eg. page scans) in strips,
+    to shrink images with large symbols (eg. phone photos) to the working resolution, and to pick how the symbol boxes are found
+    If a pipeline_metrics.PipelineMetrics object is passed as metrics, the workers record the timings and counters of every image,
+    and they are added to it as the results come in
+    Yields for each image:
+        (index in img_files, image, resolve_symbols_on_img output or None, error message or None)
+    If ordered=True, the results come in the same order as img_files, otherwise in the order they finish
+    """
+    workers = workers or os.cpu_count()
+    if metrics is None:
+        metrics = NULL_METRICS
+    chunk_starts = range(0, len(img_files), chunksize)
+    max_in_flight = 4 * workers
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'), initializer=_init_worker) as executor:
+        pending = deque()
+        #index of the first image of each chunk that is in flight
+        chunk_start = {}
+        start_iter = iter(chunk_starts)
+
+        def submit_next():
+            for start in start_iter:
+                future = executor.submit(_resolve_chunk, img_files[start:start+chunksize], return_boxes, strip_height, normalize,
+                                         box_backend, metrics.enabled)
+                chunk_start[future] = start
+                pending.append(future)
+                return True
+            return False
+
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+            chunk_results = future.result()
+            start = chunk_start.pop(future)
+
+            #top up the queue before handing out results, so the workers stay busy
+            submit_next()
+
+            for i, (img_file, output, error, image_metrics) in enumerate(chunk_results):
+                if image_metrics is not None:
+                    metrics.update(image_metrics)
+                yield start + i, img_file, output, error
+
+def resolve_images(img_files, workers=None, chunksize=8, ordered=True, return_boxes=False, on_error='raise', strip_height=None,
+                   normalize=False, box_backend='contours'):
+    """
+    Resolve the symbols on all images in img_files, with a pool of worker processes (see iter_resolved)
+    Yields for each image:
+        (image file, symbols, levels, stack, script_levels, extend_list), plus the (n,4) box array if return_boxes=True
+    If ordered=True, the results come in the same order as img_files, otherwise in the order they finish
+    on_error can be 'raise' (raise a RuntimeError when an image can't be resolved) or 'skip' (log a warning, and skip the image)
+    """
+    for i, img_file, output, error in iter_resolved(img_files, workers=workers, chunksize=chunksize, ordered=ordered, return_boxes=return_boxes,
+                                                    strip_height=strip_height, normalize=normalize, box_backend=box_backend):
+        if error is None:
+            yield (img_file,) + tuple(output)
+        elif on_error == 'raise':
+            raise RuntimeError('could not resolve ' + str(img_file) + ': ' + error)
+        else:
+            logging.warning('skipping %s: %s', img_file, error)
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve the symbols on a directory, glob or manifest of equation images, using all cores')
+    parser.add_argument('source', help='directory, glob pattern (in quotes), or manifest file with one image path per line')
+    parser.add_argument('--output', default='resolved.jsonl', help='one json line per image')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunksize', type=int, default=8, help='number of images sent to a worker at once')
+    parser.add_argument('--unordered', action='store_true', help='write results as soon as they finish, instead of in input order')
+    parser.add_argument('--skip-errors', action='store_true', help='skip images that can not be resolved, instead of stopping')
+    parser.add_argument('--strip-height', type=int, default=None,
+                        help='threshold and find the symbols in horizontal strips of this many rows, to bound the memory use on large page scans')
+    parser.add_argument('--normalize', action='store_true', help='shrink images with large symbols (eg. phone photos) to the working resolution first')
+    parser.add_argument('--box-backend', default='contours', choices=list(BOX_BACKENDS),
+                        help="how the symbol boxes are found: 'components' is a lot faster on noisy scans, 'contours' on clean images")
+    parser.add_argument('--predict', action='store_true', help='also classify the symbols and render the equation, in this process, as images come in')
+    parser.add_argument('--model', default=default_model_file())
+    parser.add_argument('--class-names', default=default_class_file())
+    args = parser.parse_args()
+
+    img_files = list_images(args.source)
+    print('Resolving', len(img_files), 'images with', args.workers, 'workers')
+
+    if args.predict:
+        from .make_predictions import make_prediction, get_prediction_cache
+        from .render_equations import render_equation
+        from .model_registry import get_model, get_class_labels
+        model = get_model(args.model)
+        class_labels = get_class_labels(args.class_names)
+        prediction_cache = get_prediction_cache(args.model)
+
+    t0 = time.perf_counter()
+    n_done, n_symbols = 0, 0
+    results = resolve_images(img_files, workers=args.workers, chunksize=args.chunksize, ordered=not args.unordered,
+                             return_boxes=True, on_error='skip' if args.skip_errors else 'raise', strip_height=args.strip_height,
+                             normalize=args.normalize, box_backend=args.box_backend)
+    with open(args.output, 'w') as f:
+        for img_file, symbs, levels, stack, script_levels, extend_list, boxes in results:
+            record = {'image': img_file, 'n_symbols': len(symbs), 'boxes': boxes.tolist(), 'levels': [int(l) for l in levels],
+                      'stack': [int(s) for s in stack], 'script_levels': [int(s) for s in script_levels], 'extend_list': [int(e) for e in extend_list]}
+            if args.predict:
+                pred_symbol_list = make_prediction(symbs, extend_list, model, class_labels, prediction_cache=prediction_cache)
+                record['predictions'] = pred_symbol_list
+                record['equation'] = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+            f.write(json.dumps(record) + '\n')
+
+            n_done += 1
+            n_symbols += len(symbs)
+            if n_done % 500 == 0:
+                print(n_done, 'images done, %.1f images/s' % (n_done / (time.perf_counter() - t0)))
+
+    elapsed = time.perf_counter() - t0
+    print('Resolved %d images (%d symbols) in %.1f s: %.1f images/s' % (n_done, n_symbols, elapsed, n_done / elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+import numpy as np
+
+class BoxRelations:
+    """
+    Vectorized version of BoxPositions, that compares all boxes in a list with each other at once
+    Every method mirrors the BoxPositions method with the same name, where 'box 1' is the row box and 'box 2' the column box
+    #################
+
+    Constructor function:
+        boxes - list or (n,4) array of box coordinates in the form [x1, y1, x2, y2]
+
+    Class attributes:
+        boxes: (n,4) array of box coordinates
+        x1s, y1s, x2s, y2s: arrays of the respective coordinates for each box
+        xlens, ylens: arrays of the x/y lengths of each box
+        xcs, ycs: arrays of the x/y centers of each box
+
+    Class methods:
+        Each method takes optional rows and cols arguments: index arrays of the box 1's and box 2's to compare.
+        If they are not given, the result is the full (n,n) matrix, with entry [i, j] comparing box i to box j.
+        Otherwise, the result has the broadcast shape of rows and cols
+
+        isSame(self, rows, cols):
+            True/False check whether box1 = box2
+        isInside(self, rows, cols, invert=False):
+            True/False check whether box2 is completely inside box1
+        isBigger(self, len_factor, rows, cols, axis='x'):
+            True/False check whether the bigger of the two boxes is bigger than the smaller box by some factor, along the specified axis (x or y)
+        isPartInside(self, rows, cols)
+            True/False check whether the two boxes overlap at all
+        calc_Overlap(self, rows, cols, axis='x', relative_to='both')
+            calculates how much the boxes overlap, on the specified axis. relative to can be to both boxes, or to the smaller box
+        calc_box_extends(self, rows, cols)
+            calculates how much the second box extends up/downwards from the first box. output in terms of fraction of the ylength
+        calc_ydist(self, rows, cols)
+            the distance between the boxes, calculated as yc_box2 - yc_box1
+        merge_boxes(self, i, j)
+            returns a new box that is the merged version of box i and box j
+        boxExtends(self, rows, cols, direction='left')
+            True/False check whether box2 extends beyond box 1 along the specified directon (top/bottom/left/right)
+    """
+    def __init__(self, boxes):
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+
+        self.x1s = self.boxes[:,0]
+        self.y1s = self.boxes[:,1]
+        self.x2s = self.boxes[:,2]
+        self.y2s = self.boxes[:,3]
+
+        #lengths
+        self.xlens = self.x2s - self.x1s
+        self.ylens = self.y2s - self.y1s
+
+        #centers
+        self.xcs = self.x2s*0.5 + self.x1s*0.5
+        self.ycs = self.y2s*0.5 + self.y1s*0.5
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _pairs(self, rows, cols):
+        """
+        Default to comparing every box with every other box
+        """
+        if rows is None:
+            rows = np.arange(len(self))[:,None]
+        if cols is None:
+            cols = np.arange(len(self))[None,:]
+        return np.asarray(rows), np.asarray(cols)
+
+    def isSame(self, rows=None, cols=None):
+        """
+        Check whether the boxes are the same
+        """
+        i, j = self._pairs(rows, cols)
+        return (self.x1s[i] == self.x1s[j]) & (self.y1s[i] == self.y1s[j]) & (self.x2s[i] == self.x2s[j]) & (self.y2s[i] == self.y2s[j])
+
+    def isInside(self, rows=None, cols=None, invert=False):
+        """
+        Check whether the second box is completely inside the first box. If invert=True, check whether b1 is inside b2
+        """
+        i, j = self._pairs(rows, cols)
+        if invert == False:
+            return (self.y1s[j] >= self.y1s[i]) & (self.y2s[j] <= self.y2s[i]) & (self.x1s[j] >= self.x1s[i]) & (self.x2s[i] > self.x2s[j])
+        else:
+            return (self.y1s[j] <= self.y1s[i]) & (self.y2s[j] >= self.y2s[i]) & (self.x1s[j] <= self.x1s[i]) & (self.x2s[i] < self.x2s[j])
+
+    def isPartInside(self, rows=None, cols=None):
+        """
+        Check whether the second box is partly inside the first box, ie. whether the second box is not completely
+        above, below, to the left or to the right of the first box
+        """
+        i, j = self._pairs(rows, cols)
+        outside_y = (self.y2s[j] < self.y1s[i]) | (self.y1s[j] > self.y2s[i])
+        outside_x = (self.x2s[j] < self.x1s[i]) | (self.x1s[j] > self.x2s[i])
+        return ~(outside_y | outside_x)
+
+    def isBigger(self, len_factor, rows=None, cols=None, axis='x'):
+        """
+        Check whether the bigger box is bigger than the smaller box by some specified factor on the specified axis
+        """
+        i, j = self._pairs(rows, cols)
+        clen = self.xlens if axis == 'x' else self.ylens
+        return np.maximum(clen[i], clen[j]) >= np.minimum(clen[i], clen[j]) * len_factor
+
+    def calc_Overlap(self, rows=None, cols=None, axis='x', relative_to='both'):
+        """
+        Check how much overlap the boxes have along the specified axis
+        """
+        i, j = self._pairs(rows, cols)
+        if axis == 'x':
+            c1s, c2s, clens = self.x1s, self.x2s, self.xlens
+            ext_low = self.boxExtends(i, j, direction='left')
+            ext_high = self.boxExtends(i, j, direction='right')
+        elif axis == 'y':
+            c1s, c2s, clens = self.y1s, self.y2s, self.ylens
+            ext_low = self.boxExtends(i, j, direction='top')
+            ext_high = self.boxExtends(i, j, direction='bottom')
+            #same corrections as in BoxPositions, for boxes that line up at the bottom or top
+            ext_high = np.where(self.y2s[j] == self.y2s[i], ext_low, ext_high)
+            ext_low = np.where(self.y1s[j] == self.y1s[i], ext_high, ext_low)
+
+        abs_overlap = np.minimum(c2s[i], c2s[j]) - np.maximum(c1s[i], c1s[j])
+        if relative_to == 'both': #the overlap wrt to the full distance spanned by both boxes
+            totl = np.maximum(c2s[i], c2s[j]) - np.minimum(c1s[i], c1s[j])
+        elif relative_to == 'smaller': #how much of the smaller box overlaps with the bigger box
+            totl = np.minimum(clens[i], clens[j])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            overlap = abs_overlap/totl
+
+        #if one of the boxes is longer than the other on both sides, the overlap should be 1
+        return np.where(ext_low == ext_high, 1., overlap)
+
+    def calc_box_extends(self, rows=None, cols=None):
+        """
+        Calculate how much box 2 extends upwards or downwards from box 1, whichever direction is the largest
+        """
+        i, j = self._pairs(rows, cols)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            extend_down = (self.y2s[j] - self.y2s[i])/self.ylens[j]
+            extend_up = (self.y1s[i] - self.y1s[j])/self.ylens[j]
+        return np.maximum(extend_down, extend_up)
+
+    def calc_ydist(self, rows=None, cols=None):
+        """
+        Calculate the distance between the box centers in y, as yc_box2 - yc_box1
+        """
+        i, j = self._pairs(rows, cols)
+        return self.ycs[j] - self.ycs[i]
+
+    def merge_boxes(self, i, j):
+        """
+        Take two boxes with coords [x1, y1, x2, y2]
+        and merge them into a box spanning both
+        """
+        new_x1 = min(self.x1s[i], self.x1s[j])
+        new_y1 = min(self.y1s[i], self.y1s[j])
+        new_x2 = max(self.x2s[i], self.x2s[j])
+        new_y2 = max(self.y2s[i], self.y2s[j])
+
+        return int(new_x1), int(new_y1), int(new_x2), int(new_y2)
+
+    def boxExtends(self, rows=None, cols=None, direction='left'):
+        """
+        Check whether box2 extends a certain direction out from of box1
+        """
+        i, j = self._pairs(rows, cols)
+        if direction == 'left':
+            return self.x1s[j] < self.x1s[i]
+        if direction == 'right':
+            return self.x2s[j] > self.x2s[i]
+        if direction == 'top': #y-coords are inverted
+            return self.y1s[j] < self.y1s[i]
+        if direction == 'bottom':
+            return self.y2s[j] > self.y2s[i]
+
+
+class XIntervalIndex:
+    """
+    Sorted index of the x-extents of a list of boxes, to find which boxes overlap in x-coordinates
+    without comparing every box with every other box
+    #################
+
+    Constructor function:
+        boxes - list or (n,4) array of box coordinates in the form [x1, y1, x2, y2]
+
+    Class methods:
+        candidate_pairs(self)
+            returns two index arrays (rows, cols) with all pairs of different boxes whose x-extents overlap (touching counts as overlap),
+            in both directions, sorted by row and then column
+        neighbours(self)
+            returns a list with, for each box, the sorted array of indices of the boxes it overlaps with in x
+    """
+    def __init__(self, boxes):
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self.n_boxes = len(boxes)
+
+        #sort the boxes by x1
+        self.order = np.argsort(boxes[:,0], kind='stable')
+        self.sorted_x1s = boxes[self.order, 0]
+        self.sorted_x2s = boxes[self.order, 2]
+
+    def candidate_pairs(self):
+        #sweep from left to right: in sorted order, box i overlaps with all following boxes that start before box i ends
+        n = self.n_boxes
+        hi = np.searchsorted(self.sorted_x1s, self.sorted_x2s, side='right')
+        counts = np.maximum(hi - np.arange(1, n+1), 0)
+
+        s_rows = np.repeat(np.arange(n), counts)
+        s_cols = s_rows + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        rows = np.concatenate([self.order[s_rows], self.order[s_cols]])
+        cols = np.concatenate([self.order[s_cols], self.order[s_rows]])
+        pair_order = np.lexsort((cols, rows))
+        return rows[pair_order], cols[pair_order]
+
+    def neighbours(self):
+        return group_pairs(*self.candidate_pairs(), self.n_boxes)
+
+
+def group_pairs(rows, cols, n_boxes):
+    """
+    Given index arrays of box pairs, sorted by row, return a list with for each box the array of boxes it is paired with
+    """
+    bounds = np.searchsorted(rows, np.arange(n_boxes+1))
+    return [cols[bounds[i]:bounds[i+1]] for i in range(n_boxes)]
+
+
+def same_box_ids(boxes):
+    """
+    Find which boxes in a list have exactly the same coordinates
+    Returns:
+        1) for each box, the index of the first box with the same coordinates
+        2) for each box, how many boxes with the same coordinates come before it
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    _, first_idx, inverse_idx = np.unique(boxes, axis=0, return_index=True, return_inverse=True)
+    first_same_idx = first_idx[inverse_idx.ravel()]
+
+    order = np.argsort(first_same_idx, kind='stable')
+    n_before = np.empty(len(boxes), dtype=int)
+    n_before[order] = np.arange(len(boxes)) - np.searchsorted(first_same_idx[order], first_same_idx[order])
+    return first_same_idx, n_before
@@ -0,0 +1,25 @@
+import os
+
+"""
+Where to find the model and its class labels
+By default these are the files in the CNN_model directory at the top of the repository, wherever the script that uses them is run from.
+Set the EQUATION_MODEL_FILE and EQUATION_CLASS_FILE environment variables to use other files (eg. an exported .tflite model,
+or when the package is installed outside of the repository)
+"""
+
+MODEL_FILE_ENV_VAR = 'EQUATION_MODEL_FILE'
+CLASS_FILE_ENV_VAR = 'EQUATION_CLASS_FILE'
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'CNN_model')
+
+def default_model_file():
+    """
+    The model file from the EQUATION_MODEL_FILE environment variable, or the keras model in the CNN_model directory
+    """
+    return os.environ.get(MODEL_FILE_ENV_VAR, os.path.join(MODEL_DIR, 'efficientnet_model_lw.h5'))
+
+def default_class_file():
+    """
+    The class labels file from the EQUATION_CLASS_FILE environment variable, or the one in the CNN_model directory
+    """
+    return os.environ.get(CLASS_FILE_ENV_VAR, os.path.join(MODEL_DIR, 'class_names.txt'))
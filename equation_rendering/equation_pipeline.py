@@ -0,0 +1,212 @@
+import queue
+import threading
+import time
+import os
+
+from .batch_resolve import iter_resolved
+from .make_predictions import prepare_symbol_batch, decode_predictions
+from .render_equations import render_equation
+from .pipeline_metrics import NULL_METRICS
+
+"""
+Streaming version of the full pipeline for batch jobs, where the three steps run at the same time instead of one after the other:
+    1) a pool of worker processes resolves the symbols on the images (see batch_resolve.py)
+    2) an inference thread collects the symbols of as many images as fit in a batch, and runs them through the model together
+    3) render threads turn the predictions into equations
+The steps are connected by bounded queues, so a slow step holds back the steps before it instead of letting results pile up in memory
+"""
+
+#marks the end of the stream in the queues between the stages
+_DONE = object()
+
+def _n_symbols(item):
+    i, output, error = item
+    return len(output[0]) if error is None else 0
+
+class EquationPipeline:
+    """
+    Run resolve -> predict -> render on a stream of images, with all stages running concurrently
+    #################
+
+    Constructor function:
+        model - the model to make predictions with (anything with a keras-like predict function, eg. an InferenceServer)
+        class_labels - list of class labels of the model
+        resolve_workers - number of worker processes for the resolve step
+        resolve_chunksize - number of images sent to a resolve worker at once
+        batch_size - number of symbols the inference stage tries to collect before calling the model
+        max_wait - the inference stage calls the model at the latest this many seconds after the first image of a batch came in
+        render_workers - number of threads that render equations
+        queue_size - maximum number of images waiting between two stages
+        prediction_cache - optional make_predictions.PredictionCache in front of the model
+        metrics - optional pipeline_metrics.PipelineMetrics object to record the time spent in inference and rendering
+
+    Class methods:
+        run(self, images, ordered=True)
+            generator that yields a result dictionary for every image (see _result), in input order if ordered=True
+    """
+    def __init__(self, model, class_labels, resolve_workers=None, resolve_chunksize=4, batch_size=64, max_wait=0.05,
+                 render_workers=1, queue_size=32, prediction_cache=None, metrics=None):
+        self.model = model
+        self.class_labels = class_labels
+        self.resolve_workers = resolve_workers or os.cpu_count()
+        self.resolve_chunksize = resolve_chunksize
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.render_workers = render_workers
+        self.queue_size = queue_size
+        self.prediction_cache = prediction_cache
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+
+    def run(self, images, ordered=True):
+        images = list(images)
+        resolved_queue = queue.Queue(self.queue_size)
+        predicted_queue = queue.Queue(self.queue_size)
+        output_queue = queue.Queue(self.queue_size)
+        stop = threading.Event()
+
+        def put(q, item):
+            #block while the next stage is busy, but give up when the consumer has stopped listening
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def guarded(stage, out_q):
+            #send exceptions downstream, so they are raised in the consumer instead of getting lost in a thread
+            def run_stage():
+                try:
+                    stage()
+                except BaseException as e:
+                    put(out_q, e)
+            return run_stage
+
+        def resolve_stage():
+            for i, image, output, error in iter_resolved(images, workers=self.resolve_workers, chunksize=self.resolve_chunksize,
+                                                         ordered=False, return_boxes=True):
+                if stop.is_set():
+                    return
+                put(resolved_queue, (i, output, error))
+            put(resolved_queue, _DONE)
+
+        def inference_stage():
+            end = None
+            while end is None:
+                #wait for the first image, then collect images until the batch is full or the deadline passes
+                item = resolved_queue.get()
+                if item is _DONE or isinstance(item, BaseException):
+                    end = item
+                    break
+                items = [item]
+                n_symbols = _n_symbols(item)
+                deadline = time.monotonic() + self.max_wait
+                while n_symbols < self.batch_size:
+                    try:
+                        item = resolved_queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is _DONE or isinstance(item, BaseException):
+                        end = item
+                        break
+                    items.append(item)
+                    n_symbols += _n_symbols(item)
+
+                self._predict_items(items, put, predicted_queue)
+            put(predicted_queue, end)
+
+        def render_stage():
+            while True:
+                item = predicted_queue.get()
+                if item is _DONE or isinstance(item, BaseException):
+                    #let the other render threads know as well
+                    put(predicted_queue, item)
+                    put(output_queue, item)
+                    return
+                i, output, error, pred_symbol_list = item
+                result = self._result(images[i], output, error, pred_symbol_list)
+                put(output_queue, (i, result))
+
+        threads = [threading.Thread(target=guarded(resolve_stage, resolved_queue), name='pipeline-resolve', daemon=True),
+                   threading.Thread(target=guarded(inference_stage, predicted_queue), name='pipeline-inference', daemon=True)]
+        threads += [threading.Thread(target=guarded(render_stage, output_queue), name='pipeline-render-%d' % i, daemon=True)
+                    for i in range(self.render_workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            n_finished = 0
+            next_i = 0
+            waiting = {}
+            while n_finished < self.render_workers:
+                item = output_queue.get()
+                if item is _DONE:
+                    n_finished += 1
+                    continue
+                if isinstance(item, BaseException):
+                    raise item
+
+                i, result = item
+                if not ordered:
+                    yield result
+                    continue
+                #hold on to results that finished early, until all images before them are done
+                waiting[i] = result
+                while next_i in waiting:
+                    yield waiting.pop(next_i)
+                    next_i += 1
+        finally:
+            stop.set()
+            #unblock the stages, so they can see the stop signal
+            for q in (resolved_queue, predicted_queue, output_queue):
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+
+    def _predict_items(self, items, put, predicted_queue):
+        """
+        Run the symbols of all resolved images in items through the model in one batch, and pass the labels on to the render stage
+        """
+        ok_items = [item for item in items if item[2] is None and len(item[1][0]) > 0]
+        if len(ok_items) > 0:
+            with self.metrics.stage('prepare_symbol_batch'):
+                img_batch = prepare_symbol_batch([symbol for item in ok_items for symbol in item[1][0]])
+            with self.metrics.stage('inference'):
+                if self.prediction_cache is not None:
+                    predictions, n_misses = self.prediction_cache.predict(self.model, img_batch, batch_size=self.batch_size)
+                else:
+                    predictions = self.model.predict(img_batch, batch_size=self.batch_size, verbose=0)
+            self.metrics.count('inference_batches')
+            self.metrics.count('predictions', len(img_batch))
+
+        idx = 0
+        for i, output, error in items:
+            pred_symbol_list = None
+            if error is None:
+                n = len(output[0])
+                with self.metrics.stage('decode_predictions'):
+                    pred_symbol_list, _ = decode_predictions(predictions[idx:idx+n], output[4], self.class_labels) if n > 0 else ([], [])
+                idx += n
+            put(predicted_queue, (i, output, error, pred_symbol_list))
+
+    def _result(self, image, output, error, pred_symbol_list):
+        """
+        The result dictionary for a single image, with the image as it was passed to run (if it is a file name),
+        the symbol positions, the predicted labels, the rendered equation, and the error message if something went wrong
+        """
+        result = {'image': image if isinstance(image, str) else None, 'error': error}
+        if error is not None:
+            return result
+
+        symbs, levels, stack, script_levels, extend_list, boxes = output
+        result.update({'boxes': boxes.tolist(), 'levels': [int(l) for l in levels], 'stack': [int(s) for s in stack],
+                       'script_levels': [int(s) for s in script_levels], 'extend_list': [int(e) for e in extend_list],
+                       'predictions': pred_symbol_list})
+        try:
+            with self.metrics.stage('render_equation'):
+                result['equation'] = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+        except Exception as e:
+            result['error'] = repr(e)
+        return result
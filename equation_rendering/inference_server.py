@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+import numpy as np
+
+from .make_predictions import make_prediction
+from .model_registry import get_model
+
+"""
+Micro-batching inference worker for the symbol classifier
+Symbol crops from many concurrent requests (eg. different streamlit sessions) are put in a single queue, and a worker thread
+runs them through the model together, as soon as enough crops are queued or the oldest request has waited long enough
+"""
+
+class InferenceServer:
+    """
+    Wrapper around a keras (or exported TFLite/ONNX) model that batches predictions across callers
+    #################
+
+    Constructor function:
+        model - the model to make predictions with (anything with a keras-like predict function)
+        max_batch_size - flush the queue as soon as this many symbol crops are waiting
+        max_wait - flush the queue at the latest this many seconds after the first request came in
+        timeout - seconds predict waits for its predictions before it raises a TimeoutError (None to wait forever)
+
+    Class methods:
+        start(self), stop(self)
+            start/stop the worker thread. Requests that are still in the queue when the worker has stopped fail with a RuntimeError
+        submit(self, img_batch)
+            queue an (N, 100, 100, 3) array of symbol images, and return a Future with the (N, n_classes) predictions
+        predict(self, img_batch, batch_size=None, verbose=0)
+            same as submit, but blocks until the predictions are in. This has the same signature as the keras
+            predict function, so the server can be passed to make_prediction in place of the model.
+            After timeout seconds it cancels the request (if the worker has not started on it) and raises a TimeoutError
+        make_prediction(self, symbol_list, extend_list, class_labels, return_pred_dics=False, metrics=None, prediction_cache=None)
+            make_prediction, with the predictions made by the server
+    """
+    def __init__(self, model, max_batch_size=64, max_wait=0.01, timeout=60):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_model_file(cls, model_file, **kwargs):
+        """
+        Load the model from a .h5, .tflite or .onnx file (through the model registry) and wrap it
+        """
+        return cls(get_model(model_file), **kwargs)
+
+    def start(self):
+        with self._lock:
+            self._start()
+        return self
+
+    def _start(self):
+        #call with self._lock held
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='inference-server', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the worker thread after all requests that are already in the queue have been handled
+        """
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            #nothing can be queued while the lock is held, so anything that is left was never picked up (eg. because the worker died)
+            self._fail_queued(RuntimeError('the inference server was stopped before the request was handled'))
+
+    def _fail_queued(self, error):
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None and request[1].set_running_or_notify_cancel():
+                request[1].set_exception(error)
+
+    def submit(self, img_batch):
+        img_batch = np.asarray(img_batch)
+        future = Future()
+        if len(img_batch) == 0:
+            future.set_result(np.zeros((0, 0)))
+            return future
+        #start the worker and queue the request in one go, so a request can never end up behind the stop signal of stop()
+        with self._lock:
+            self._start()
+            self._queue.put((img_batch, future))
+        return future
+
+    def predict(self, img_batch, batch_size=None, verbose=0):
+        future = self.submit(img_batch)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            #if the worker has not picked it up yet, it is skipped
+            future.cancel()
+            raise
+
+    def make_prediction(self, symbol_list, extend_list, class_labels, return_pred_dics=False, metrics=None, prediction_cache=None):
+        return make_prediction(symbol_list, extend_list, self, class_labels, return_pred_dics=return_pred_dics, metrics=metrics,
+                               prediction_cache=prediction_cache)
+
+    def _collect_requests(self):
+        """
+        Wait for the first request, then keep collecting requests until either the batch is full or the deadline passes
+        Returns the list of requests, and whether the server should stop afterwards
+        """
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        requests = [first]
+        n_queued = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while n_queued < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return requests, True
+            requests.append(request)
+            n_queued += len(request[0])
+        return requests, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            requests, stop = self._collect_requests()
+            #leave out the requests that the caller cancelled while they were queued, the others can't be cancelled from here on
+            requests = [(img, future) for img, future in requests if future.set_running_or_notify_cancel()]
+            if len(requests) == 0:
+                continue
+
+            try:
+                img_batch = np.concatenate([img for img, _ in requests])
+                predictions = self.model.predict(img_batch, batch_size=self.max_batch_size, verbose=0)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            #route the predictions back to each caller
+            idx = 0
+            for img, future in requests:
+                future.set_result(predictions[idx:idx+len(img)])
+                idx += len(img)
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+def get_inference_server(model_file, **kwargs):
+    """
+    Return the inference server for this model file, shared by everything that runs in this process
+    The model comes from the model registry, so it is only loaded once, and swapped out for the new version if the file changes
+    """
+    model = get_model(model_file)
+    with _servers_lock:
+        if model_file not in _servers:
+            _servers[model_file] = InferenceServer(model, **kwargs).start()
+        server = _servers[model_file]
+        #the worker thread picks up the new model at the next batch
+        server.model = model
+        return server
@@ -0,0 +1,177 @@
+import numpy as np
+import cv2
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .pipeline_metrics import NULL_METRICS
+from .model_registry import ModelRegistry
+
+#Model Prediction step
+
+#size of the symbol images the model was trained on
+MODEL_INPUT_SIZE = (100, 100)
+
+def prepare_symbol_batch(symbol_list, dtype=np.float32, out=None):
+    """
+    Turn the list of square uint8 symbol arrays from the preprocessing step into a single (N, 100, 100, 3) array
+    that can be passed to the model in one go
+    Each symbol is resized with bilinear interpolation straight into the batch array, and copied to the 3 color channels by broadcasting
+    dtype can be float32 (resized in floating point, like keras' smart_resize) or uint8 (resized and rounded by opencv)
+    If out is given, the batch is written into out[:N] instead of a new array
+    """
+    n = len(symbol_list)
+    if out is None:
+        out = np.empty((n,) + MODEL_INPUT_SIZE + (3,), dtype=dtype)
+    img_batch = out[:n]
+
+    for i, symbol in enumerate(symbol_list):
+        symbol = np.asarray(symbol)
+        if symbol.dtype != np.uint8:
+            symbol = symbol.astype(np.uint8)
+        if img_batch.dtype != np.uint8:
+            symbol = symbol.astype(img_batch.dtype)
+
+        #like smart_resize, crop non-square symbols to a square around the center first
+        h, w = symbol.shape[:2]
+        if h != w:
+            c = min(h, w)
+            symbol = symbol[(h-c)//2:(h-c)//2+c, (w-c)//2:(w-c)//2+c]
+
+        resized = cv2.resize(symbol, MODEL_INPUT_SIZE[::-1], interpolation=cv2.INTER_LINEAR)
+        img_batch[i] = resized[:,:,None]
+    return img_batch
+
+def decode_predictions(predictions, extend_list, class_labels):
+    """
+    Turn the (N, n_classes) array of model probabilities into a list of labels, and a list of dictionaries
+    with the top-4 labels and probabilities for each symbol
+    """
+    pred_list = []
+    pred_symbol_list = []
+    for i, prediction in enumerate(predictions):
+
+        pred_dic = {k[6:]:v for v,k in sorted(zip(prediction, class_labels))[-4:]}
+        label = class_labels[prediction.argmax(axis=-1)][6:]
+
+        #check if a symbol extends over multiple adjacent symbols
+        #if it's not a square root, check if the square root is predicted at a lower probability
+        #if so, just use that
+        if extend_list[i] >  1 and label != '\\sqrt':
+            if '\\sqrt' in pred_dic.keys():
+                label = '\\sqrt'
+
+        pred_symbol_list.append(label)
+        pred_list.append(pred_dic)
+    return pred_symbol_list, pred_list
+
+class PredictionCache:
+    """
+    LRU cache of model predictions for individual symbol images, so identical symbols are only run through the model once
+    Symbols are identified by a hash of their (100, 100) image, after rounding to whole gray levels (or coarser bins of
+    quantization gray levels), so tiny floating point differences from resizing don't cause a miss
+    The full probability vector is stored, so the top-4 dictionaries and the square root fallback work the same as without cache
+    A cache only holds predictions of a single model: use get_prediction_cache to get the cache that belongs to a model file
+    #################
+
+    Constructor function:
+        max_entries - maximum number of stored predictions. Memory use is about max_entries * n_classes * 4 bytes
+        quantization - size of the gray level bins that pixel values are rounded to before hashing
+
+    Class methods:
+        crop_keys(self, img_batch)
+            returns the list of cache keys for an (N, 100, 100, 3) batch from prepare_symbol_batch
+        predict(self, model, img_batch, batch_size=32)
+            same as model.predict, but only the symbols that are not in the cache are passed to the model
+            Returns the (N, n_classes) predictions, and the number of symbols that were not in the cache
+        clear(self)
+            remove all stored predictions
+    """
+    def __init__(self, max_entries=20000, quantization=1):
+        self.max_entries = max_entries
+        self.quantization = quantization
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def crop_keys(self, img_batch):
+        #all 3 channels are the same, so only the first one is hashed
+        quantized = np.rint(img_batch[..., 0] / self.quantization).astype(np.int16)
+        return [hashlib.blake2b(crop.tobytes(), digest_size=16).digest() for crop in quantized]
+
+    def predict(self, model, img_batch, batch_size=32):
+        keys = self.crop_keys(img_batch)
+
+        predictions = [None] * len(keys)
+        with self._lock:
+            for i, key in enumerate(keys):
+                prediction = self._entries.get(key)
+                if prediction is not None:
+                    self._entries.move_to_end(key)
+                    predictions[i] = prediction
+        missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+
+        if len(missing) > 0:
+            new_predictions = np.asarray(model.predict(img_batch[missing], batch_size=batch_size, verbose=0), dtype=np.float32)
+            with self._lock:
+                for i, prediction in zip(missing, new_predictions):
+                    predictions[i] = prediction
+                    self._entries[keys[i]] = prediction
+                    self._entries.move_to_end(keys[i])
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return np.stack(predictions), len(missing)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+#one prediction cache per model file, replaced by an empty cache when the model file changes
+_prediction_caches = ModelRegistry()
+
+def get_prediction_cache(model_file, **kwargs):
+    """
+    Return the prediction cache for the model in model_file, shared by everything that runs in this process
+    """
+    return _prediction_caches.get(model_file, lambda path: PredictionCache(**kwargs))
+
+def make_prediction(symbol_list, extend_list, model, class_labels, batch_size=32, return_pred_dics=False, metrics=None, prediction_cache=None):
+    """
+    Make a prediction for every symbol in the list. All symbols are stacked into a single array and passed to the model
+    in one call, in batches of at most batch_size symbols
+    Returns:
+        1) the list of predicted labels
+        2) if return_pred_dics=True, a list of dictionaries with the top-4 labels and probabilities for each symbol
+    If a pipeline_metrics.PipelineMetrics object is passed as metrics, the time spent in each step is recorded in it
+    If a PredictionCache is passed as prediction_cache, only symbols that are not in the cache are passed to the model
+    model can be anything with a keras-like predict function: the keras model, an exported model from model_backends.py
+    (TFLiteModel or ONNXModel, which don't need tensorflow), or an inference_server.InferenceServer. model_registry.get_model
+    picks the right one from the extension of the model file
+    """
+    if len(symbol_list) == 0:
+        return ([], []) if return_pred_dics else []
+    if metrics is None:
+        metrics = NULL_METRICS
+
+    with metrics.stage('prepare_symbol_batch'):
+        img_batch = prepare_symbol_batch(symbol_list)
+    with metrics.stage('inference'):
+        if prediction_cache is not None:
+            predictions, n_misses = prediction_cache.predict(model, img_batch, batch_size=batch_size)
+            metrics.count('prediction_cache_hits', len(img_batch) - n_misses)
+            metrics.count('prediction_cache_misses', n_misses)
+        else:
+            predictions = model.predict(img_batch, batch_size=batch_size, verbose=0)
+    with metrics.stage('decode_predictions'):
+        pred_symbol_list, pred_list = decode_predictions(predictions, extend_list, class_labels)
+    metrics.count('predictions', len(symbol_list))
+
+    if return_pred_dics:
+        return pred_symbol_list, pred_list
+    return pred_symbol_list
@@ -0,0 +1,119 @@
+import threading
+
+import numpy as np
+
+"""
+Run the symbol classifier without tensorflow, from a model exported to TFLite or ONNX (see code/export_model.py)
+Both wrappers have the same predict function as a keras model, so they can be passed to make_prediction, the inference server
+and the prediction cache in place of it. Only the small runtime of the format is imported:
+    .tflite - tflite_runtime (or ai_edge_litert), and tensorflow.lite only if neither is installed
+    .onnx   - onnxruntime
+Models with INT8 inputs or outputs are handled as well: the float batch from prepare_symbol_batch is quantized with the
+scale and zero point of the input, and the outputs are turned back into float probabilities
+"""
+
+def _tflite_interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+def _quantize(x, details):
+    """
+    Convert a float array to the input type of a (quantized) model, using the scale and zero point of the input tensor
+    """
+    dtype = np.dtype(details['dtype'])
+    scale, zero_point = details['quantization']
+    if dtype.kind in 'iu' and scale != 0:
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(x / scale + zero_point), info.min, info.max).astype(dtype)
+    return x.astype(dtype, copy=False)
+
+def _dequantize(y, details):
+    scale, zero_point = details['quantization']
+    if np.dtype(details['dtype']).kind in 'iu' and scale != 0:
+        return (y.astype(np.float32) - zero_point) * scale
+    return y.astype(np.float32, copy=False)
+
+
+class TFLiteModel:
+    """
+    Symbol classifier exported to a .tflite file, with a keras-like predict function
+    #################
+
+    Constructor function:
+        model_file - the .tflite file
+        num_threads - number of threads the interpreter may use (None for the runtime default)
+
+    Class methods:
+        predict(self, img_batch, batch_size=32, verbose=0)
+            return the (N, n_classes) float32 probabilities for an (N, 100, 100, 3) batch, running at most batch_size symbols at once
+    """
+    def __init__(self, model_file, num_threads=None):
+        Interpreter = _tflite_interpreter_class()
+        self.model_file = model_file
+        self.interpreter = Interpreter(model_path=model_file, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._input_shape = tuple(self._input['shape'])
+
+        #an interpreter can only run one batch at a time
+        self._lock = threading.Lock()
+
+    def _run(self, chunk):
+        shape = (len(chunk),) + self._input_shape[1:]
+        if shape != self._input_shape:
+            #only reallocate when the batch size changes
+            self.interpreter.resize_tensor_input(self._input['index'], shape)
+            self.interpreter.allocate_tensors()
+            self._input_shape = shape
+        self.interpreter.set_tensor(self._input['index'], _quantize(chunk, self._input))
+        self.interpreter.invoke()
+        return _dequantize(self.interpreter.get_tensor(self._output['index']), self._output)
+
+    def predict(self, img_batch, batch_size=32, verbose=0):
+        img_batch = np.asarray(img_batch, dtype=np.float32)
+        if len(img_batch) == 0:
+            return np.zeros((0, self._output['shape'][-1]), dtype=np.float32)
+        with self._lock:
+            outputs = [self._run(img_batch[i:i+batch_size]) for i in range(0, len(img_batch), batch_size)]
+        return np.concatenate(outputs)
+
+
+class ONNXModel:
+    """
+    Symbol classifier exported to a .onnx file, run with onnxruntime on the CPU, with a keras-like predict function
+    #################
+
+    Constructor function:
+        model_file - the .onnx file
+        num_threads - number of threads onnxruntime may use within an operation (None for the runtime default)
+
+    Class methods:
+        predict(self, img_batch, batch_size=32, verbose=0)
+            return the (N, n_classes) float32 probabilities for an (N, 100, 100, 3) batch, running at most batch_size symbols at once
+    """
+    def __init__(self, model_file, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.model_file = model_file
+        self.session = ort.InferenceSession(model_file, sess_options=options, providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+        self._n_classes = self.session.get_outputs()[0].shape[-1]
+
+    def predict(self, img_batch, batch_size=32, verbose=0):
+        img_batch = np.asarray(img_batch, dtype=np.float32)
+        if len(img_batch) == 0:
+            return np.zeros((0, self._n_classes), dtype=np.float32)
+        outputs = [self.session.run(None, {self._input_name: img_batch[i:i+batch_size]})[0]
+                   for i in range(0, len(img_batch), batch_size)]
+        return np.concatenate(outputs).astype(np.float32, copy=False)
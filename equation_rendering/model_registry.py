@@ -0,0 +1,114 @@
+import os
+import threading
+
+import numpy as np
+
+"""
+Process-wide registry for the symbol classifier and its class labels
+Streamlit re-executes the page scripts on every interaction, and every session runs them separately. Loading the model through
+this registry means it is only read from disk once per process, warmed up once, and shared by all sessions and reruns.
+When the file on disk changes (its modification time or size is different), it is loaded again on the next call
+"""
+
+class ModelRegistry:
+    """
+    Cache of objects loaded from files, that are reloaded when the file changes
+    #################
+
+    Constructor function:
+        no arguments
+
+    Class methods:
+        get(self, path, loader, warm_up=None)
+            return the object loaded from path with loader(path). If the file changed since it was loaded, load it again
+            warm_up is called on a newly loaded object before it is handed out
+        invalidate(self, path=None)
+            drop the cached object for path (or all cached objects), so the next get loads it again
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_version(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path, loader, warm_up=None):
+        path = os.path.abspath(path)
+        version = self._file_version(path)
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        #load under the lock, so concurrent sessions don't each load their own copy
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            obj = loader(path)
+            if warm_up is not None:
+                warm_up(obj)
+            self._entries[path] = (version, obj)
+            return obj
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+
+_registry = ModelRegistry()
+
+def load_keras_model(model_file):
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_file)
+
+def load_tflite_model(model_file):
+    from .model_backends import TFLiteModel
+    return TFLiteModel(model_file)
+
+def load_onnx_model(model_file):
+    from .model_backends import ONNXModel
+    return ONNXModel(model_file)
+
+#model file extension -> function that loads it. Only keras models need tensorflow, see model_backends.py for the others
+MODEL_LOADERS = {'.h5': load_keras_model, '.keras': load_keras_model, '.tflite': load_tflite_model, '.onnx': load_onnx_model}
+
+def load_model_file(model_file):
+    """
+    Load a model with the loader that belongs to the extension of model_file
+    """
+    extension = os.path.splitext(model_file)[1].lower()
+    if extension not in MODEL_LOADERS:
+        raise ValueError('unknown model format ' + repr(extension) + ', expected one of ' + ', '.join(MODEL_LOADERS))
+    return MODEL_LOADERS[extension](model_file)
+
+def warm_up_model(model, input_shape=(100, 100, 3)):
+    """
+    Run a dummy batch through the model, so the first real prediction doesn't pay for building the predict function
+    """
+    model.predict(np.zeros((1,) + input_shape, dtype=np.float32), verbose=0)
+
+def read_class_labels(class_file):
+    with open(class_file, 'r') as f:
+        lines = f.readlines()
+    return [label.split(' ')[-1][:-1] for label in lines]
+
+def get_model(model_file, warm_up=True):
+    """
+    Return the model in model_file (a keras .h5 file, or an exported .tflite or .onnx file), shared by everything that runs in this process
+    """
+    return _registry.get(model_file, load_model_file, warm_up=warm_up_model if warm_up else None)
+
+def get_class_labels(class_file):
+    """
+    Return the list of class labels in class_file, shared by everything that runs in this process
+    """
+    return _registry.get(class_file, read_class_labels)
+
+def invalidate(path=None):
+    _registry.invalidate(path)
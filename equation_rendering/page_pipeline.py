@@ -0,0 +1,224 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from .resolve_symbols import resolve_symbols_on_img, load_grayscale_image
+from .strip_processing import find_boxes_in_strips, DEFAULT_STRIP_HEIGHT
+from .make_predictions import make_prediction
+from .render_equations import render_equation
+from .pipeline_metrics import NULL_METRICS
+from .config import default_model_file, default_class_file
+
+"""
+Page mode: the full pipeline on an image with many equations, like a worksheet
+resolve_symbols_on_img assumes a single equation per image, and orders all symbols from left to right over the whole image.
+Here the page is first split into equation lines:
+    1) the black regions on the page are found in strips (see strip_processing.py), so a full page scan fits in memory
+    2) the rows covered by the regions that look like symbols (large enough, and neither thin outlines like the edge of the paper
+       nor solid dark areas like shadows) give a horizontal projection profile of the page.
+       Runs of covered rows that are closer together than a fraction of the symbol height (like the parts of a fraction) are one line
+    3) the regions on a line are clustered from left to right, and a large horizontal gap starts a new equation (for worksheets with columns)
+Every equation is then cut out and resolved on its own (in parallel, with a pool of worker processes), the symbols of all equations are
+classified in a single model call, and each equation is rendered
+
+Usage:
+    python -m equation_rendering.page_pipeline worksheet.png --workers 4 --output equations.json
+    python -m equation_rendering.page_pipeline worksheet.png --lines-only      # only find the equations, no model needed
+"""
+
+def _split_runs(is_set):
+    """
+    Start and end (exclusive) of all runs of True values in a 1d boolean array
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], is_set.astype(np.int8), [0]])))
+    return edges[0::2], edges[1::2]
+
+def _symbol_height(widths, heights):
+    """
+    The typical symbol height of a set of regions: the median height, weighted by the area of each region, so that many small specks
+    don't count for much
+    """
+    order = np.argsort(heights, kind='stable')
+    cum_area = np.cumsum((widths * heights)[order].astype(np.float64))
+    return float(heights[order][np.searchsorted(cum_area, cum_area[-1] / 2)])
+
+def find_equation_lines(img, strip_height=DEFAULT_STRIP_HEIGHT, line_gap=0.8, column_gap=4.0, min_size=0.3, min_fill=0.05, max_fill=0.8):
+    """
+    Find the equations on a grayscale image of a page
+    Input:
+        line_gap - runs of rows with symbols that are less than line_gap times the symbol height apart belong to the same equation line
+        column_gap - a horizontal gap of more than column_gap times the symbol height between symbols on a line starts a new equation
+        min_size - regions smaller than this fraction of the symbol height are left out (specks of dirt, and dots that are part of a symbol anyway)
+        min_fill, max_fill - regions of which less than min_fill of their box is black are outlines (like the edge of a page photographed
+            on a darker background), and regions of which more than max_fill is black and that are thicker than the symbols are solid
+            dark areas (like shadows on a scan). Both are left out, and so are equations that consist of a single solid region (like a rule)
+    Returns:
+        1) list of the (x1, y1, x2, y2) boxes around the symbols of each equation, top to bottom and left to right
+        2) list of the (x1, y1, x2, y2) boxes to cut each equation out with: the equation boxes with some white space around them,
+           but never more than halfway to the next equation
+        3) the estimated symbol height on the page, in pixels (None if there are no symbols)
+    """
+    img_ysize, img_xsize = img.shape
+    boxes, _, fill = find_boxes_in_strips(img, strip_height, return_fill=True)
+    widths, heights = boxes[:,2] - boxes[:,0], boxes[:,3] - boxes[:,1]
+    is_kept = fill >= min_fill
+    if not is_kept.any():
+        return [], [], None
+
+    #a large solid area can count for more than all symbols together, so whether a region is thicker than the symbols is decided
+    #on the height of the regions that are not solid (strokes)
+    is_stroke = is_kept & (fill <= max_fill)
+    if is_stroke.any():
+        stroke_height = _symbol_height(widths[is_stroke], heights[is_stroke])
+        is_kept &= ~((fill > max_fill) & (np.minimum(widths, heights) > stroke_height))
+    symbol_height = _symbol_height(widths[is_kept], heights[is_kept])
+
+    is_kept &= np.maximum(widths, heights) >= min_size * symbol_height
+    boxes, is_solid = boxes[is_kept], fill[is_kept] > max_fill
+
+    #horizontal projection profile: the number of symbols covering each row
+    profile = np.zeros(img_ysize + 1, dtype=np.int64)
+    np.add.at(profile, np.clip(boxes[:,1], 0, img_ysize), 1)
+    np.add.at(profile, np.clip(boxes[:,3], 0, img_ysize), -1)
+    band_starts, band_ends = _split_runs(np.cumsum(profile[:-1]) > 0)
+
+    #join bands that are close together, like the numerator, bar and denominator of a fraction
+    is_new_line = np.concatenate([[True], band_starts[1:] - band_ends[:-1] >= line_gap * symbol_height])
+    line_starts = band_starts[is_new_line]
+    line_ends = band_ends[np.append(np.flatnonzero(is_new_line)[1:] - 1, len(band_ends) - 1)]
+
+    pad = int(round(0.5 * symbol_height))
+    line_boxes, crop_boxes = [], []
+    for i, (y_start, y_end) in enumerate(zip(line_starts, line_ends)):
+        #white space above and below can go up to halfway to the line above/below
+        min_y1 = (line_ends[i-1] + y_start + 1) // 2 if i > 0 else 0
+        max_y2 = (y_end + line_starts[i+1]) // 2 if i + 1 < len(line_starts) else img_ysize
+
+        #cluster the symbols on this line from left to right, a large gap starts a new equation
+        is_on_line = (boxes[:,1] >= y_start) & (boxes[:,3] <= y_end)
+        order = np.argsort(boxes[is_on_line,0], kind='stable')
+        on_line, solid_on_line = boxes[is_on_line][order], is_solid[is_on_line][order]
+        right_edge = np.maximum.accumulate(on_line[:,2])
+        is_new_eq = np.concatenate([[True], on_line[1:,0] - right_edge[:-1] > column_gap * symbol_height])
+        eq_ids = np.cumsum(is_new_eq) - 1
+        eq_x1 = on_line[is_new_eq, 0]
+        eq_x2 = np.maximum.reduceat(on_line[:,2], np.flatnonzero(is_new_eq))
+
+        for j in range(len(eq_x1)):
+            eq_on_line = on_line[eq_ids == j]
+            eq_y1, eq_y2 = eq_on_line[:,1].min(), eq_on_line[:,3].max()
+            #a few marks that together are smaller than a symbol are not an equation (eg. a smudge in the margin),
+            #and neither is a single solid line (eg. a rule, or the fold of the page)
+            if max(eq_x2[j] - eq_x1[j], eq_y2 - eq_y1) < symbol_height or (len(eq_on_line) == 1 and solid_on_line[eq_ids == j][0]):
+                continue
+            line_boxes.append((int(eq_x1[j]), int(eq_y1), int(eq_x2[j]), int(eq_y2)))
+            #cut out only this equation, also when it shares the line with a taller one, since resolve_symbols_on_img
+            #leaves out boxes that are small compared to the whole image
+            crop_x1 = max(eq_x1[j] - pad, (eq_x2[j-1] + eq_x1[j] + 1) // 2 if j > 0 else 0)
+            crop_x2 = min(eq_x2[j] + pad, (eq_x2[j] + eq_x1[j+1]) // 2 if j + 1 < len(eq_x1) else img_xsize)
+            crop_boxes.append((int(crop_x1), int(max(eq_y1 - pad, min_y1)), int(crop_x2), int(min(eq_y2 + pad, max_y2))))
+    return line_boxes, crop_boxes, symbol_height
+
+def _resolve_crops(crops, workers, normalize, metrics):
+    """
+    resolve_symbols_on_img output (with boxes) for every crop, in a pool of worker processes if workers > 1
+    The timings and counters of the workers are added to metrics, the same as when the crops are resolved in this process
+    """
+    if workers is None or workers <= 1 or len(crops) <= 1:
+        return [resolve_symbols_on_img(crop, plot=False, return_boxes=True, metrics=metrics, normalize=normalize) for crop in crops]
+
+    from .batch_resolve import iter_resolved
+    outputs = [None] * len(crops)
+    for i, crop, output, error in iter_resolved(crops, workers=workers, chunksize=1, return_boxes=True, normalize=normalize,
+                                                 metrics=metrics):
+        if error is not None:
+            raise RuntimeError('could not resolve equation %d on the page: %s' % (i, error))
+        outputs[i] = output
+    return outputs
+
+def process_page(img_file, model, class_labels, workers=1, strip_height=DEFAULT_STRIP_HEIGHT, normalize=False, batch_size=32,
+                 prediction_cache=None, metrics=None, **line_args):
+    """
+    Run the full pipeline on every equation on a page (see find_equation_lines)
+    Input:
+        img_file - anything resolve_symbols_on_img accepts (a file path, the raw bytes of an image file, or an image array)
+        model, class_labels - the model (anything with a keras-like predict function) and its class labels
+        workers - number of worker processes that resolve the equations at the same time (1 to resolve them in this process)
+        strip_height - rows per strip when finding the equations, see strip_processing.py
+        normalize - shrink equations with large symbols to the working resolution first (see resolve_symbols.normalize_resolution)
+        prediction_cache, metrics - optional make_predictions.PredictionCache and pipeline_metrics.PipelineMetrics objects
+        line_args - passed on to find_equation_lines (line_gap, column_gap, min_size)
+    Returns:
+        1) the grayscale image array
+        2) a list with a dictionary for every equation that has symbols, top to bottom and left to right, with the equation 'line_box',
+           the rendered equation in 'eqstr', and the symbol 'boxes' (on the page), 'stack', 'script_levels' and 'predictions'
+    """
+    if metrics is None:
+        metrics = NULL_METRICS
+    with metrics.stage('load_image'):
+        img = load_grayscale_image(img_file)
+    with metrics.stage('find_equation_lines'):
+        line_boxes, crop_boxes, symbol_height = find_equation_lines(img, strip_height=strip_height, **line_args)
+    metrics.count('equation_lines', len(line_boxes))
+
+    crops = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in crop_boxes]
+    outputs = _resolve_crops(crops, workers, normalize, metrics)
+
+    #classify the symbols of all equations on the page in one go
+    all_symbols = [symbol for output in outputs for symbol in output[0]]
+    all_extends = [extend for output in outputs for extend in output[4]]
+    all_predictions = make_prediction(all_symbols, all_extends, model, class_labels, batch_size=batch_size, metrics=metrics,
+                                      prediction_cache=prediction_cache)
+
+    results = []
+    start = 0
+    for line_box, crop_box, output in zip(line_boxes, crop_boxes, outputs):
+        symbs, levels, stack, script_levels, extend_list, boxes = output
+        pred_symbol_list = all_predictions[start:start+len(symbs)]
+        start += len(symbs)
+        if len(symbs) == 0:
+            continue
+        with metrics.stage('render_equation'):
+            eqstr = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+        #symbol boxes on the page, instead of on the cut out equation
+        page_boxes = boxes + np.array([crop_box[0], crop_box[1], crop_box[0], crop_box[1]], dtype=boxes.dtype)
+        results.append({'line_box': line_box, 'eqstr': eqstr, 'boxes': page_boxes, 'stack': stack, 'script_levels': script_levels,
+                        'predictions': pred_symbol_list})
+    return img, results
+
+def main():
+    parser = argparse.ArgumentParser(description='Find and render all equations on an image of a page')
+    parser.add_argument('image')
+    parser.add_argument('--output', default=None, help='write the equations to this json file')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes that resolve the equations')
+    parser.add_argument('--strip-height', type=int, default=DEFAULT_STRIP_HEIGHT)
+    parser.add_argument('--normalize', action='store_true', help='shrink equations with large symbols (eg. phone photos) to the working resolution first')
+    parser.add_argument('--lines-only', action='store_true', help='only find the equations on the page, without classifying the symbols')
+    parser.add_argument('--model', default=default_model_file())
+    parser.add_argument('--class-names', default=default_class_file())
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.lines_only:
+        img = load_grayscale_image(args.image)
+        line_boxes, crop_boxes, symbol_height = find_equation_lines(img, strip_height=args.strip_height)
+        records = [{'line_box': list(line_box)} for line_box in line_boxes]
+    else:
+        from .model_registry import get_model, get_class_labels
+        model = get_model(args.model)
+        class_labels = get_class_labels(args.class_names)
+        t0 = time.perf_counter()
+        img, results = process_page(args.image, model, class_labels, workers=args.workers, strip_height=args.strip_height, normalize=args.normalize)
+        records = [{'line_box': list(result['line_box']), 'equation': result['eqstr'], 'boxes': result['boxes'].tolist()} for result in results]
+
+    for i, record in enumerate(records):
+        print(i, record['line_box'], record.get('equation', ''))
+    print('Found %d equations in %.2f s' % (len(records), time.perf_counter() - t0))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=1)
+
+if __name__ == '__main__':
+    main()
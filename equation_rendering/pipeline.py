@@ -0,0 +1,51 @@
+from . import PIPELINE_VERSION
+from .resolve_symbols import resolve_symbols_on_img, load_grayscale_image
+from .make_predictions import make_prediction
+from .render_equations import render_equation
+from .result_cache import make_key
+from .pipeline_metrics import NULL_METRICS
+
+"""
+The full pipeline on a single image, as used by the streamlit pages: resolve symbols -> model prediction -> equation rendering
+"""
+
+def process_image(img_bytes, model, class_labels, model_file=None, result_cache=None, prediction_cache=None, metrics=None, normalize=False):
+    """
+    Run the full pipeline on the raw bytes of an image file
+    Input:
+        img_bytes - the contents of the image file
+        model, class_labels - the model (anything with a keras-like predict function, eg. from model_registry.get_model, or an InferenceServer) and its class labels
+        model_file - the file the model was loaded from. Only needed with a result cache, so results of another model version are not reused
+        result_cache - optional result_cache.ResultCache. If this exact image was processed before, the stored result is returned
+        prediction_cache - optional make_predictions.PredictionCache, so symbols that were classified before are not passed to the model again
+        metrics - optional pipeline_metrics.PipelineMetrics object, to record the time spent in each stage
+        normalize - shrink images with large symbols (eg. phone photos) to the working resolution first (see resolve_symbols.normalize_resolution)
+    Returns:
+        1) the grayscale image array
+        2) a dictionary with the symbol 'boxes', 'stack' and 'script_levels' (see resolve_symbols_on_img), the predicted labels
+           in 'predictions', the rendered equation in 'eqstr', and the 'pipeline_version' that produced it
+    """
+    if metrics is None:
+        metrics = NULL_METRICS
+    img = load_grayscale_image(img_bytes)
+
+    #reuse the result if this exact image was rendered before with the same model
+    result = None
+    if result_cache is not None:
+        result_key = make_key(img_bytes, model_file, pipeline_version=PIPELINE_VERSION + ('/normalized' if normalize else ''))
+        result = result_cache.get(result_key)
+        metrics.count('result_cache_hits' if result is not None else 'result_cache_misses')
+    if result is not None:
+        return img, result
+
+    symbs, levels, stack, script_levels, extend_list, boxes = resolve_symbols_on_img(img, plot=False, return_boxes=True, metrics=metrics,
+                                                                                 normalize=normalize)
+    pred_symbol_list = make_prediction(symbs, extend_list, model, class_labels, metrics=metrics, prediction_cache=prediction_cache)
+    with metrics.stage('render_equation'):
+        eqstr = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+
+    result = {'boxes': boxes, 'stack': stack, 'script_levels': script_levels, 'predictions': pred_symbol_list, 'eqstr': eqstr,
+              'pipeline_version': PIPELINE_VERSION}
+    if result_cache is not None:
+        result_cache.put(result_key, result)
+    return img, result
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+"""
+Opt-in instrumentation for the equation pipeline
+A PipelineMetrics object records the wall time (and optionally the memory allocations) of each named stage, plus counters
+like the number of contours and boxes. It can be passed to resolve_symbols_on_img and make_prediction, read out with as_dict,
+and emitted to one or more sinks: the python log, a Prometheus text file (for node_exporter's textfile collector) or a JSON lines file
+
+Sinks can be specified with a comma separated string, eg. 'log,json:metrics.jsonl,prometheus:/var/lib/node_exporter/equation.prom'
+Adding 'alloc' to the string turns on allocation tracking (which slows the pipeline down)
+The streamlit pages read this string from the EQUATION_PIPELINE_METRICS environment variable
+"""
+
+METRICS_ENV_VAR = 'EQUATION_PIPELINE_METRICS'
+
+class PipelineMetrics:
+    """
+    Collects per-stage timings and counters
+    #################
+
+    Constructor function:
+        trace_allocations - if True, also record the net and peak memory allocated in each stage with tracemalloc.
+                            Stages should not be nested when this is on, as the peak of the outer stage is reset by the inner one
+        sinks - list of sinks that emit() sends the metrics to
+
+    Class attributes:
+        stages: dictionary of stage name -> {'seconds', 'calls'} (and 'alloc_bytes', 'alloc_peak_bytes' when tracing allocations)
+        counters: dictionary of counter name -> value
+        enabled: always True (False for NullMetrics), so callers can check whether metrics are being recorded
+
+    Class methods:
+        stage(self, name)
+            context manager that times the code inside it, and adds it to the named stage
+        count(self, name, value=1)
+            add value to the named counter
+        update(self, metrics_dict)
+            add the stages and counters from the as_dict output of another PipelineMetrics object (eg. from a worker process)
+        as_dict(self)
+            the stages and counters as a json serializable dictionary
+        emit(self)
+            send the metrics to all sinks
+    """
+    enabled = True
+
+    def __init__(self, trace_allocations=False, sinks=None):
+        self.trace_allocations = trace_allocations
+        self.sinks = list(sinks) if sinks is not None else []
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def _add_stage(self, name, values):
+        with self._lock:
+            stage = self.stages.setdefault(name, {})
+            for k, v in values.items():
+                if k == 'alloc_peak_bytes':
+                    stage[k] = max(stage.get(k, 0), v)
+                else:
+                    stage[k] = stage.get(k, 0) + v
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            alloc_start = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            values = {'seconds': time.perf_counter() - t0, 'calls': 1}
+            if self.trace_allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                values['alloc_bytes'] = current - alloc_start
+                values['alloc_peak_bytes'] = peak - alloc_start
+            self._add_stage(name, values)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def update(self, metrics_dict):
+        for name, values in metrics_dict.get('stages', {}).items():
+            self._add_stage(name, values)
+        for name, value in metrics_dict.get('counters', {}).items():
+            self.count(name, value)
+
+    def as_dict(self):
+        with self._lock:
+            return {'stages': {k: dict(v) for k, v in self.stages.items()}, 'counters': dict(self.counters)}
+
+    def emit(self):
+        metrics_dict = self.as_dict()
+        for sink in self.sinks:
+            sink.emit(metrics_dict)
+
+
+class NullMetrics:
+    """
+    Stand-in for PipelineMetrics that records nothing, used when instrumentation is off
+    """
+    enabled = False
+
+    def stage(self, name):
+        return nullcontext(self)
+
+    def count(self, name, value=1):
+        pass
+
+    def as_dict(self):
+        return {'stages': {}, 'counters': {}}
+
+    def emit(self):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+
+class LogSink:
+    """
+    Log one line per stage, and one line with all counters
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger('equation_pipeline')
+        self.level = level
+
+    def emit(self, metrics_dict):
+        for name, values in metrics_dict['stages'].items():
+            self.logger.log(self.level, 'stage %s: %s', name, ' '.join('%s=%s' % (k, round(v, 6)) for k, v in values.items()))
+        if metrics_dict['counters']:
+            self.logger.log(self.level, 'counters: %s', ' '.join('%s=%s' % kv for kv in metrics_dict['counters'].items()))
+
+
+class JSONSink:
+    """
+    Append the metrics as a single json line to a file, with a timestamp
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, metrics_dict):
+        line = json.dumps(dict(metrics_dict, timestamp=time.time()))
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+
+class PrometheusTextSink:
+    """
+    Keep running totals of all emitted metrics, and write them to a file in the Prometheus text format
+    The file is replaced atomically, so it can be read by node_exporter's textfile collector at any time
+    """
+    def __init__(self, path, prefix='equation_pipeline'):
+        self.path = path
+        self.prefix = prefix
+        self.totals = PipelineMetrics()
+        self._lock = threading.Lock()
+
+    def emit(self, metrics_dict):
+        with self._lock:
+            self.totals.update(metrics_dict)
+            text = prometheus_text(self.totals.as_dict(), self.prefix)
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+
+
+def prometheus_text(metrics_dict, prefix='equation_pipeline'):
+    """
+    Format the as_dict output of a PipelineMetrics object (with totals) in the Prometheus text format
+    """
+    lines = []
+    for key, help_text in [('seconds', 'Total wall time spent in each pipeline stage'), ('calls', 'Number of times each pipeline stage ran'),
+                           ('alloc_bytes', 'Net bytes allocated in each pipeline stage')]:
+        metric = '%s_stage_%s_total' % (prefix, key)
+        stage_lines = ['%s{stage="%s"} %s' % (metric, name, values[key]) for name, values in metrics_dict['stages'].items() if key in values]
+        if stage_lines:
+            lines += ['# HELP %s %s' % (metric, help_text), '# TYPE %s counter' % metric] + stage_lines
+    for name, value in metrics_dict['counters'].items():
+        metric = '%s_%s_total' % (prefix, name)
+        lines += ['# TYPE %s counter' % metric, '%s %s' % (metric, value)]
+    return '\n'.join(lines) + '\n'
+
+
+def make_sinks(spec):
+    """
+    Turn a comma separated sink specification (eg. 'log,json:metrics.jsonl,prometheus:metrics.prom') into a list of sinks
+    """
+    sinks = []
+    for part in spec.split(','):
+        kind, _, path = part.strip().partition(':')
+        if kind == 'log':
+            sinks.append(LogSink())
+        elif kind == 'json':
+            sinks.append(JSONSink(path))
+        elif kind == 'prometheus':
+            sinks.append(PrometheusTextSink(path))
+        elif kind not in ('', 'alloc'):
+            raise ValueError('unknown metrics sink: ' + kind)
+    return sinks
+
+_shared_sinks = {}
+_shared_sinks_lock = threading.Lock()
+
+def metrics_from_spec(spec):
+    """
+    Return a new PipelineMetrics object for the given sink specification, or NULL_METRICS if spec is empty
+    The sinks are shared by all calls with the same specification, so that eg. the Prometheus totals keep adding up over requests
+    """
+    if not spec:
+        return NULL_METRICS
+    with _shared_sinks_lock:
+        if spec not in _shared_sinks:
+            _shared_sinks[spec] = make_sinks(spec)
+    trace_allocations = 'alloc' in [part.strip() for part in spec.split(',')]
+    return PipelineMetrics(trace_allocations=trace_allocations, sinks=_shared_sinks[spec])
+
+def metrics_from_env():
+    """
+    metrics_from_spec, with the specification read from the EQUATION_PIPELINE_METRICS environment variable
+    """
+    return metrics_from_spec(os.environ.get(METRICS_ENV_VAR, ''))
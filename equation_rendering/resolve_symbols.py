@@ -0,0 +1,787 @@
+import numpy as np
+import cv2
+
+from .box_positions import BoxPositions
+from .box_relations import BoxRelations, XIntervalIndex, group_pairs, same_box_ids
+from .pipeline_metrics import NULL_METRICS
+
+
+"""
+Preprocessing 'resolve symbols' pipeline, to create images of individual symbols that the model should make predictions on
+See notebook resolve_symbols.ipynb for a more detailed explanation of each step
+"""        
+    
+"""
+Step 2) Finding which boxes should be merged
+"""
+def find_boxes_to_merge(overlap_idx, box_rel, img_ysize):
+    """
+    For a list of boxes that are overlapping in x-coordinates, check which box is the closest in distance either above or below the box
+    If a box on either side matches certain criteria about the x and ylengths, assume it's two components of an equals sign or ! or i, etc.
+    And return the indices of the two boxes that should be merged
+    Parameters:
+        1) overlap_idx (list) - list of box indices, the first index is the reference box
+        2) box_rel (BoxRelations) - the BoxRelations object of all the boxes, that the indices refer to
+        3) img_ysize (int)
+    Returns:
+        1) list of box indices to be merged. If no merge was found, list will contain a single entry
+    """
+    
+    box_0 = overlap_idx[0]
+
+    #find two closest vertical boxes on either side (above, and below)
+    ydist_min, ydist_max = 1000, 1000
+    box_i_min, box_i_max = box_0, box_0
+    
+    ydists = box_rel.calc_ydist(box_0, overlap_idx[1:])
+    for i, ydist in zip(overlap_idx[1:], ydists):
+        if ydist < 0:
+            if abs(ydist) < ydist_min:
+                ydist_min = abs(ydist)
+                box_i_min = i
+        elif ydist >= 0:
+            if ydist < ydist_max:
+                ydist_max = ydist
+                box_i_max = i
+
+    #these are the two closest boxes above and below the box
+    pair_idx = np.array([box_i_max, box_i_min])
+    
+    #if 1) the bigger box is NOT 1.7 bigger than the smaller box in x
+    # 2) the bigger box is not NOT 5x bigger than the smaller box in y
+    # 3) 5x the length of the smaller box is NOT smaller than the distance between the boxes
+    # 4) the boxes aren't the same box
+    # 5) one of the boxes is not inside the other box
+    # 6) the total size of the combined boxes is not more than 0.2x the image height
+    # 7) AND the total number of overlapping boxes is not 3 (in which case it's more likely to be a simple fraction like 1/3)
+    # - then return the two boxes to be merged
+    
+    min_ylens = np.minimum(box_rel.ylens[box_0], box_rel.ylens[pair_idx])
+    is_ol_up, is_ol_down = ~box_rel.isBigger(1.7, box_0, pair_idx, axis='x') & ~box_rel.isBigger(5, box_0, pair_idx, axis='y') \
+                            & (5*min_ylens > np.array([ydist_max, ydist_min])) & ~box_rel.isSame(box_0, pair_idx)
+
+    inside_check_up, inside_check_down = ~box_rel.isInside(box_0, pair_idx) & ~box_rel.isInside(box_0, pair_idx, invert=True)
+
+    tot_ysize = np.abs(np.maximum(box_rel.y2s[box_0], box_rel.y2s[pair_idx]) - np.minimum(box_rel.y1s[box_0], box_rel.y1s[pair_idx]))
+    tot_size_check_up, tot_size_check_down = tot_ysize > 0.18 * img_ysize
+
+    if is_ol_up == True and inside_check_up == True and len(overlap_idx) != 3 and not tot_size_check_up:
+        return [box_0, box_i_max]
+    elif is_ol_down == True and inside_check_down == True and len(overlap_idx) != 3 and not tot_size_check_down:
+        return [box_0, box_i_min]
+    else:
+        return [box_0]
+    
+def create_merged_boxes(box_list, img_ysize):
+    """
+    Given a list of boxes, find out which ones have enough overlap in x-coordinates to be considered for merging
+    Then pass this list to find_boxes_to_merge to determine the two that might be merged
+    Parameters:
+        1) box_list (list) - list of all the box coordinates
+        2) img_ysize (int)
+    Returns:
+        1) box_list (array) - (n,4) array of the edited box list (boxes that have been merged together are removed)
+        2) merged_box_list (array) - (n,4) array of the boxes that are the result of merging
+    """
+    box_list = np.asarray(box_list, dtype=np.int32).reshape(-1, 4)
+    box_rel = BoxRelations(box_list)
+
+    #now check if any boxes overlap with each other in x coordinates (not counting boxes that are the same)
+    #only the pairs of boxes with overlapping x-extents need to be checked
+    rows, cols = XIntervalIndex(box_list).candidate_pairs()
+    is_overlap = (box_rel.calc_Overlap(rows, cols, axis='x') > 0.25) & ~box_rel.isSame(rows, cols)
+    overlap_idx_list = group_pairs(rows[is_overlap], cols[is_overlap], len(box_list))
+    merged_box_list = []
+        
+    rm_boxes = []
+    
+    #find which of the overlapping boxes might fit the criteria to be merged
+    for i in range(len(box_list)):
+        overlap_idx = [i] + list(overlap_idx_list[i])
+        if len(overlap_idx) > 1:
+            boxes_to_merge = find_boxes_to_merge(overlap_idx, box_rel, img_ysize)
+            if len(boxes_to_merge) == 2:
+                #if a pair of boxes to be merged is found, merge them and add the individual boxes to the remove list
+                merged_box_list.append(box_rel.merge_boxes(*boxes_to_merge))
+                rm_boxes.extend(boxes_to_merge)
+        
+    #remove all the boxes that were merged
+    #a box that is removed more than once also removes the other boxes with the same coordinates, up to the number of times it is removed
+    first_same_idx, n_before = same_box_ids(box_list)
+    rm_counts = np.bincount(first_same_idx[rm_boxes], minlength=len(box_list))
+    box_list = box_list[n_before >= rm_counts[first_same_idx]]
+    merged_box_list = np.array(merged_box_list, dtype=np.int32).reshape(-1, 4)
+
+    return box_list, merged_box_list
+        
+"""
+Step 3) Finding the order of symbols
+"""
+def above_below_box(box, overlap_boxlist):
+    """
+    Given a box and the list boxes with overlapping x-coordinates, check if the overlapping boxes are above or below
+    (or both) the box.
+    Parameters:
+        1) box (list) - the coordinates of the reference box
+        2) overlap_boxlist (list of list) - list of other boxes that are checked against reference box
+    Returns:
+        0 if there are boxes below, 1 if there are boxes both above and below, and 2 if there are boxes above
+    """
+    ymin_0 = box[1]
+    ymins = np.array([overlap_boxlist[j][1] for j in range(len(overlap_boxlist))])
+    
+    hasAbove = False
+    hasBelow= False
+    for ymin in ymins:
+        if ymin > ymin_0:
+            hasBelow = True
+        if ymin < ymin_0:
+            hasAbove = True
+    if hasBelow == True and hasAbove == True:
+        return 1
+    elif hasBelow == True:
+        return 0
+    elif hasAbove == True:
+        return 2
+    else:
+        return 0
+    
+def scan_x_gaps(box_list, step=None):
+    """
+    Given a list of boxes, find which x-coordinates have no boxes overlapping them
+    The x-extents of the boxes are sorted and merged, and the gaps between the merged extents are returned
+    Parameters:
+        1) box_list (list of lists) - list of boxes, each a list in itself with the four points of the box as coordinates
+        2) step (int) - optional. If given, return sampled x-coordinates instead of intervals
+    Returns: 
+        a list of (x_start, x_end) intervals, where all x-coordinates x_start < x < x_end have no overlapping boxes
+        If step is given: a list of x-coordinates (at intervals of step pixels, starting from the leftmost box) that have no overlapping boxes
+    """
+    #sort boxes by x1, and find how far the boxes up to each box extend
+    xmins = np.array([box_list[j][0] for j in range(len(box_list))])
+    xmaxs = np.array([box_list[j][2] for j in range(len(box_list))])
+    
+    order = np.argsort(xmins, kind='stable')
+    xmins = xmins[order]
+    xmax_cum = np.maximum.accumulate(xmaxs[order])
+
+    #there is a gap wherever the next box starts more than one pixel after all previous boxes end
+    gap_idx = np.flatnonzero(xmins[1:] > xmax_cum[:-1] + 1)
+    x_gap_intervals = [(int(xmax_cum[i]), int(xmins[i+1])) for i in gap_idx]
+    
+    if step is None:
+        return x_gap_intervals
+    
+    x_gap_list = []
+    for x_start, x_end in x_gap_intervals:
+        x_gap_list.extend([x for x in range(xmins[0], x_end, step) if x > x_start])
+    return x_gap_list
+    
+def determine_box_level(box_list):
+    """
+    Given a list of boxes with coordinates [x1 y1 x2 y2],
+    Find out which 'level' of the equation the box is in, and whether the box is part of a stack or not
+    I define 'level' as a sequence of symbols that can be read left to right in an equation
+    And a 'stack' is levels that are on top of each other
+    Eg: the equation 1 + 5x + (9-x^2)/(4+x) has 4 levels: 1 + 5x +, (9-x^2), /, and 4+x
+    The levels 9-x^2, /, and 4+x are inside a stack that should be read top to bottom
+    """
+ 
+
+    box_list = np.asarray(box_list, dtype=np.int32).reshape(-1, 4)
+
+    if len(box_list) == 1:
+        return box_list, [0], [0]
+    
+    #first sort all the boxes by their x1 coordinate (and then by the other coordinates)
+    s_box_list = box_list[np.lexsort(box_list.T[::-1])]
+
+    #for each box obtain a list of the boxes this box overlaps with, matching certain criteria
+    #here, I will consider a box to be 'overlapping', if 30% of the smaller box is covered in x-coordinates by the bigger box
+    #and the boxes overlap lessathan 30% in y-coordinates
+    #only the pairs of boxes with overlapping x-extents need to be checked
+    box_rel = BoxRelations(s_box_list)
+    rows, cols = XIntervalIndex(s_box_list).candidate_pairs()
+    is_overlap = (box_rel.calc_Overlap(rows, cols, axis='x', relative_to='smaller') > 0.3) & (box_rel.calc_Overlap(rows, cols, axis='y', relative_to='both') < 0.30) \
+                 & ~box_rel.isSame(rows, cols)
+    overlap_idx_list = group_pairs(rows[is_overlap], cols[is_overlap], len(s_box_list))
+    overlap_list = [s_box_list[overlap_idx] for overlap_idx in overlap_idx_list]
+        
+    #now I have the list for each box that this box overlaps with, and I can determine the levels
+    level = 0 #initial level
+    level_list = []
+    stacked_level_list = [] #to keep track of whether the level is part of a stack or not
+    in_levels= False #whether we are evaluating boxes inside a stack
+    enter_level = False #whether
+    middle_symbol = 0 #to keep track of the 'middle symbol' in a stack. There can only be one per stack
+    
+    
+    #x_gaps to figure out when we enter a new stack when two stacks are adjacent to one another
+    x_gap_list = scan_x_gaps(s_box_list)
+    
+    for b, box in enumerate(s_box_list):
+        
+        #check if a box shares a single overlap with another box. in that case, don't count it as a stack cause its likely to be a super/subscript
+        if len(overlap_list[b]) > 0:
+            #the index of the box that this box overlaps with
+            ol_idx = overlap_idx_list[b][0]
+            #if both overlap lists have length 1 (it implies their overlapping box is each other) 
+            if len(overlap_list[b]) == 1 and len(overlap_list[ol_idx]) == 1:
+                single_overlap = True
+            else:
+                single_overlap = False
+        else:
+            single_overlap = False
+        
+        #check if box has overlapping boxes that is not a single overlap
+        if len(overlap_list[b]) > 0 and single_overlap == False:
+            #if we are in a stack, but the box has crossed an x-gap compared to the previous box , that means we are in a new stack
+            #(ie. there is an x-coordinate in a gap that is between the end of the previous box and the start of this box)
+            for x_start, x_end in x_gap_list:
+                if in_levels == True and max(x_start, s_box_list[b-1][2]) + 1 < min(x_end, box[0]):
+                    level += 3
+                    middle_symbol = 0
+                    break
+            
+            #if we were in an unstacked part and we are entering a stack, add a level
+            if enter_level == True:
+                level += 1
+                enter_level = False
+            #are there boxes both above and below this box?
+            #0 = below
+            #1 = both
+            #2 = above
+            level_add = above_below_box(box, overlap_list[b])
+
+            #keep track of middle symbol in the stack and find the yc coords
+            if level_add == 1 and middle_symbol == 0:
+                yc = box[1]*0.5 + box[3]*0.5
+            if level_add == 1: 
+                middle_symbol += 1
+                
+            #if a second 'middle symbol' is found in the stack, it's probably part of the upper or lower level instead
+            #find out which by comparing ycenter coordinates
+            if middle_symbol > 1 and level_add ==1: 
+                yc_new = box[1]*0.5 + box[3]*0.5
+                if yc_new > yc: level_add = 2
+                else: level_add = 0
+                
+            level_list.append(level + level_add)
+            stacked_level_list.append(level_add+1)
+            in_levels = True
+        else:
+            #if we were in a stack previously but not anymore, add 3 to indicate we are in a new level (because I assume hte stack has 3 levels)
+            if in_levels == True: 
+                middle_symbol = 0
+                level +=3 
+            in_levels = False
+            enter_level = True
+            #if there are no overlapping boxes, we can set the level to the same as the previous level and move on
+            level_list.append(level)
+            stacked_level_list.append(0)
+    
+
+    #finally, sort the boxes by level
+    s_box_list = s_box_list[np.lexsort((*s_box_list.T[::-1], level_list))]
+    s_stacked_level_list = np.array(stacked_level_list)[np.lexsort((stacked_level_list, level_list))].tolist()
+    s_level_list = sorted(level_list)
+    
+    #return 1) the (n,4) array of boxes, sorted by level and xmin coords
+    #2) the list of levels (sorted)
+    #3) a boolean list, which for each box shows if its part of a stack or not
+    return s_box_list, s_level_list, s_stacked_level_list
+
+def merge_dots(box_list, stack_list, level_list, img_ysize):
+    """
+    After the symbols have been sorted, make one final iteration through 
+    If there are symbols where one box is entirely above or below the other, AND they are not part of a stack, merge them
+    This helps remove some of the individual dots above i's or above other symbols
+    """
+    
+    box_list = np.array(box_list, dtype=np.int32).reshape(-1, 4)
+    box_rel = BoxRelations(box_list)
+
+    #compare every box with the next box
+    b_idx = np.arange(len(box_list) - 1)
+    c_idx = b_idx + 1
+
+    #if stack_list[b] == False and stack_list[b+1] == False: 
+    same_stack = np.array(stack_list[:-1]) == np.array(stack_list[1:])
+    tot_size_check = np.abs(np.maximum(box_rel.y2s[b_idx], box_rel.y2s[c_idx]) - np.minimum(box_rel.y1s[b_idx], box_rel.y1s[c_idx])) > 0.18 * img_ysize
+    is_merge = same_stack & (box_rel.calc_Overlap(b_idx, c_idx, axis='x', relative_to='smaller') > 0.75) \
+               & (box_rel.calc_Overlap(b_idx, c_idx, axis='y') < 0.2) & ~tot_size_check
+    merge_ind_list = np.flatnonzero(is_merge)
+    merged_dots_list = [box_rel.merge_boxes(b, b+1) for b in merge_ind_list]
+
+    #Since the boxes are already sorted, I want to preserve order. That's why I loop backwards over the list
+    #For the box_list i'll replace one entry with the merged box and remove the other one
+    #For the stacked list and level list, I'll just remove one entry
+    for replace_idx, merged_box in zip(merge_ind_list[::-1], merged_dots_list[::-1]):
+        box_list[replace_idx] = merged_box
+    pop_idx = set((merge_ind_list + 1).tolist())
+    box_list = np.delete(box_list, list(pop_idx), axis=0)
+
+    stack_list = [stack for i, stack in enumerate(stack_list) if i not in pop_idx]
+    level_list = [level for i, level in enumerate(level_list) if i not in pop_idx]
+        
+    return box_list, stack_list, level_list
+    
+"""
+Step 4) Finding the sub/superscript level
+"""
+def sub_or_superscript_level(coords1, level1, coords2, level2):
+    """
+    Given two boxes and their levels, determine whether the second box is a subscript or superscript of the first box
+    """
+    # if the symbols are not the same level, return -10
+    if level1 != level2:
+        return -10, 0
+    
+    box_pos = BoxPositions(coords1, coords2)
+    
+    #calculate the 'superscript score', a combination of the ylen ratio and how far the second box sticks up or down from the first one
+    #1) 1 - ylen_ratio
+    s1 = 1 - box_pos.ylen_b2/box_pos.ylen_b1
+    
+    #2) how much does the box stick out?    
+    s2 = max([box_pos.calc_box_extends(), 0])
+
+    s2 = s2 
+    
+    #s3 = box_pos.calc_box_extends_center()
+
+    tot_score = s1*0.8 + s2*3.2 #+ s3*0.45
+        
+    #check if it's a subscript or superscript
+    yc_1, yc_2 = box_pos.ycs
+    
+    if tot_score > 1 and yc_1 > yc_2:
+        return 1, tot_score
+    elif tot_score > 1 and yc_1 < yc_2:
+        return -1, tot_score
+    else:
+        return 0, tot_score
+
+def determine_script_levels(box_list, level_list):
+    """
+    Compare every box to the one before it with sub_or_superscript_level, and keep a running total of the script level
+    The script level goes back to 0 at the start of every new level
+    Returns: a list with the script level of each box (0 for base level, 1 for superscript, -1 for subscript, etc.)
+    """
+    script_level = 0
+    script_level_list = [0]
+    if len(box_list) > 1:
+        for b, box in enumerate(box_list[:-1]):
+            script_add, score = sub_or_superscript_level(box_list[b], level_list[b], box_list[b+1], level_list[b+1])
+            if script_add == -10:
+                script_level = 0
+            else:
+                script_level += script_add
+            script_level_list.append(script_level)
+    return script_level_list
+        
+"""
+Step 5) Isolate symbols and put them in square arrays
+"""
+def isolate_symbols_and_square(box_list, level_list, ind_symbols):
+    """
+    After all the symbol resolving is done, I will do one final check to see if there are any boxes that have another box contained within them
+    This will primarily be the case for roots
+    If that is the case, I will use opencvs drawcontours to re-draw the shape
+    Finally, I will make sure every symbol is in a square array, to make rescaling easier when calling the model
+    """
+    
+    n_boxes = len(box_list)
+    box_rel = BoxRelations(box_list)
+    #the index of the first box with the same coordinates as each box
+    first_same_idx, _ = same_box_ids(box_list)
+    #the level of each box, as found by looking up the first box with the same coordinates
+    level_arr = np.array(level_list, dtype=int)[first_same_idx]
+
+    #for each box, the boxes to check against are all boxes after it that do not match any of the boxes checked before
+    #for the root extension, we only look at those boxes until we hit a box that is not on the same level
+    level_end = np.full(n_boxes, n_boxes)
+    if np.array_equal(first_same_idx, np.arange(n_boxes)):
+        #without duplicate boxes, this is simply the end of the run of boxes with the same level
+        run_starts = np.flatnonzero(np.diff(level_arr) != 0) + 1
+        run_ends = np.append(run_starts, n_boxes)
+        level_end = run_ends[np.searchsorted(run_starts, np.arange(n_boxes), side='right')]
+    else:
+        for i in range(n_boxes):
+            for j in range(i+1, n_boxes):
+                if first_same_idx[j] > i and level_arr[j] != level_list[i]:
+                    level_end[i] = j
+                    break
+
+    #boxes can only be (partly) inside each other if they overlap in x, so only those pairs need to be checked
+    rows, cols = XIntervalIndex(box_list).candidate_pairs()
+    is_ebox = (cols > rows) & (first_same_idx[cols] > rows)
+    
+    #check if the second box is completely inside the other one
+    #eq_i is the counter to keep track of how many boxes are inside other boxes
+    is_inside = is_ebox & box_rel.isInside(rows, cols)
+    eq_i_list = np.bincount(rows[is_inside], minlength=n_boxes)
+
+    #figure out how far a root should extend
+    #if the next boxes 1) overlap and 2) are on the same level as this one, add +1 to the extension list
+    is_ext = is_ebox & (cols < level_end[rows]) & box_rel.isPartInside(rows, cols)
+    extend_list = np.bincount(rows[is_ext], minlength=n_boxes).tolist()
+
+    for i, box in enumerate(box_list):
+        eq_i = eq_i_list[i]
+
+        #if the box has other boxes entirely contained within it, re-draw with drawContours
+        if eq_i > 0:
+            symbol = ind_symbols[i]
+            s_ret, s_thresh=cv2.threshold(symbol,200,255,cv2.THRESH_BINARY)
+            s_ctrs, s_ret =cv2.findContours(s_thresh,cv2.RETR_TREE,cv2.CHAIN_APPROX_NONE)
+            s_ctrs =sorted(s_ctrs, key=lambda ctr: cv2.boundingRect(ctr)[0])
+            
+            stencil = np.zeros(symbol.shape).astype(symbol.dtype)
+            
+            #draw the contour
+            cv2.drawContours(stencil, [s_ctrs[1]], -1, color=(255, 255, 255), thickness=cv2.FILLED)
+
+            ind_symbols[i] = ~stencil
+    
+        
+        symbol_shape = ind_symbols[i].shape
+        
+        #some ugly code to center the symbol in a new, square array
+        #add about 10% white space on each side
+        white_pix = max(symbol_shape) // 10
+        if white_pix < 2: white_pix = 2
+        if max(symbol_shape)%2 == 0:
+            ms = max(symbol_shape) +white_pix
+        else:
+            ms = max(symbol_shape) + white_pix + 1
+        #the symbol stays uint8 all the way through, the batch for the model is only converted in make_predictions.prepare_symbol_batch
+        new_symbol = np.full((ms, ms), 255, dtype=np.uint8)
+
+        sd_x = ms - symbol_shape[0]
+        sd_y = ms - symbol_shape[1]
+
+        new_symbol[sd_x//2:-sd_x//2,sd_y//2:-sd_y//2] = ind_symbols[i]
+        
+        #add slight blur, makes model predictions more reliable
+        ind_symbols[i] = cv2.blur(new_symbol,(3,3))
+                                     
+    return ind_symbols, extend_list
+
+"""
+Step 6) Combine everything and resolve symbols
+"""
+class ImageDecodeError(ValueError):
+    """
+    Raised by load_grayscale_image when the input is not an image that can be read (eg. an upload that is not an image file)
+    """
+
+def load_grayscale_image(img_file):
+    """
+    Load an image in grayscale, without going through a file on disk if the image is already in memory
+    img_file can be 1) the path to an image file, 2) the raw bytes of an image file (eg. an upload), or
+    3) an image array, either grayscale or in the BGR(A) channel order that opencv uses. Arrays are either uint8 (0-255),
+       or float with values from 0 to 1 (like matplotlib and skimage images), which are scaled to 0-255
+    Raises an ImageDecodeError if no image can be read from img_file
+    """
+    if isinstance(img_file, (bytes, bytearray, memoryview)):
+        try:
+            img = cv2.imdecode(np.frombuffer(img_file, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        except cv2.error:
+            img = None
+    elif isinstance(img_file, np.ndarray):
+        img = img_file
+        if np.issubdtype(img.dtype, np.floating) and img.size > 0 and np.nanmax(img) <= 1.0:
+            img = np.round(np.clip(np.nan_to_num(img), 0, 1) * 255).astype(np.uint8)
+        elif img.dtype != np.uint8:
+            #any other scaling (eg. 16 bit images, or floats from 0 to 255) is ambiguous, so leave the conversion to the caller
+            raise ValueError('unsupported image array dtype ' + repr(str(img.dtype)) + ', expected uint8 (0-255) or float (0-1)')
+        if img.ndim == 3 and img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+        elif img.ndim == 3 and img.shape[2] == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        elif img.ndim == 3:
+            img = img[:,:,0]
+    else:
+        img = cv2.imread(str(img_file),cv2.IMREAD_GRAYSCALE)
+
+    if img is None or img.size == 0:
+        raise ImageDecodeError('Could not read an image from the input')
+    return img
+
+
+def count_black_and_white(img):
+    """
+    The number of pixels that are already at a perfect black/white (0 or 255)
+    """
+    return img.size - cv2.countNonZero(cv2.inRange(img, 1, 254))
+
+def threshold_image(img, black_and_white=None):
+    """
+    Threshold a grayscale image, so the symbols are black (0) on a white (255) background
+    If more than 90% of pixels are already at a perfect black/white, just use a simple binary threshholding.
+    Otherwise, use a combination of adaptive threshholding together with a linear cut after to get rid of as many small-scale shadows/dots etc as possible
+    black_and_white can be passed to make this choice for the whole image, when only a part of it is thresholded (see strip_processing.py)
+    """
+    if black_and_white is None:
+        black_and_white = count_black_and_white(img) / img.size > 0.9
+    if black_and_white:
+        ret,thresh=cv2.threshold(img, 230, 255, cv2.THRESH_BINARY)
+    else:
+        thresh  = cv2.adaptiveThreshold(img,255,cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,11,2)
+        blur = cv2.GaussianBlur(thresh,(13,13),0)
+        bt = 140
+        ret,thresh=cv2.threshold(blur,bt, 255, cv2.THRESH_BINARY)
+    return thresh
+
+def contour_boxes(thresh):
+    """
+    Find the boxes of the symbols on a thresholded image with findContours: the bounding boxes of the outer contours of the black symbols
+    (all contours sorted by x1 + y1, without the first one, which is the white background, and without the inner contours)
+    Returns:
+        1) (n,4) array of box coordinates (x1, y1, x2, y2), sorted by x1 + y1. The boxes are not yet filtered on their size
+        2) the number of contours that were found
+    """
+    ctrs, ret =cv2.findContours(thresh,cv2.RETR_TREE,cv2.CHAIN_APPROX_SIMPLE)
+
+    #get the bounding boxes (x1, y1, xlen, ylen) for all contours, and sort the contours by x1 + y1
+    rects = np.array([cv2.boundingRect(c) for c in ctrs], dtype=np.int32).reshape(-1, 4)
+    order = np.argsort(rects[:,0] + rects[:,1], kind='stable')[1:]
+
+    #calculate the area of the contour - if negative, the contour is an inner contour and should be excluded
+    ctr_ar = np.array([cv2.contourArea(ctrs[i], oriented=True) for i in order])
+
+    #switch to absolute x and y coordinatees (not x1, y1, xlen, ylen)
+    box_list = rects[order][ctr_ar > 0]
+    box_list[:,2:] += box_list[:,:2]
+    return box_list, len(ctrs)
+
+def region_boxes_to_contour_boxes(region_boxes, img_shape, first_x=None, return_index=False):
+    """
+    Turn the (n,4) boxes (x1, y1, x2, y2) of the black regions (4-connected) on a thresholded image into the boxes contour_boxes finds:
+    the outer contours of the symbols are the holes in the white background, which are exactly the black regions that don't touch the edge
+    of the image. findContours traces the white pixels around them, so its boxes are one pixel larger on each side
+    The boxes are sorted by x1 + y1, and boxes with the same x1 + y1 are in the order findContours lists them: the reverse of the order
+    in which it comes across them, scanning the image from top to bottom and left to right. It comes across a region at its first pixel,
+    which is on the top row of its box. first_x can give the column of that pixel for each region, it is only needed for regions whose
+    boxes have the same top left corner, otherwise the left edge of the box is used
+    (findContours lists a region that lies inside a white island inside another region right after that region instead, so for such
+    nested regions the order of boxes with the same x1 + y1 can differ. This only happens on noisy images, see code/compare_box_backends.py)
+    With return_index=True, the index in region_boxes of each returned box is returned as well
+    """
+    region_boxes = np.asarray(region_boxes).reshape(-1, 4)
+    if first_x is None:
+        first_x = region_boxes[:,0]
+    img_ysize, img_xsize = img_shape
+    is_inside = (region_boxes[:,0] > 0) & (region_boxes[:,1] > 0) & (region_boxes[:,2] < img_xsize) & (region_boxes[:,3] < img_ysize)
+    box_list = region_boxes[is_inside].astype(np.int32)
+    box_list[:,:2] -= 1
+    box_list[:,2:] += 1
+    order = np.lexsort((-np.asarray(first_x)[is_inside], -box_list[:,0], -box_list[:,1], box_list[:,0] + box_list[:,1]))
+    if return_index:
+        return box_list[order], np.flatnonzero(is_inside)[order]
+    return box_list[order]
+
+def component_boxes(thresh):
+    """
+    Find the same boxes as contour_boxes, with a single call to connectedComponentsWithStats on the inverted image instead of
+    tracing every contour (see region_boxes_to_contour_boxes)
+    Returns:
+        1) (n,4) array of box coordinates (x1, y1, x2, y2), sorted by x1 + y1. The boxes are not yet filtered on their size
+        2) the number of black regions that were found
+    """
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(thresh), connectivity=4, ltype=cv2.CV_32S)
+    region_boxes = stats[1:,:4].copy()
+    region_boxes[:,2:] += region_boxes[:,:2]
+
+    #for regions with the same top left corner of their box, look up the first pixel on the top row, for the order of the boxes
+    first_x = region_boxes[:,0].copy()
+    _, corner_ids, corner_counts = np.unique(region_boxes[:,:2], axis=0, return_inverse=True, return_counts=True)
+    for i in np.flatnonzero(corner_counts[corner_ids.ravel()] > 1):
+        x1, y1, x2, y2 = region_boxes[i]
+        first_x[i] = x1 + np.argmax(labels[y1, x1:x2] == i + 1)
+    return region_boxes_to_contour_boxes(region_boxes, thresh.shape, first_x=first_x), n - 1
+
+#ways to find the symbol boxes on the thresholded image, for the box_backend argument of resolve_symbols_on_img. Both give the same boxes
+BOX_BACKENDS = {
+    'contours': contour_boxes,
+    'components': component_boxes,
+}
+
+#symbol height (in pixels) that normalize_resolution shrinks images with larger symbols to. The fixed sizes in resolve_symbols_on_img
+#(the 11 pixel adaptive threshold block and the 13x13 blur) are tuned on the handwritten example photos, with symbols 50-80 pixels high,
+#so images are never shrunk below that (eg. math_martijn4 has symbols of about 78 pixels).
+#Calibrated with code/calibrate_normalization.py: on copies of the example photos enlarged 1.1-3x, 80 pixels with a tolerance of 1.1
+#gives the symbol boxes closest to those on the original photos, of the targets of 80 pixels or more that never do worse than not normalizing
+WORKING_SYMBOL_HEIGHT = 80
+
+def estimate_symbol_height(img, max_side=1000):
+    """
+    Estimate the median height of the symbols on a grayscale image, in pixels
+    The estimate is made on a copy of the image shrunk to at most max_side pixels on its longest side, so it stays cheap for large images
+    Returns None if no symbols are found
+    """
+    factor = max(1.0, max(img.shape) / max_side)
+    if factor > 1:
+        small = cv2.resize(img, (max(1, round(img.shape[1] / factor)), max(1, round(img.shape[0] / factor))), interpolation=cv2.INTER_AREA)
+    else:
+        small = img
+    #8-connectivity, so thin strokes that break up when shrinking the image still count as one symbol
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(threshold_image(small)), connectivity=8)
+    x, y, w, h = stats[1:,0], stats[1:,1], stats[1:,2], stats[1:,3]
+    #same size cut as for the symbol boxes, and no regions touching the edge (those are usually shadows or the edge of the paper)
+    is_symbol = (w*h > 2.2e-4 * small.size) & (x > 0) & (y > 0) & (x + w < small.shape[1]) & (y + h < small.shape[0])
+    if not is_symbol.any():
+        return None
+    return float(np.median(h[is_symbol])) * factor
+
+def normalize_resolution(img, symbol_height=WORKING_SYMBOL_HEIGHT, tolerance=1.1):
+    """
+    Shrink an image (with INTER_AREA) so that its symbols are about symbol_height pixels high, see estimate_symbol_height
+    Images are never enlarged, and only shrunk when the symbols are more than tolerance times too high, so images that are already
+    close to the working resolution are processed as they are
+    Returns: the (shrunk) image, and the scale factor that was applied (1.0 if the image was not changed)
+    """
+    est_height = estimate_symbol_height(img)
+    if est_height is None or est_height <= tolerance * symbol_height:
+        return img, 1.0
+    scale = symbol_height / est_height
+    new_size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+    return cv2.resize(img, new_size, interpolation=cv2.INTER_AREA), scale
+
+def rescale_boxes(box_list, scale, img_shape):
+    """
+    Map (n,4) box coordinates on an image shrunk by normalize_resolution back to the original image of shape img_shape,
+    rounding outwards so the boxes still cover the whole symbol
+    """
+    box_list = np.asarray(box_list, dtype=np.float64).reshape(-1, 4) / scale
+    box_list[:,:2] = np.floor(box_list[:,:2])
+    box_list[:,2:] = np.ceil(box_list[:,2:])
+    box_list[:,[0,2]] = np.clip(box_list[:,[0,2]], 0, img_shape[1])
+    box_list[:,[1,3]] = np.clip(box_list[:,[1,3]], 0, img_shape[0])
+    return box_list.astype(np.int32)
+
+def resolve_symbols_on_img(img_file, plot=True, return_boxes=False, metrics=None, strip_height=None, normalize=False, box_backend='contours'):
+    """
+    Given an input image (a file path, the raw bytes of an image file, or an image array), use opencv's findContours to find the contours related to mathematical symbols,
+    and prepare them for model prediction and equation rendering.
+    The following steps are performed:
+    1) Inner contour boxes are removed
+    2) Boxes that are likely to belong together (like the two halves of an = or a !) are merged
+    3) The order of the symbols in the equation is determined, as well as whether they are part of a 'stack' (like in a fraction)
+    4) The 'sub/superscript' level of each symbol is determined
+    5) For symbols with bounding boxes covering other symbols, the symbol is redrawn with opencv using the contours
+    6) Each symbol is put inside a square array
+    Returns:
+        1) A list of square image arrays, ordered by how the symbol should appear in an equation
+        2) a 'level list'. Symbols with the same level can be rendered left to right. A new level indicates some change, either 
+        3) a 'stack list'. 0 for a symbol not in a stack, 1/2/3 for symbols in the top/middle/bottom of a stack, respectively
+        4) a 'script level list'. To determine whether a symbol is a sub/superscript of the previous one. equal script levels means the symbol should be at equal line height
+        5) the 'extend list'. How many of the following symbols on the same level a symbol covers (used to close out square roots)
+        6) (n,4) array of the bounding box coordinates of each symbol, if return_boxes=True
+        7) fig and ax objects, if plot=True
+    matplotlib is only imported when plot=True. To draw the boxes without matplotlib, use return_boxes=True and symbol_overlay.draw_symbol_boxes
+    If a pipeline_metrics.PipelineMetrics object is passed as metrics, the time spent in each step and the number of contours/boxes are recorded in it
+    For very large images (eg. page scans), pass strip_height to threshold the image and find the symbols in horizontal strips of that many rows
+    (see strip_processing.py), so the memory needed does not grow with the image size. The result is the same as without strips
+    With normalize=True, images with symbols larger than WORKING_SYMBOL_HEIGHT (eg. full size phone photos) are first shrunk to that resolution,
+    which makes them a lot faster to process. The symbol images are then cut out of the shrunk image, but the returned boxes are on the original image.
+    This changes which symbols are found, and its effect on the accuracy has not been measured on the labelled equations yet
+    (see evaluate_pipeline.py --normalize-parity), so it is off by default
+    box_backend picks how the symbol boxes are found on the thresholded image: 'contours' (findContours) or 'components' (connectedComponentsWithStats),
+    see BOX_BACKENDS. Both give the same boxes: 'contours' is faster on clean images, 'components' on noisy ones (like page scans with
+    many specks of dirt). In strip mode, the boxes are always found with connected components
+    """
+    if metrics is None:
+        metrics = NULL_METRICS
+
+    #find contours
+    with metrics.stage('load_image'):
+        img = load_grayscale_image(img_file)
+    orig_img, scale = img, 1.0
+    if normalize:
+        with metrics.stage('normalize_resolution'):
+            img, scale = normalize_resolution(img)
+    img_size = img.shape[0] * img.shape[1]
+
+    if box_backend not in BOX_BACKENDS:
+        raise ValueError('unknown box backend ' + repr(box_backend) + ', expected one of ' + ', '.join(BOX_BACKENDS))
+
+    #step 1) find the boxes of the symbols, without the inner contours
+    if strip_height is None:
+        with metrics.stage('threshold'):
+            thresh = threshold_image(img)
+
+        with metrics.stage('find_contours'):
+            box_list, n_contours = BOX_BACKENDS[box_backend](thresh)
+        metrics.count('contours', n_contours)
+    else:
+        from .strip_processing import is_black_and_white, find_boxes_in_strips
+
+        with metrics.stage('threshold'):
+            black_and_white = is_black_and_white(img, strip_height)
+
+        with metrics.stage('find_contours'):
+            box_list, n_contours = find_boxes_in_strips(img, strip_height, black_and_white=black_and_white)
+        metrics.count('contours', n_contours)
+
+    with metrics.stage('filter_boxes'):
+        #only include boxes that are a certain % of the total image area
+        box_list = box_list[(box_list[:,2] - box_list[:,0]) * (box_list[:,3] - box_list[:,1]) > 2.2e-4 *img_size]
+    metrics.count('boxes', len(box_list))
+    
+    #step 2) find which boxes should be merged, and remove the individual boxes
+    with metrics.stage('create_merged_boxes'):
+        box_list, merged_box_list = create_merged_boxes(box_list, img.shape[0])
+
+        #remove non-unique boxes (there might be duplicates in the merged box list)
+        tot_boxes = np.unique(np.concatenate([box_list, merged_box_list]), axis=0)
+    metrics.count('merged_boxes', len(merged_box_list))
+
+    #step 3) of all the boxes that are left, determine the order
+    with metrics.stage('determine_box_level'):
+        tot_boxes, box_levels, stacked_list = determine_box_level(tot_boxes)
+    
+    #intermediate step: extra merging
+    with metrics.stage('merge_dots'):
+        tot_boxes, stacked_list, box_levels = merge_dots(tot_boxes, stacked_list, box_levels, img.shape[0])
+    metrics.count('symbols', len(tot_boxes))
+
+    #step 4) figure out the 'script level' of each symbol (whether it's on the line, or sub/superscript)
+    with metrics.stage('script_levels'):
+        script_level_list = determine_script_levels(tot_boxes, box_levels)
+
+    #cut out the individual symbols
+    if strip_height is None:
+        ind_symbols = []
+        for i, box in enumerate(tot_boxes):
+            x1 = box[0]
+            y1 = box[1]
+            x2 = box[2] - box[0]
+            y2 = box[3] - box[1]
+
+            ind_symbols.append(thresh[y1:y1+y2,x1:x1+x2])
+    else:
+        from .strip_processing import crop_thresholded_symbols
+        ind_symbols = crop_thresholded_symbols(img, tot_boxes, black_and_white)
+    
+    #the boxes on the original image, if it was shrunk
+    orig_boxes = tot_boxes if scale == 1.0 else rescale_boxes(tot_boxes, scale, orig_img.shape)
+
+    #plot the bounding boxes with some information 
+    if plot:
+        from .symbol_overlay import plot_symbol_boxes
+        fig, ax = plot_symbol_boxes(orig_img, orig_boxes, stacked_list, script_level_list)
+
+    #step 5) make a list for the individual symbols
+    with metrics.stage('isolate_symbols_and_square'):
+        ind_symbols, extend_list = isolate_symbols_and_square(tot_boxes, box_levels, ind_symbols)
+    
+    output = (ind_symbols, box_levels, stacked_list, script_level_list, extend_list)
+    if return_boxes:
+        output += (orig_boxes,)
+    if plot:
+        output += (fig, ax)
+    return output
+
+   
\ No newline at end of file
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from . import PIPELINE_VERSION
+
+"""
+Content-addressed cache for the results of the full pipeline (symbol boxes, predictions and the rendered equation)
+Results are keyed by a hash of the raw image bytes, the pipeline version and the model file version, so uploading the same
+image again (or rendering the example on the welcome page) returns the stored result without running anything.
+Entries are kept in an in-memory LRU, and in json files in a cache directory that is shared by all processes of the same user.
+The results in the directory are served as they are, so it must not be writable by other users (see check_cache_dir)
+"""
+
+CACHE_DIR_ENV_VAR = 'EQUATION_RESULT_CACHE_DIR'
+
+def model_version(model_file):
+    """
+    Identify the version of a model file by its modification time and size
+    """
+    stat = os.stat(model_file)
+    return '%d-%d' % (stat.st_mtime_ns, stat.st_size)
+
+def make_key(img_bytes, model_file=None, pipeline_version=PIPELINE_VERSION):
+    """
+    The cache key of an image: sha256 of the image bytes, the pipeline version and the model version
+    """
+    h = hashlib.sha256()
+    h.update(bytes(img_bytes))
+    h.update(b'\0pipeline=' + pipeline_version.encode())
+    if model_file is not None:
+        h.update(b'\0model=' + model_version(model_file).encode())
+    return h.hexdigest()
+
+def default_cache_dir():
+    """
+    The per-user cache directory: $XDG_CACHE_HOME/equation_rendering/results, or ~/.cache/equation_rendering/results
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'equation_rendering', 'results')
+
+def check_cache_dir(cache_dir):
+    """
+    Create cache_dir if it does not exist yet (only readable by this user), and make sure that no other user can write to it,
+    since anyone who can write files in it decides the results that are served
+    """
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        #no unix permissions to check (windows)
+        return
+    stat = os.stat(cache_dir)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+        raise ValueError('unsafe result cache directory ' + repr(cache_dir) + ', expected a directory owned by this user that '
+                         'only this user can write to')
+
+def _is_valid_entry(entry):
+    return (isinstance(entry, dict) and isinstance(entry.get('stored_at'), (int, float)) and not isinstance(entry['stored_at'], bool)
+            and isinstance(entry.get('result'), dict))
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError('cannot store %s in the result cache' % type(obj))
+
+
+class ResultCache:
+    """
+    LRU cache in memory, backed by json files on disk, with a time-to-live for each entry
+    #################
+
+    Constructor function:
+        max_entries - maximum number of results kept in memory
+        ttl - time in seconds after which a result is no longer used (None to keep results forever)
+        cache_dir - directory for the json files (None for a memory-only cache). It must not be writable by other users
+        max_disk_entries - maximum number of json files in cache_dir. The oldest files are removed when there are more
+
+    Class methods:
+        get(self, key)
+            return the stored result for key, or None if there is none (or it has expired)
+        put(self, key, result)
+            store a result (a json serializable dictionary; numpy arrays and numbers are converted to lists and python numbers)
+        clear(self)
+            remove all results, from memory and disk
+    """
+    def __init__(self, max_entries=128, ttl=7*24*3600, cache_dir=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._n_puts = 0
+        if cache_dir is not None:
+            check_cache_dir(cache_dir)
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except OSError:
+            return None
+        except ValueError:
+            entry = None
+        if not _is_valid_entry(entry):
+            #a broken or foreign file is a miss, and is removed so it gets replaced by a proper result
+            self._remove_file(self._path(key))
+            return None
+        if self._expired(entry['stored_at']):
+            self._remove_file(self._path(key))
+            return None
+
+        self._put_memory(key, entry['stored_at'], entry['result'])
+        return entry['result']
+
+    def put(self, key, result):
+        #round trip through json, so results from memory and from disk look exactly the same
+        data = json.dumps({'stored_at': time.time(), 'result': result}, default=_json_default)
+        entry = json.loads(data)
+        self._put_memory(key, entry['stored_at'], entry['result'])
+
+        if self.cache_dir is not None:
+            #write to a temporary file first, so other processes never read half a file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+
+            with self._lock:
+                self._n_puts += 1
+                prune = self._n_puts % 100 == 1
+            if prune:
+                self._prune_disk()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    self._remove_file(os.path.join(self.cache_dir, name))
+
+    def _put_memory(self, key, stored_at, result):
+        with self._lock:
+            self._memory[key] = (stored_at, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _prune_disk(self):
+        """
+        Remove expired files, and the oldest files if there are more than max_disk_entries
+        """
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        files.sort()
+
+        n_remove = max(len(files) - self.max_disk_entries, 0)
+        for i, (mtime, path) in enumerate(files):
+            if i < n_remove or self._expired(mtime):
+                self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_result_cache(cache_dir=None, **kwargs):
+    """
+    Return the result cache for this directory, shared by everything that runs in this process
+    If no directory is given, it is read from the EQUATION_RESULT_CACHE_DIR environment variable,
+    or defaults to the per-user cache directory (see default_cache_dir)
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV_VAR) or default_cache_dir()
+    with _caches_lock:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = ResultCache(cache_dir=cache_dir, **kwargs)
+        return _caches[cache_dir]
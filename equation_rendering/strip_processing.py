@@ -0,0 +1,167 @@
+import numpy as np
+import cv2
+
+from .resolve_symbols import count_black_and_white, threshold_image, region_boxes_to_contour_boxes
+
+"""
+Find the symbol boxes on very large images (eg. page scans at 600 dpi) in horizontal strips, so the memory needed for
+thresholding and finding the symbols is bounded by the size of a strip instead of the size of the image
+
+The symbol boxes that resolve_symbols_on_img keeps from findContours are the holes in the white background: the bounding boxes of
+the black regions (4-connected) that do not touch the edge of the image, one pixel wider on each side (see resolve_symbols.component_boxes).
+Here these regions are found with connectedComponentsWithStats in each strip, and regions that continue in the next strip are joined by looking at the two rows
+on either side of the border between the strips. This gives the same boxes as running findContours on the full image
+
+Thresholding only looks at the pixels close by (the 11 pixel adaptive threshold block and the 13x13 blur), so each strip is thresholded
+together with a margin of rows above and below it, which makes the thresholded strip the same as that part of the full thresholded image
+"""
+
+#rows of context needed around a strip to threshold it exactly like the full image: 11//2 for the adaptive threshold + 13//2 for the blur
+THRESHOLD_MARGIN = 16
+
+DEFAULT_STRIP_HEIGHT = 512
+
+def is_black_and_white(img, strip_height=DEFAULT_STRIP_HEIGHT):
+    """
+    Whether more than 90% of the pixels of the whole image are at a perfect black/white, which decides how it is thresholded (see threshold_image)
+    """
+    n_bw = sum(count_black_and_white(img[y0:y0+strip_height]) for y0 in range(0, img.shape[0], strip_height))
+    return n_bw / img.size > 0.9
+
+def iter_thresholded_strips(img, strip_height, black_and_white, margin=THRESHOLD_MARGIN):
+    """
+    Threshold a grayscale image in horizontal strips of strip_height rows
+    black_and_white decides the threshold method for the whole image (see is_black_and_white)
+    Yields for each strip: (first row of the strip, thresholded strip)
+    """
+    img_ysize = img.shape[0]
+    for y0 in range(0, img_ysize, strip_height):
+        y1 = min(y0 + strip_height, img_ysize)
+        m0, m1 = max(y0 - margin, 0), min(y1 + margin, img_ysize)
+        thresh = threshold_image(img[m0:m1], black_and_white=black_and_white)
+        yield y0, thresh[y0-m0:y1-m0]
+
+def _join_components(pairs, n):
+    """
+    Union-find over n components, given the pairs of components that are connected
+    Returns: for each component, the index of the component that represents the group it belongs to
+    """
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    #only components that are in a pair can be part of a larger group
+    for i in {i for pair in pairs for i in pair}:
+        parent[i] = find(i)
+    return parent
+
+def _first_x_on_top_row(labels, stats):
+    """
+    For each region (label 1, 2, ..) in a labeled strip, the column of its first pixel in raster order:
+    the leftmost pixel of the region on the top row of its box. Only the top row of each box is looked at
+    """
+    x1, top, width = stats[1:,0], stats[1:,1], stats[1:,2]
+    #the pixels on the top row of every box, one box after the other
+    seg_starts = np.cumsum(width) - width
+    seg_ids = np.repeat(np.arange(len(width)), width)
+    cols = np.arange(len(seg_ids)) - seg_starts[seg_ids] + x1[seg_ids]
+    is_region = labels[top[seg_ids], cols] == seg_ids + 1
+    #the first pixel of each region on its top row (every region has at least one, and the rows are in order of the regions)
+    match_ids = np.flatnonzero(is_region)
+    match_seg_ids = seg_ids[match_ids]
+    is_first = match_seg_ids != np.concatenate([[-1], match_seg_ids[:-1]])
+    return cols[match_ids[is_first]].astype(np.int64)
+
+def find_boxes_in_strips(img, strip_height=DEFAULT_STRIP_HEIGHT, black_and_white=None, return_fill=False):
+    """
+    Find the boxes of all symbols on a grayscale image, processing it in horizontal strips of strip_height rows
+    black_and_white decides the threshold method, if it is None it is determined with is_black_and_white
+    Returns:
+        1) (n,4) array of box coordinates (x1, y1, x2, y2), in the same order as resolve_symbols.component_boxes gives them for the
+           full image (see region_boxes_to_contour_boxes). Unlike in resolve_symbols_on_img, the boxes are not yet filtered on their size
+        2) the number of connected black regions that were found (joined over the strips)
+        3) only if return_fill=True: for each box, the fraction of the pixels in the box of the region that are black
+    """
+    strip_boxes = []
+    strip_areas = []
+    strip_first_x = []
+    pairs = []
+    n_total = 0
+    prev_last_row = None
+    if black_and_white is None:
+        black_and_white = is_black_and_white(img, strip_height)
+
+    for y0, thresh in iter_thresholded_strips(img, strip_height, black_and_white):
+        #label the black regions, with 4-connectivity like the holes findContours finds in the white background
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(thresh), connectivity=4, ltype=cv2.CV_32S)
+        boxes = stats[1:,:4].astype(np.int64)
+        boxes[:,2:] += boxes[:,:2]
+        boxes[:,[1,3]] += y0
+        strip_boxes.append(boxes)
+        strip_areas.append(stats[1:,cv2.CC_STAT_AREA].astype(np.int64))
+        strip_first_x.append(_first_x_on_top_row(labels, stats))
+
+        #regions that touch on both sides of the border with the previous strip are the same region
+        #labels are turned into global component numbers: label l of this strip is component n_total + l - 1
+        first_row = labels[0].astype(np.int64) + n_total - 1
+        if prev_last_row is not None:
+            is_joined = (prev_last_row >= 0) & (labels[0] > 0)
+            pairs.extend(set(zip(prev_last_row[is_joined].tolist(), first_row[is_joined].tolist())))
+        prev_last_row = np.where(labels[-1] > 0, labels[-1].astype(np.int64) + n_total - 1, -1)
+        n_total += n - 1
+
+    if n_total == 0:
+        if return_fill:
+            return np.zeros((0, 4), dtype=np.int32), 0, np.zeros(0)
+        return np.zeros((0, 4), dtype=np.int32), 0
+
+    #the box of a region that spans several strips is the union of its boxes in each strip
+    boxes = np.concatenate(strip_boxes)
+    group = _join_components(pairs, n_total)
+    is_root = group == np.arange(n_total)
+    x1 = np.full(n_total, np.iinfo(np.int64).max)
+    y1 = x1.copy()
+    x2 = np.zeros(n_total, dtype=np.int64)
+    y2 = x2.copy()
+    np.minimum.at(x1, group, boxes[:,0])
+    np.minimum.at(y1, group, boxes[:,1])
+    np.maximum.at(x2, group, boxes[:,2])
+    np.maximum.at(y2, group, boxes[:,3])
+
+    #the first pixel of a joined region is the first of the first pixels of its parts, in raster order (the order of boxes
+    #with the same top left corner depends on it, like in resolve_symbols.component_boxes)
+    row_size = img.shape[1] + 1
+    first_pixel = np.full(n_total, np.iinfo(np.int64).max)
+    np.minimum.at(first_pixel, group, boxes[:,1] * row_size + np.concatenate(strip_first_x))
+
+    boxes = np.stack([x1, y1, x2, y2], axis=1)[is_root]
+    if not return_fill:
+        return region_boxes_to_contour_boxes(boxes, img.shape, first_x=first_pixel[is_root] % row_size), len(boxes)
+
+    area = np.zeros(n_total, dtype=np.int64)
+    np.add.at(area, group, np.concatenate(strip_areas))
+    fill = area[is_root] / ((boxes[:,2] - boxes[:,0]) * (boxes[:,3] - boxes[:,1]))
+    box_list, index = region_boxes_to_contour_boxes(boxes, img.shape, first_x=first_pixel[is_root] % row_size, return_index=True)
+    return box_list, len(boxes), fill[index]
+
+def crop_thresholded_symbols(img, box_list, black_and_white, margin=THRESHOLD_MARGIN):
+    """
+    Cut the thresholded symbols out of a grayscale image, thresholding only the area around each box (plus a margin)
+    Returns the same crops as cutting the boxes out of the fully thresholded image
+    """
+    img_ysize, img_xsize = img.shape
+    ind_symbols = []
+    for x1, y1, x2, y2 in box_list:
+        m_x1, m_y1 = max(x1 - margin, 0), max(y1 - margin, 0)
+        m_x2, m_y2 = min(x2 + margin, img_xsize), min(y2 + margin, img_ysize)
+        thresh = threshold_image(img[m_y1:m_y2, m_x1:m_x2], black_and_white=black_and_white)
+        ind_symbols.append(thresh[y1-m_y1:y2-m_y1, x1-m_x1:x2-m_x1])
+    return ind_symbols
@@ -0,0 +1,90 @@
+import numpy as np
+import cv2
+
+"""
+Functions to draw the bounding boxes from the preprocessing step on top of the image
+Boxes are color coded: red for base level symbols, blue for stacked symbols, and green for super/subscripts
+matplotlib is only imported when a matplotlib figure is requested
+"""
+
+#colors in opencv's BGR order, and the matching matplotlib colors
+BOX_COLORS = {'r': (0, 0, 255), 'b': (255, 0, 0), 'g': (0, 128, 0)}
+LEGEND_LABELS = [('b', 'Stacked symbols'), ('r', 'Base level symbols'), ('g', 'Super/subscripts')]
+
+def box_color(stack, script_level):
+    """
+    Return the color code of a box, given its stack value and script level
+    """
+    if stack > 0:
+        er = 'b'
+    else:
+        er = 'r'
+
+    if script_level != 0:
+        er = 'g'
+    return er
+
+def plot_symbol_boxes(img, box_list, stacked_list, script_level_list):
+    """
+    Plot the image with the bounding boxes of each symbol, and the index of the symbol, with matplotlib
+    Returns: fig and ax objects
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+
+    fig, ax = plt.subplots()
+    ax.imshow(img, cmap='gray')
+
+    for i, box in enumerate(box_list):
+        x1, y1 = box[0], box[1]
+        x2, y2 = box[2] - box[0], box[3] - box[1]
+
+        er = box_color(stacked_list[i], script_level_list[i])
+        rect = patches.Rectangle((x1, y1), x2, y2, linewidth=1, edgecolor=er, facecolor='none')
+
+        ax.add_patch(rect)
+        ax.text(x1, y1, str(i))
+
+    for er, label in LEGEND_LABELS:
+        ax.plot([], color=er, label=label) #dummies for legend
+    ax.legend(frameon=False)
+    return fig, ax
+
+def draw_symbol_boxes(img, box_list, stacked_list, script_level_list):
+    """
+    Draw the bounding boxes of each symbol, and the index of the symbol, directly onto a copy of the image with opencv
+    A white strip with a legend is added on top of the image
+    Returns: the BGR image array
+    """
+    if img.ndim == 2:
+        canvas = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    else:
+        canvas = img.copy()
+
+    #scale the line width and font size with the image size
+    thickness = max(1, round(max(canvas.shape[:2]) / 600))
+    font_scale = max(0.4, max(canvas.shape[:2]) / 1500)
+
+    for i, box in enumerate(box_list):
+        color = BOX_COLORS[box_color(stacked_list[i], script_level_list[i])]
+        cv2.rectangle(canvas, (int(box[0]), int(box[1])), (int(box[2]), int(box[3])), color, thickness)
+        cv2.putText(canvas, str(i), (int(box[0]), int(box[1]) - 2*thickness), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness)
+
+    #legend
+    (_, text_h), _ = cv2.getTextSize('A', cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    legend = np.full((2*text_h + 4*thickness, canvas.shape[1], 3), 255, dtype=np.uint8)
+    x = text_h
+    for er, label in LEGEND_LABELS:
+        cv2.line(legend, (x, text_h), (x + 2*text_h, text_h), BOX_COLORS[er], thickness)
+        x += 3*text_h
+        cv2.putText(legend, label, (x, int(1.5*text_h)), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness)
+        x += cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)[0][0] + 2*text_h
+
+    return np.vstack([legend, canvas])
+
+def draw_symbol_boxes_png(img, box_list, stacked_list, script_level_list):
+    """
+    Same as draw_symbol_boxes, but returns the image encoded as png bytes (eg. to pass to st.image)
+    """
+    ret, png = cv2.imencode('.png', draw_symbol_boxes(img, box_list, stacked_list, script_level_list))
+    return png.tobytes()
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing as mp
+
+import cv2
+
+from equation_rendering import PIPELINE_VERSION
+from equation_rendering.resolve_symbols import resolve_symbols_on_img, ImageDecodeError
+from equation_rendering.render_equations import render_equation
+from equation_rendering.make_predictions import make_prediction, get_prediction_cache
+from equation_rendering.inference_server import get_inference_server
+from equation_rendering.model_registry import get_class_labels
+from equation_rendering.pipeline_metrics import PipelineMetrics, prometheus_text
+from equation_rendering.result_cache import ResultCache, make_key
+from equation_rendering.config import default_model_file, default_class_file
+
+"""
+HTTP API for the full pipeline, as a plain ASGI application (no web framework needed), next to the streamlit front-end
+Run it with any ASGI server, from the streamlit_app directory, eg.:
+    uvicorn api_server:app --port 8000
+
+Endpoints:
+    POST /predict   the raw bytes of an image file as the request body (eg. curl --data-binary @equation.png localhost:8000/predict)
+                    returns json with the LaTeX string, the symbol boxes, and the top-4 labels and probabilities of each symbol
+                    (an empty equation for an image without symbols), or status 400 if the body is not an image file
+    GET /health     returns {"status": "ok"} once the model is loaded
+    GET /metrics    per-stage timings and counters, in the Prometheus text format
+
+Resolving the symbols runs in a pool of worker processes, and the model predictions of concurrent requests are batched by the inference server
+For local testing without a server, use call_app: call_app(app, 'POST', '/predict', img_bytes)
+"""
+
+#set with the EQUATION_MODEL_FILE and EQUATION_CLASS_FILE environment variables (see equation_rendering/config.py)
+MODEL_FILE = default_model_file()
+CLASS_FILE = default_class_file()
+
+def _init_resolve_worker():
+    #every worker is its own process, so opencv should not start extra threads on top of that
+    cv2.setNumThreads(1)
+
+def _resolve_image(img_bytes, normalize=False):
+    """
+    Resolve the symbols in a worker process, and send the timings back along with the result
+    """
+    metrics = PipelineMetrics()
+    output = resolve_symbols_on_img(img_bytes, plot=False, return_boxes=True, metrics=metrics, normalize=normalize)
+    return output, metrics.as_dict()
+
+
+class EquationAPI:
+    """
+    ASGI application that runs the full pipeline on posted images
+    #################
+
+    Constructor function:
+        model_file, class_file - the model and class labels to use
+        resolve_workers - number of worker processes that resolve symbols
+        max_body_size - requests with a larger body (in bytes) are refused
+        cache_size - number of results to keep in memory, for images that are posted more than once (0 to turn off)
+        normalize - shrink images with large symbols (eg. phone photos) to the working resolution before resolving the symbols,
+            so large uploads take about as long as small ones. The returned boxes are always on the posted image.
+            Off by default: it changes which symbols are found, and its effect on the accuracy is not measured yet
+            (see evaluate_pipeline.py --normalize-parity)
+
+    Class methods:
+        startup(self), shutdown(self)
+            load the model and start the worker pools / stop the worker pools. Called on the ASGI lifespan events,
+            or automatically on the first request if the server doesn't send lifespan events
+        predict(self, img_bytes)
+            coroutine that runs the pipeline on the bytes of an image file, and returns the result dictionary
+    """
+    def __init__(self, model_file=MODEL_FILE, class_file=CLASS_FILE, resolve_workers=None, max_body_size=20*1024*1024, cache_size=256,
+                 normalize=False):
+        self.model_file = model_file
+        self.class_file = class_file
+        self.resolve_workers = resolve_workers or os.cpu_count()
+        self.max_body_size = max_body_size
+        self.normalize = normalize
+        self.result_cache = ResultCache(max_entries=cache_size, cache_dir=None) if cache_size > 0 else None
+
+        self.metrics = PipelineMetrics()
+        self.ready = False
+        self._startup_lock = threading.Lock()
+        self._process_pool = None
+        self._thread_pool = None
+
+    def _load(self):
+        with self._startup_lock:
+            if self.ready:
+                return
+            self._process_pool = ProcessPoolExecutor(max_workers=self.resolve_workers, mp_context=mp.get_context('spawn'),
+                                                     initializer=_init_resolve_worker)
+            self._thread_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='api')
+            self.server = get_inference_server(self.model_file)
+            self.class_labels = get_class_labels(self.class_file)
+            self.prediction_cache = get_prediction_cache(self.model_file)
+            self.ready = True
+
+    async def startup(self):
+        if not self.ready:
+            #loading the model blocks, so it runs outside of the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self._load)
+
+    async def shutdown(self):
+        with self._startup_lock:
+            self.ready = False
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+            if self._thread_pool is not None:
+                self._thread_pool.shutdown(wait=False)
+            self._process_pool, self._thread_pool = None, None
+
+    def _predict_and_render(self, output):
+        symbs, levels, stack, script_levels, extend_list, boxes = output
+        if len(symbs) == 0:
+            #a valid image without any symbols on it (eg. a blank page): there is nothing to classify or render
+            return {'equation': '', 'boxes': [], 'levels': [], 'stack': [], 'script_levels': [], 'extend_list': [], 'symbols': []}
+        pred_symbol_list, pred_dics = make_prediction(symbs, extend_list, self.server, self.class_labels, return_pred_dics=True,
+                                                      metrics=self.metrics, prediction_cache=self.prediction_cache)
+        with self.metrics.stage('render_equation'):
+            eqstr = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+
+        symbols = [{'label': label, 'top_k': {k: float(v) for k, v in sorted(pred_dic.items(), key=lambda kv: -kv[1])}}
+                   for label, pred_dic in zip(pred_symbol_list, pred_dics)]
+        return {'equation': eqstr, 'boxes': boxes.tolist(), 'levels': [int(l) for l in levels], 'stack': [int(s) for s in stack],
+                'script_levels': [int(s) for s in script_levels], 'extend_list': [int(e) for e in extend_list], 'symbols': symbols}
+
+    async def predict(self, img_bytes):
+        await self.startup()
+        loop = asyncio.get_running_loop()
+
+        if self.result_cache is not None:
+            key = make_key(img_bytes, self.model_file, pipeline_version=PIPELINE_VERSION + '/api' + ('/normalized' if self.normalize else ''))
+            result = self.result_cache.get(key)
+            if result is not None:
+                self.metrics.count('result_cache_hits')
+                return result
+
+        output, resolve_metrics = await loop.run_in_executor(self._process_pool, _resolve_image, img_bytes, self.normalize)
+        self.metrics.update(resolve_metrics)
+        #the model call blocks until the inference server has run the batch, so this runs on a thread
+        result = await loop.run_in_executor(self._thread_pool, self._predict_and_render, output)
+
+        if self.result_cache is not None:
+            self.result_cache.put(key, result)
+        return result
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                    await send({'type': 'lifespan.startup.complete'})
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': repr(e)})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope['method'], scope['path']
+
+        if path == '/health' and method == 'GET':
+            status = 200 if self.ready else 503
+            await _send_json(send, status, {'status': 'ok' if self.ready else 'starting', 'pipeline_version': PIPELINE_VERSION})
+        elif path == '/metrics' and method == 'GET':
+            await _send(send, 200, prometheus_text(self.metrics.as_dict()).encode(), b'text/plain; version=0.0.4')
+        elif path == '/predict' and method == 'POST':
+            try:
+                body = await _read_body(receive, self.max_body_size)
+            except _ClientDisconnected:
+                #the upload is incomplete, and there is nobody left to answer
+                self.metrics.count('disconnected_requests')
+                return
+            if body is None:
+                await _send_json(send, 413, {'error': 'image is larger than %d bytes' % self.max_body_size})
+            elif len(body) == 0:
+                await _send_json(send, 400, {'error': 'post the raw bytes of an image file as the request body'})
+            else:
+                try:
+                    with self.metrics.stage('request'):
+                        result = await self.predict(body)
+                except ImageDecodeError as e:
+                    #the body is not an image file, anything else that goes wrong is a server error
+                    self.metrics.count('bad_requests')
+                    await _send_json(send, 400, {'error': str(e)})
+                    return
+                except Exception as e:
+                    self.metrics.count('failed_requests')
+                    await _send_json(send, 500, {'error': repr(e)})
+                    return
+                self.metrics.count('requests')
+                await _send_json(send, 200, result)
+        elif path in ('/health', '/metrics', '/predict'):
+            await _send_json(send, 405, {'error': 'method not allowed'})
+        else:
+            await _send_json(send, 404, {'error': 'not found'})
+
+
+class _ClientDisconnected(Exception):
+    """
+    The client closed the connection while the request body was still coming in
+    """
+
+async def _read_body(receive, max_body_size):
+    """
+    Read the full request body, or return None as soon as it gets bigger than max_body_size
+    Raises _ClientDisconnected if the client goes away before the whole body is in
+    """
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise _ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > max_body_size:
+            return None
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+async def _send(send, status, body, content_type):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _send_json(send, status, data):
+    await _send(send, status, json.dumps(data).encode(), b'application/json')
+
+
+async def call_app_async(app, method, path, body=b''):
+    """
+    Send a single request straight to an ASGI app, without a server
+    Returns: the status code, the response headers (as a dictionary) and the response body
+    """
+    path, _, query_string = path.partition('?')
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'path': path,
+             'query_string': query_string.encode(), 'headers': [(b'content-length', str(len(body)).encode())]}
+    request_messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'status': None, 'headers': {}, 'body': b''}
+
+    async def receive():
+        if request_messages:
+            return request_messages.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {k.decode(): v.decode() for k, v in message['headers']}
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    return response['status'], response['headers'], response['body']
+
+def call_app(app, method, path, body=b''):
+    """
+    Blocking version of call_app_async, for a quick local test:
+        status, headers, body = call_app(app, 'POST', '/predict', open('math_martijn3.jpeg', 'rb').read())
+    """
+    return asyncio.run(call_app_async(app, method, path, body))
+
+
+app = EquationAPI()
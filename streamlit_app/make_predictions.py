@@ -1,36 +0,0 @@
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import smart_resize
-import numpy as np
-
-#Model Prediction step
-
-def make_prediction(symbol_list, extend_list, model, class_labels):
-
-    pred_list = []
-    pred_symbol_list, pred_idx_list = [], []
-    for i, symbol in enumerate(symbol_list):
-
-        rgb_im = np.zeros((symbol.shape[0], symbol.shape[1], 3))
-        for j in range(3):
-            rgb_im[:,:,j] = symbol.astype('uint8')
-        resize_img = smart_resize(rgb_im, (100,100))
-        resize_img = np.expand_dims(resize_img, axis=0)
-        prediction = model.predict(resize_img, verbose=0)
-    
-        pred_dic = {k[6:]:v for v,k in sorted(zip(prediction[0], class_labels))[-4:]}
-        y_classes = prediction.argmax(axis=-1)
-        pred_idx_list.append(y_classes)
-        label = class_labels[y_classes[0]][6:]
-        
-        #check if a symbol extends over multiple adjacent symbols
-        #if it's not a square root, check if the square root is predicted at a lower probability
-        #if so, just use that
-        if extend_list[i] >  1 and label != '\\sqrt':
-            if '\\sqrt' in pred_dic.keys(): 
-                label = '\\sqrt'
-        
-            
-        pred_symbol_list.append(label)
-        pred_list.append(pred_dic)
-    return pred_symbol_list
-
@@ -1,13 +1,12 @@
 import streamlit as st
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import smart_resize
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
 
-from resolve_symbols import resolve_symbols_on_img
-from render_equations import render_equation
-from make_predictions import make_prediction
+from equation_rendering import process_image, default_model_file, default_class_file
+from equation_rendering.symbol_overlay import draw_symbol_boxes_png
+from equation_rendering.make_predictions import get_prediction_cache
+from equation_rendering.pipeline_metrics import metrics_from_env
+from equation_rendering.result_cache import get_result_cache
+from equation_rendering.inference_server import get_inference_server
+from equation_rendering.model_registry import get_class_labels
 
 st.set_page_config(page_title="Try it yourself", page_icon="📈")
 
@@ -21,30 +20,37 @@ st.subheader("Upload an image of a handwritten equation below:")
 
 #user input of an image
 input_img = st.file_uploader(label='bla',type=['png', 'jpg', 'jpeg'], label_visibility='hidden')
+#shrinking full size phone photos to the working resolution first is a lot faster, but it changes which symbols are found and
+#its effect on the accuracy is not measured yet (see evaluate_pipeline.py --normalize-parity), so it is opt-in
+normalize = st.checkbox('Shrink large photos first (faster, experimental)', value=False)
 
-#class labels
-with open('../CNN_model/class_names.txt', 'r') as f:
-    lines = f.readlines()
-class_labels = [label.split(' ')[-1][:-1] for label in lines]
+#class labels (read once per process, see model_registry.py)
+class_labels = get_class_labels(default_class_file())
 
-#load model
-efficientnet_model = tf.keras.models.load_model("../CNN_model/efficientnet_model_lw.h5")
+#load model (shared by all sessions, predictions are batched across sessions)
+efficientnet_model = get_inference_server(default_model_file())
+
+#cache of earlier results, so re-uploading an image does not run the pipeline again
+result_cache = get_result_cache()
 
 #call preprocessing
 if input_img is not None:
 
-    image = Image.open(input_img)
-    image.save("img.png")
-    symbs, levels, stack, script_levels, extend_list, fig, ax = resolve_symbols_on_img("img.png",  plot=True)
-    ax.set_frame_on(False)
-    ax.tick_params(axis='both',which='both',bottom=False, left=False, labelbottom=False, labelleft=False) 
-        
-    pred_symbol_list = make_prediction(symbs, extend_list, efficientnet_model, class_labels)
-    eqstr = render_equation(pred_symbol_list, levels, stack, script_levels, extend_list)
+    #optional per-stage timings, turned on with the EQUATION_PIPELINE_METRICS environment variable
+    metrics = metrics_from_env()
+
+    #decode the upload straight from memory, so concurrent sessions don't share a file on disk
+    img_bytes = input_img.getvalue()
+    #reuse the result if this exact image was rendered before with the same model, and look up symbols that were classified before
+    #(eg. in an earlier upload) instead of passing them to the model
+    img, result = process_image(img_bytes, efficientnet_model, class_labels, model_file=default_model_file(), result_cache=result_cache,
+                                prediction_cache=get_prediction_cache(default_model_file()), metrics=metrics, normalize=normalize)
+    metrics.emit()
+    eqstr = result['eqstr']
 
     st.subheader("Predicted symbols, order, and position:")
 
-    st.pyplot(fig)
+    st.image(draw_symbol_boxes_png(img, result['boxes'], result['stack'], result['script_levels']))
     
     
     st.markdown('<p class="big-font"> Predicted equation: </p>', unsafe_allow_html=True)
@@ -52,3 +58,7 @@ if input_img is not None:
     st.text("Raw string: " +  eqstr.replace(" ",""))
 
     st.write("Rendered in LaTeX:  " r'' + eqstr)
+
+    if metrics.enabled:
+        with st.expander("Pipeline timings"):
+            st.json(metrics.as_dict())
@@ -1,13 +1,4 @@
 import streamlit as st
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import smart_resize
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
-
-from resolve_symbols import resolve_symbols_on_img
-from render_equations import render_equation
-from make_predictions import make_prediction
 
 
 st.set_page_config(